@@ -0,0 +1,224 @@
+import argparse, io, json, platform, statistics, sys, time
+from dataclasses import asdict, dataclass
+from math import cos, pi, sin
+from random import Random
+import profiling
+from gcode import GCodeSettings, generateGCode
+from geometry import GeometrySettigs, transformGeometries
+from readers import extractGeometryDRL, extractGeometryDXF
+
+@dataclass
+class BoardSettings:
+    width: float = 100
+    height: float = 80
+    traces: int = 200
+    pads: int = 400
+    pours: int = 2
+    pour_vertices: int = 200
+    drills: int = 500
+    drill_tools: int = 3
+    seed: int = 0
+
+def generateBoardOutlines(settings: BoardSettings) -> list[list[tuple[float, float]]]:
+    """Generates closed copper outlines (traces, pads and pours) as lists of points"""
+    rng = Random(settings.seed)
+    outlines: list[list[tuple[float, float]]] = []
+
+    def randomPoint(margin: float) -> tuple[float, float]:
+        return (
+            rng.uniform(margin, settings.width - margin),
+            rng.uniform(margin, settings.height - margin)
+        )
+
+    # Traces are L shaped, outlined with their width
+    for _ in range(settings.traces):
+        x, y = randomPoint(10)
+        w = rng.choice([0.25, 0.4, 0.6])
+        lx, ly = rng.uniform(1, 8), rng.uniform(1, 8)
+        outlines.append([
+            (x, y), (x + lx, y), (x + lx, y + ly),
+            (x + lx - w, y + ly), (x + lx - w, y + w), (x, y + w)
+        ])
+
+    # Pads are either rectangles or octagons
+    for _ in range(settings.pads):
+        x, y = randomPoint(2)
+        if rng.random() < 0.5:
+            w, h = rng.uniform(0.6, 2), rng.uniform(0.6, 2)
+            outlines.append([(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
+        else:
+            r = rng.uniform(0.4, 1.2)
+            outlines.append([(x + r * cos(a * pi / 4), y + r * sin(a * pi / 4)) for a in range(8)])
+
+    # Pours are large star shaped polygons with many vertices
+    for _ in range(settings.pours):
+        x, y = randomPoint(settings.height / 4)
+        r = settings.height / 5
+        outlines.append([
+            (
+                x + r * rng.uniform(0.7, 1) * cos(2 * pi * i / settings.pour_vertices),
+                y + r * rng.uniform(0.7, 1) * sin(2 * pi * i / settings.pour_vertices)
+            )
+            for i in range(settings.pour_vertices)
+        ])
+
+    return outlines
+
+def generateDXF(settings: BoardSettings) -> str:
+    import ezdxf
+
+    document = ezdxf.new()
+    modelspace = document.modelspace()
+    for outline in generateBoardOutlines(settings):
+        for i in range(len(outline)):
+            modelspace.add_line(outline[i], outline[(i + 1) % len(outline)])
+
+    stream = io.StringIO()
+    document.write(stream)
+    return stream.getvalue()
+
+def generateDRL(settings: BoardSettings) -> str:
+    rng = Random(settings.seed)
+    lines = ["M48", "; Synthetic drill file", "FMAT,2", "METRIC"]
+    lines += [f"T{t + 1}C{0.6 + 0.2 * t:.3f}" for t in range(settings.drill_tools)]
+    lines += ["%", "G90", "G05"]
+
+    for t in range(settings.drill_tools):
+        lines.append(f"T{t + 1}")
+        for _ in range(settings.drills // settings.drill_tools):
+            lines.append(f"X{rng.uniform(0, settings.width):.3f}Y{rng.uniform(0, settings.height):.3f}")
+
+    lines += ["T0", "M30"]
+    return "\n".join(lines) + "\n"
+
+def runPipeline(extractor, content: str, geometrySettings: GeometrySettigs, gcodeSettings: GCodeSettings):
+    with profiling.stage("read"):
+        files = extractor(io.StringIO(content), "benchmark.gcode", geometrySettings.tolerance)
+
+    for file in files:
+        with profiling.stage("transform"):
+            file.transformedGeometries = transformGeometries(file.originalGeometries, geometrySettings)
+
+        with profiling.stage("gcode"):
+            generateGCode(file.transformedGeometries, gcodeSettings)
+
+def benchmark(extractor, content: str, geometrySettings: GeometrySettigs, gcodeSettings: GCodeSettings, repeat: int) -> dict:
+    runs: list[dict] = []
+
+    # Memory tracing slows everything down, so peaks are measured on a separate run
+    profiling.enable(memory=True)
+    runPipeline(extractor, content, geometrySettings, gcodeSettings)
+    profiling.disable()
+    memoryPeaks = {s.name: s.memoryPeak for s in profiling.stages.values()}
+
+    for _ in range(repeat):
+        profiling.enable()
+        start = time.perf_counter()
+        runPipeline(extractor, content, geometrySettings, gcodeSettings)
+        total = time.perf_counter() - start
+        profiling.disable()
+
+        runs.append({
+            "total": total,
+            "stages": {s.name: asdict(s) for s in profiling.stages.values()},
+            "counters": dict(profiling.counters)
+        })
+
+    stageNames = runs[0]["stages"].keys()
+    return {
+        "total": summarize([r["total"] for r in runs]),
+        "stages": {
+            name: summarize([r["stages"][name]["wallTime"] for r in runs]) | {
+                "calls": runs[0]["stages"][name]["calls"],
+                "memoryPeak": memoryPeaks.get(name, 0)
+            }
+            for name in stageNames
+        },
+        "counters": runs[0]["counters"]
+    }
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values)
+    }
+
+def compare(results: dict, reference: dict, threshold: float) -> list[str]:
+    """Lists every stage whose median time grew by more than threshold (relative) compared to reference"""
+    regressions: list[str] = []
+
+    for job, jobResults in results["jobs"].items():
+        referenceJob = reference["jobs"].get(job)
+        if not referenceJob: continue
+
+        for name, stage in jobResults["stages"].items():
+            if not (referenceStage := referenceJob["stages"].get(name)): continue
+            ratio = stage["median"] / max(referenceStage["median"], 1e-9)
+            if ratio > 1 + threshold:
+                regressions.append(f"{job}/{name}: {referenceStage['median']:.4f}s -> {stage['median']:.4f}s (x{ratio:.2f})")
+
+    return regressions
+
+if __name__ == "__main__":
+    defaults = BoardSettings()
+
+    parser = argparse.ArgumentParser(
+        prog="PCB Engraving Tool Benchmark",
+        description="Generates synthetic boards and times every stage of the processing pipeline"
+    )
+    parser.add_argument("-o", "--output", type=str, help="Write the results as JSON to this file instead of stdout")
+    parser.add_argument("--compare", type=str, help="JSON results of a previous run, exits with an error on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown considered a regression (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times each job is run (default 3)")
+    parser.add_argument("--write-boards", type=str, help="Prefix under which the synthetic DXF and DRL files are saved")
+    parser.add_argument("--inflate", type=float, default=0.2, help="Inflate distance used on the DXF job (default 0.2mm)")
+
+    parser_board = parser.add_argument_group("Board", "Size and content of the synthetic board")
+    for name, value in asdict(defaults).items():
+        parser_board.add_argument(f"--{name.replace('_', '-')}", dest=name, type=type(value), default=value)
+
+    args = parser.parse_args()
+    board = BoardSettings(**{name: getattr(args, name) for name in asdict(defaults)})
+
+    geometrySettings = GeometrySettigs(
+        inflate=args.inflate,
+        mirror_x=False,
+        mirror_y=False,
+        offset_x=None,
+        offset_y=None,
+        tolerance=0.05
+    )
+    gcodeSettings = GCodeSettings(depth=0.15, feed=400, plunge=70, rapid=5, safe=1, spindle=5000)
+
+    dxf = generateDXF(board)
+    drl = generateDRL(board)
+
+    if args.write_boards:
+        with open(args.write_boards + ".dxf", "w") as f: f.write(dxf)
+        with open(args.write_boards + ".drl", "w") as f: f.write(drl)
+
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "board": asdict(board),
+        "jobs": {
+            "dxf": benchmark(extractGeometryDXF, dxf, geometrySettings, gcodeSettings, args.repeat),
+            "drl": benchmark(extractGeometryDRL, drl, geometrySettings, gcodeSettings, args.repeat)
+        }
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"Regression {r}", file=sys.stderr)
+        if regressions: exit(1)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+from array import array
+import os, pickle
+from geometry import Polygon, Vector2D, tolerance
+import profiling
+
+class InflateCache:
+    """Inflated polygons keyed by the fingerprint of the original polygon, the inflate amount and the join style.
+    With maxEntries, the least recently used entries are dropped beyond that many"""
+    path: str | None
+    quantum: float
+    maxEntries: int | None
+    entries: dict[str, array[float]]
+    used: set[str]
+
+    def __init__(self, path: str | None = None, quantum: float = tolerance, maxEntries: int | None = None) -> None:
+        self.path = path
+        self.quantum = quantum
+        self.maxEntries = maxEntries
+        self.entries = {}
+        self.used = set()
+
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                saved = pickle.load(f)
+            if saved.get("quantum") == quantum:
+                self.entries = saved["entries"]
+                self.evict()
+
+    def key(self, polygon: Polygon, amount: float, join: str = "miter") -> str:
+        return f"{polygon.fingerprint(self.quantum)}/{amount!r}/{join}"
+
+    def get(self, key: str) -> Polygon | None:
+        if (coords := self.entries.get(key)) is None:
+            profiling.count("cacheMisses")
+            return None
+
+        profiling.count("cacheHits")
+        self.used.add(key)
+        # Dicts keep their insertion order, entries moved to the end are the most recently used
+        if self.maxEntries is not None: self.entries[key] = self.entries.pop(key)
+        return Polygon([Vector2D(coords[i], coords[i+1]) for i in range(0, len(coords), 2)])
+
+    def put(self, key: str, polygon: Polygon):
+        self.entries[key] = array("d", [c for p in polygon.points for c in (p.x, p.y)])
+        self.used.add(key)
+        self.evict()
+
+    def evict(self):
+        if self.maxEntries is None: return
+        while len(self.entries) > self.maxEntries:
+            key = next(iter(self.entries))
+            del self.entries[key]
+            self.used.discard(key)
+            profiling.count("cacheEvictions")
+
+    def save(self, path: str | None = None):
+        """Writes the entries used since loading, polygons that disappeared from the input are dropped"""
+        path = path or self.path
+        if not path: return
+
+        with open(path, "wb") as f:
+            pickle.dump({
+                "quantum": self.quantum,
+                "entries": {k: v for k, v in self.entries.items() if k in self.used}
+            }, f)
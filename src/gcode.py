@@ -1,6 +1,13 @@
+from __future__ import annotations
 from dataclasses import dataclass
-from typing import Sequence
-from geometry import Geometry, Line, Polygon, Vector2D
+from math import pi
+from typing import TYPE_CHECKING, Iterable, Iterator, Sequence
+import re
+from geometry import Arc, Circle, Geometry, Line, Polygon, Polyline, Vector2D, closedPolyline
+import profiling, progress
+
+if TYPE_CHECKING:
+    from heightmap import Heightmap
 
 @dataclass
 class GCodeSettings:
@@ -10,50 +17,294 @@ class GCodeSettings:
     rapid: float
     safe: float
     spindle: int
+    heightmap: Heightmap | None = None
 
-def generateGCode(geometries: Sequence[Geometry], settings: GCodeSettings):
-    gcode: list[str] = [
+@dataclass
+class DrillSettings:
+    # Depth drilled before retracting to clear chips (G83), drilled in one go (G81) when None
+    peck: float | None = None
+    # Retract to the rapid height (G98) instead of the safe height (G99) between holes
+    retractToRapid: bool = False
+
+@dataclass
+class PanelSettings:
+    columns: int
+    rows: int
+    pitch_x: float
+    pitch_y: float
+
+def gcodeHeader(settings: GCodeSettings) -> list[str]:
+    return [
         "G90",
         f"M3 S{settings.spindle}",
         "",
         f"G0 Z{settings.rapid}"
     ]
 
-    for g in geometries:
-        if isinstance(g, Vector2D):
-            gcode += [
-                f"G0 X{g.x:6.2f} Y{g.y:6.2f}",
-                f"G0 Z{settings.safe}",
-                f"G1 F{settings.plunge} Z-{settings.depth}",
-                f"G0 Z{settings.rapid}",
-                ""
-            ]
-        elif isinstance(g, Line):
-            gcode += [
-                f"G0 X{g.start.x:6.2f} Y{g.start.y:6.2f}",
-                f"G0 Z{settings.safe}",
-                f"G1 F{settings.plunge} Z-{settings.depth}",
-                f"G1 F{settings.feed} X{g.end.x:6.2f} Y{g.end.y:6.2f}",
-                f"G0 Z{settings.rapid}",
-                ""
-            ]
-        elif isinstance(g, Polygon):
+def gcodeFooter() -> list[str]:
+    return ["M5\n"]
+
+def geometryGCode(g: Geometry, settings: GCodeSettings, dx: float = 0, dy: float = 0) -> list[str]:
+    """G-code machining a single geometry, moved by (dx, dy)"""
+    if isinstance(g, Vector2D):
+        return [
+            f"G0 X{g.x + dx:6.2f} Y{g.y + dy:6.2f}",
+            f"G0 Z{settings.safe}",
+            f"G1 F{settings.plunge} Z-{settings.depth}",
+            f"G0 Z{settings.rapid}",
+            ""
+        ]
+
+    if isinstance(g, Line):
+        return [
+            f"G0 X{g.start.x + dx:6.2f} Y{g.start.y + dy:6.2f}",
+            f"G0 Z{settings.safe}",
+            f"G1 F{settings.plunge} Z-{settings.depth}",
+            f"G1 F{settings.feed} X{g.end.x + dx:6.2f} Y{g.end.y + dy:6.2f}",
+            f"G0 Z{settings.rapid}",
+            ""
+        ]
+
+    # Arc ends and centers are written with more decimals, controllers reject arcs whose radius differs at both ends
+    if isinstance(g, Circle):
+        return [
+            f"G0 X{g.center.x + g.radius + dx:.4f} Y{g.center.y + dy:.4f}",
+            f"G0 Z{settings.safe}",
+            f"G1 F{settings.plunge} Z-{settings.depth}",
+            f"G3 F{settings.feed} X{g.center.x + g.radius + dx:.4f} Y{g.center.y + dy:.4f} I{-g.radius:.4f} J0",
+            f"G0 Z{settings.rapid}",
+            ""
+        ]
+
+    if isinstance(g, Arc):
+        start, end = g.startPoint(), g.endPoint()
+        return [
+            f"G0 X{start.x + dx:.4f} Y{start.y + dy:.4f}",
+            f"G0 Z{settings.safe}",
+            f"G1 F{settings.plunge} Z-{settings.depth}",
+            f"G3 F{settings.feed} X{end.x + dx:.4f} Y{end.y + dy:.4f} I{g.center.x - start.x:.4f} J{g.center.y - start.y:.4f}",
+            f"G0 Z{settings.rapid}",
+            ""
+        ]
+
+    if isinstance(g, Polyline):
+        return [
+            f"G0 X{g.points[0].x + dx:6.2f} Y{g.points[0].y + dy:6.2f}",
+            f"G0 Z{settings.safe}",
+            f"G1 F{settings.plunge} Z-{settings.depth}",
+            f"G1 F{settings.feed}"
+        ] + [
+            f"G1 X{p.x + dx:6.2f} Y{p.y + dy:6.2f}"
+            for p in g.points[1:]
+        ] + [
+            f"G0 Z{settings.rapid}",
+            ""
+        ]
+
+    return [
+        f"G0 X{g.points[-1].x + dx:6.2f} Y{g.points[-1].y + dy:6.2f}",
+        f"G0 Z{settings.safe}",
+        f"G1 F{settings.plunge} Z-{settings.depth}",
+        f"G1 F{settings.feed}"
+    ] + [
+        f"G1 X{p.x + dx:6.2f} Y{p.y + dy:6.2f}"
+        for p in g.points
+    ] + [
+        f"G0 Z{settings.rapid}",
+        ""
+    ]
+
+def cutPath(g: Geometry) -> list[Vector2D]:
+    """Points the tool goes through once plunged"""
+    if isinstance(g, Vector2D): return [g]
+    if isinstance(g, Line): return [g.start, g.end]
+    if isinstance(g, Arc): return g.flatten()
+    if isinstance(g, Circle): return closedPolyline(g)
+    if isinstance(g, Polyline): return g.points
+    return g.points[-1:] + g.points
+
+def leveledGCode(geometries: Sequence[Geometry], settings: GCodeSettings, dx: float = 0, dy: float = 0) -> list[str]:
+    """Same as geometryGCode on every geometry, but cuts are split to the heightmap resolution
+    and every point is moved by the probed Z offset, all geometries are corrected at once"""
+    import numpy as np
+    from geometry import packPolylines
+
+    assert settings.heightmap
+    paths = [cutPath(g) for g in geometries]
+    coords, offsets = packPolylines(paths)
+    coords += np.array([dx, dy])
+
+    coords, offsets = settings.heightmap.segment(coords, offsets)
+    z = settings.heightmap.sample(coords[:, 0], coords[:, 1]) - settings.depth
+    coords, z, offsets = coords.tolist(), z.tolist(), offsets.tolist()
+
+    gcode: list[str] = []
+    for i in range(len(paths)):
+        start, end = offsets[i], offsets[i + 1]
+        gcode += [
+            f"G0 X{coords[start][0]:6.2f} Y{coords[start][1]:6.2f}",
+            f"G0 Z{settings.safe}",
+            f"G1 F{settings.plunge} Z{z[start]:.3f}"
+        ]
+
+        if end - start > 1:
+            gcode.append(f"G1 F{settings.feed}")
             gcode += [
-                f"G0 X{g.points[-1].x:6.2f} Y{g.points[-1].y:6.2f}",
-                f"G0 Z{settings.safe}",
-                f"G1 F{settings.plunge} Z-{settings.depth}",
-                f"G1 F{settings.feed}"
+                f"G1 X{coords[j][0]:6.2f} Y{coords[j][1]:6.2f} Z{z[j]:.3f}"
+                for j in range(start + 1, end)
             ]
 
-            for p in g.points:
-                gcode.append(f"G1 X{p.x:6.2f} Y{p.y:6.2f}")
+        gcode += [
+            f"G0 Z{settings.rapid}",
+            ""
+        ]
+
+    return gcode
+
+def geometriesGCode(geometries: Sequence[Geometry], settings: GCodeSettings, dx: float = 0, dy: float = 0) -> list[str]:
+    if settings.heightmap: return leveledGCode(geometries, settings, dx, dy)
+    return [line for g in geometries for line in geometryGCode(g, settings, dx, dy)]
 
+def streamGCode(geometries: Sequence[Geometry], settings: GCodeSettings) -> Iterator[str]:
+    """Lines of generateGCode, produced geometry by geometry (all at once with a heightmap)"""
+    yield from gcodeHeader(settings)
+    with progress.task("gcode", len(geometries)) as task:
+        if settings.heightmap:
+            yield from leveledGCode(geometries, settings)
+            task.advance(len(geometries))
+        else:
+            for g in geometries:
+                yield from geometryGCode(g, settings)
+                task.advance()
+    yield from gcodeFooter()
+
+def generateGCode(geometries: Sequence[Geometry], settings: GCodeSettings):
+    gcode = list(streamGCode(geometries, settings))
+
+    profiling.count("emittedLines", len(gcode))
+    return "\n".join(gcode)
+
+def panelOrder(panel: PanelSettings) -> list[tuple[int, int, bool]]:
+    """Serpentine walk over the copies, every other copy is machined backwards
+    so that each copy starts next to where the previous one finished"""
+    order: list[tuple[int, int, bool]] = []
+
+    for row in range(panel.rows):
+        columns = range(panel.columns) if row % 2 == 0 else reversed(range(panel.columns))
+        for column in columns:
+            order.append((column, row, len(order) % 2 == 1))
+
+    return order
+
+def generatePanelGCode(geometries: Sequence[Geometry], settings: GCodeSettings, panel: PanelSettings):
+    """G-code for panel.columns * panel.rows copies of the same (already processed) geometries"""
+    gcode = gcodeHeader(settings)
+
+    with progress.task("gcode", panel.columns * panel.rows) as task:
+        for column, row, backwards in panelOrder(panel):
+            gcode.append(f"; Copy {column + 1}x{row + 1}")
+            gcode += geometriesGCode(
+                geometries[::-1] if backwards else geometries,
+                settings,
+                column * panel.pitch_x,
+                row * panel.pitch_y
+            )
+            task.advance()
+
+    gcode += gcodeFooter()
+
+    profiling.count("emittedLines", len(gcode))
+    return "\n".join(gcode)
+
+def drillGCode(holes: Sequence[Vector2D], settings: GCodeSettings, drill: DrillSettings) -> list[str]:
+    """Canned drilling cycle going through every hole, only the coordinates are repeated for each hole"""
+    if not holes: return []
+
+    cycle = f"G83 Q{drill.peck}" if drill.peck else "G81"
+    depths = [-settings.depth] * len(holes)
+    if settings.heightmap:
+        import numpy as np
+        coords = np.array([(h.x, h.y) for h in holes])
+        depths = (settings.heightmap.sample(coords[:, 0], coords[:, 1]) - settings.depth).tolist()
+
+    gcode = [
+        f"{'G98' if drill.retractToRapid else 'G99'} {cycle} X{holes[0].x:6.2f} Y{holes[0].y:6.2f} Z{depths[0]:.3f} R{settings.safe} F{settings.plunge}"
+    ]
+    for i in range(1, len(holes)):
+        z = f" Z{depths[i]:.3f}" if depths[i] != depths[i - 1] else ""
+        gcode.append(f"X{holes[i].x:6.2f} Y{holes[i].y:6.2f}{z}")
+
+    return gcode + ["G80", f"G0 Z{settings.rapid}", ""]
+
+def generateDrillGCode(
+    tools: Sequence[tuple[float, Sequence[Vector2D]]],
+    settings: GCodeSettings,
+    drill: DrillSettings,
+    panel: PanelSettings | None = None
+):
+    """Drilling G-code using canned cycles for (diameter, holes) pairs, with several tools the file
+    changes tools from the smallest to the largest diameter"""
+    gcode = gcodeHeader(settings)
+    toolChanges = len(tools) > 1
+
+    for number, (diameter, holes) in enumerate(sorted(tools, key=lambda t: t[0]), 1):
+        if panel:
+            holes = [
+                Vector2D(h.x + column * panel.pitch_x, h.y + row * panel.pitch_y)
+                for column, row, backwards in panelOrder(panel)
+                for h in (holes[::-1] if backwards else holes)
+            ]
+
+        if toolChanges:
             gcode += [
+                f"; Tool {number}: {diameter}mm",
+                "M5",
                 f"G0 Z{settings.rapid}",
-                ""
+                f"T{number} M6",
+                f"M3 S{settings.spindle}"
             ]
+        gcode += drillGCode(holes, settings, drill)
 
-    gcode.append("M5\n")
+    gcode += gcodeFooter()
 
+    profiling.count("emittedLines", len(gcode))
     return "\n".join(gcode)
 
+@dataclass
+class Move:
+    rapid: bool
+    start: Vector2D
+    end: Vector2D
+    z: float
+
+def parseToolpath(gcode: Iterable[str], arcTolerance: float = 0.005) -> Iterator[Move]:
+    """Yields the XY moves described by G0/G1/G2/G3 lines, keeps track of modal motion and coordinates.
+    Arcs (given with I and J) are split in straight moves no further than arcTolerance from them"""
+    motion = 0
+    x = y = z = 0.0
+
+    for line in gcode:
+        line = line.split(";")[0].upper()
+        words = dict(re.findall(r"([GXYZIJ])\s*(-?\d*\.?\d+)", line))
+        if not words: continue
+
+        for g in re.findall(r"G\s*0*(\d+)", line):
+            if g in ("0", "1", "2", "3"): motion = int(g)
+
+        nx, ny = float(words.get("X", x)), float(words.get("Y", y))
+        z = float(words.get("Z", z))
+
+        if motion in (2, 3) and ("I" in words or "J" in words):
+            center = Vector2D(x + float(words.get("I", 0)), y + float(words.get("J", 0)))
+            startAngle = (Vector2D(x, y) - center).angle() * 180 / pi
+            endAngle = (Vector2D(nx, ny) - center).angle() * 180 / pi
+            # Clockwise arcs are flattened counter clockwise from their end, then walked backwards
+            arc = Arc(center, center.distanceTo(Vector2D(x, y)), *((startAngle, endAngle) if motion == 3 else (endAngle, startAngle)))
+            points = arc.flatten(arcTolerance)
+            points = points if motion == 3 else points[::-1]
+            points[0], points[-1] = Vector2D(x, y), Vector2D(nx, ny)
+            for start, end in zip(points, points[1:]):
+                yield Move(False, start, end, z)
+        elif nx != x or ny != y:
+            yield Move(motion == 0, Vector2D(x, y), Vector2D(nx, ny), z)
+        x, y = nx, ny
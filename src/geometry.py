@@ -1,9 +1,17 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
 from array import array
-from math import cos, pi, sin, sqrt, atan
-from typing import Literal, Sequence
+from hashlib import blake2b
+from math import acos, atan, atan2, ceil, cos, floor, pi, sin, sqrt
+from typing import TYPE_CHECKING, Iterator, Literal, Sequence
+import numpy as np
+import profiling, progress
 
+if TYPE_CHECKING:
+    from cache import InflateCache
+
+
+JoinStyle = Literal["miter", "round", "square", "bevel"]
 
 nearZero = 1e-10
 tolerance = 1e-4
@@ -49,7 +57,8 @@ class Vector2D:
         return hash(self.x.__hash__() + self.y.__hash__())
 
     def offset(self, offset: Vector2D):
-        self += offset
+        self.x += offset.x
+        self.y += offset.y
 
     def mirror(self, axis: Literal["x", "y"]):
         if axis == "x": self.x *= -1
@@ -102,8 +111,8 @@ class Line:
         return self.end - self.start
 
     def offset(self, offset: Vector2D):
-        self.start += offset
-        self.end += offset
+        self.start.offset(offset)
+        self.end.offset(offset)
 
     def mirror(self, axis: Literal["x", "y"]):
         if axis == "x":
@@ -119,16 +128,24 @@ class Line:
         projectionVector = Vector2D(projectionVector.y, -projectionVector.x)
         return nearZero_precise(abs((point - self.start).dot(projectionVector)))
 
+    def pointOnSegment(self, point: Vector2D) -> bool:
+        """pointOnLine, between the ends of the line"""
+        length = self.length()
+        if nearZero_precise(length): return nearZero_precise(point.distanceTo(self.start))
+        along = (point - self.start).dot(self.vector()) / length
+        return self.pointOnLine(point) and -nearZero < along < length + nearZero
+
     def intersects(self, other: Line, rejectIntersectionsEnds: bool = False) -> Vector2D | None:
         selfVect = self.vector()
         otherVect = other.vector()
 
         derterminent = selfVect.cross(otherVect)
         if nearZero_precise(derterminent):
-            if self.pointOnLine(other.start): return other.start
-            if self.pointOnLine(other.end): return other.end
-            if other.pointOnLine(self.start): return self.start
-            if other.pointOnLine(self.end): return self.end
+            # Parallel lines only meet where they overlap
+            if self.pointOnSegment(other.start): return other.start
+            if self.pointOnSegment(other.end): return other.end
+            if other.pointOnSegment(self.start): return self.start
+            if other.pointOnSegment(self.end): return self.end
             return
 
         coefficientVector = Vector2D(
@@ -171,8 +188,8 @@ class Polygon:
     bounds: Polygon | None = None
 
     def offset(self, offset: Vector2D):
-        for i in range(len(self.points)):
-            self.points[i] += offset
+        for p in self.points:
+            p.offset(offset)
 
     def mirror(self, axis: Literal["x", "y"]):
         if axis == "x":
@@ -214,6 +231,14 @@ class Polygon:
             perimeter += self.points[i-1].distanceTo(self.points[i])
         return perimeter
 
+    def fingerprint(self, quantum: float = tolerance) -> str:
+        """Hash of the coordinates snapped to quantum, independent of which vertex the polygon starts at"""
+        quantized = [(round(p.x / quantum), round(p.y / quantum)) for p in self.points]
+        if quantized:
+            start = quantized.index(min(quantized))
+            quantized = quantized[start:] + quantized[:start]
+        return blake2b(array("q", [c for q in quantized for c in q]).tobytes(), digest_size=16).hexdigest()
+
     def longestDiagonal(self) -> float:
         return max([
             p1.distanceTo(p2)
@@ -222,13 +247,8 @@ class Polygon:
         ])
 
     def removeSmallSegments(self) -> Polygon:
-        newPolygon = Polygon([])
-
-        for i in range(len(self.points)):
-            if self.points[i-1].distanceTo(self.points[i]) > tolerance:
-                newPolygon.points.append(self.points[i])
-
-        return newPolygon
+        cleaned = cleanupPolygons([self], removeDuplicates=False)
+        return cleaned[0] if cleaned else Polygon([])
 
     def breakAppart(self) -> list[Line]:
         return [
@@ -236,74 +256,123 @@ class Polygon:
             for i in range(len(self.points))
         ]
 
-    def inflate(self, amount: float, attempts: int = 3) -> Polygon:
-        self.calculate_normals()
-        lines = self.breakAppart()
-        oldPerimeter = self.perimeter()
-
-        newLines = [
-            Line(
-                line.start + self.edgeNormals[i-1] * amount,
-                line.end   + self.edgeNormals[i-1] * amount,
-            ) for i, line in enumerate(lines)
+    def signedArea(self) -> float:
+        """Positive when the points go counter clockwise"""
+        area = 0
+        for i in range(len(self.points)):
+            area += self.points[i-1].cross(self.points[i])
+        return area / 2
+
+    def offsetLoops(self, amount: float, join: JoinStyle | Sequence[JoinStyle] = "miter", miterLimit: float = 2, arcTolerance: float = 0.005) -> list[Polygon]:
+        """Every boundary of the polygon grown by amount (shrunk if negative), outer boundaries go the same way as
+        this polygon and holes the opposite way. join is either one style or one per point.
+        Nothing is retried and this polygon isn't modified"""
+        # Vertices closer than the arcs are flattened give edges without a meaningful direction, whose joins
+        # cancel each other instead of going around the vertex
+        if not self.points: return []
+        coords, offsets = packPolylines([self.points])
+        distinct = np.flatnonzero(mergeCloseVertices(coords, offsets, min(arcTolerance, abs(amount) / 2))).tolist()
+        points = [(self.points[i].x, self.points[i].y) for i in distinct]
+        if not isinstance(join, str): join = [join[i] for i in distinct]
+        area = self.signedArea()
+        if len(points) < 3 or nearZero_precise(area): return []
+        # No disk larger than the polygon's area fits in it, shrinking by its radius leaves nothing (and would
+        # only make the corner arcs overlap each other)
+        if amount < 0 and pi * amount * amount >= abs(area): return []
+        if area < 0:
+            points.reverse()
+            if not isinstance(join, str): join = join[::-1]
+
+        loops = offsetLoops(points, amount, join, miterLimit, arcTolerance)
+        return [
+            Polygon([Vector2D(x, y) for x, y in (loop if area > 0 else loop[::-1])])
+            for loop in loops
         ]
 
-        for i in range(len(newLines)):
-            lineVect = newLines[i].end - newLines[i].start
-            lineVect /= lineVect.modulus()
+    def inflate(self, amount: float, join: JoinStyle | Sequence[JoinStyle] = "miter") -> Polygon:
+        """Outer boundary of the polygon grown by amount (shrunk if negative), see offsetLoops"""
+        loops = self.offsetLoops(amount, join)
+        if not loops: return Polygon([])
+        return max(loops, key=lambda p: abs(p.signedArea())).removeSmallSegments()
+
+@dataclass
+class Polyline:
+    """Open chain of points, cut in order without lifting the tool"""
+    points: list[Vector2D]
 
-            if (d := self.vertexNormals[i-1].dot(lineVect)) < 0:
-                newLines[i].start += lineVect * d * amount
+    def offset(self, offset: Vector2D):
+        for p in self.points:
+            p.offset(offset)
 
-            if (d := self.vertexNormals[i].dot(lineVect)) > 0:
-                newLines[i].end += lineVect * d * amount
+    def mirror(self, axis: Literal["x", "y"]):
+        for p in self.points:
+            if axis == "x": p.x *= -1
+            else: p.y *= -1
 
-        index = 0
-        while index < len(newLines):
-            p1 = newLines[index - 1].end
-            p2 = newLines[index].start
-            if p1.distanceTo(p2) < tolerance:
-                mid = (p1 + p2) / 2
-                newLines[index - 1].end = mid
-                newLines[index].start = mid
-            else:
-                newLines.insert(index, Line(p1, p2))
-            index += 1
+    def length(self) -> float:
+        return sum(self.points[i-1].distanceTo(self.points[i]) for i in range(1, len(self.points)))
 
-        # import graphics
-        # graphics.plotLinesRainbow(newLines)
+@dataclass
+class Arc:
+    """Arc going counter clockwise from startAngle to endAngle (in degrees), like DXF arcs"""
+    center: Vector2D
+    radius: float
+    startAngle: float
+    endAngle: float
+
+    def sweep(self) -> float:
+        """Angle covered by the arc in degrees, arcs starting and ending at the same angle are full turns"""
+        sweep = (self.endAngle - self.startAngle) % 360
+        return sweep if sweep > nearZero else 360
+
+    def pointAt(self, degrees: float) -> Vector2D:
+        return Vector2D(
+            self.center.x + self.radius * cos(degrees * pi / 180),
+            self.center.y + self.radius * sin(degrees * pi / 180)
+        )
+
+    def startPoint(self) -> Vector2D:
+        return self.pointAt(self.startAngle)
 
-        intersections = list(sweepingLineIntersection(newLines))
-        # Sorting such that intersectionsbetween the closest and furthest vertext come earlier
-        intersections.sort(key=lambda i: i.between[1], reverse=True)
-        intersections.sort(key=lambda i: i.between[0])
+    def endPoint(self) -> Vector2D:
+        return self.pointAt(self.endAngle)
 
+    def flatten(self, arcTolerance: float = 0.005) -> list[Vector2D]:
+        """Polyline no further than arcTolerance from the arc, both ends included"""
+        sweep = self.sweep()
+        step = 2 * acos(max(-1, 1 - arcTolerance / self.radius)) * 180 / pi if arcTolerance < self.radius else 90
+        steps = max(ceil(sweep / step), 1)
+        return [self.pointAt(self.startAngle + sweep * k / steps) for k in range(steps + 1)]
 
-        minimumIndex = 0
-        severedLines = []
-        for i in intersections:
-            # graphics.ax.scatter(i.point.x, i.point.y, color="yellow")
+    def offset(self, offset: Vector2D):
+        self.center.offset(offset)
 
-            if i.between[0] < minimumIndex: continue
+    def mirror(self, axis: Literal["x", "y"]):
+        # Mirroring reverses the direction, so the ends swap
+        self.center.mirror(axis)
+        if axis == "x":
+            self.startAngle, self.endAngle = 180 - self.endAngle, 180 - self.startAngle
+        else:
+            self.startAngle, self.endAngle = -self.endAngle, -self.startAngle
 
-            newLines[i.between[0]].end = i.point
-            newLines[i.between[1]].start = i.point
-            minimumIndex = i.between[1]
-            severedLines += newLines[i.between[0] + 1 : i.between[1]]
+@dataclass
+class Circle:
+    center: Vector2D
+    radius: float
 
-        for severee in severedLines:
-            newLines.remove(severee)
+    def flatten(self, arcTolerance: float = 0.005) -> list[Vector2D]:
+        """Closed polyline (without the first point repeated) no further than arcTolerance from the circle"""
+        return Arc(self.center, self.radius, 0, 360).flatten(arcTolerance)[:-1]
 
-        newPolygon = Polygon([line.start for line in newLines]).removeSmallSegments()
+    def offset(self, offset: Vector2D):
+        self.center.offset(offset)
 
-        # If the new inflated polygon is far smaller than the previous one
-        # because most of it was culled and only "inside an interception" was kept
-        # try again but with the starting point shifted a little
-        if attempts and newPolygon.perimeter() < oldPerimeter * 0.7:
-            self.points = self.points[2:] + self.points[:2]
-            return self.inflate(amount, attempts-1)
+    def mirror(self, axis: Literal["x", "y"]):
+        self.center.mirror(axis)
 
-        return newPolygon
+    def inflate(self, amount: float) -> Circle:
+        """Exact offset, circles shrunk past their center end up with a null radius"""
+        return Circle(Vector2D(self.center.x, self.center.y), max(self.radius + amount, 0))
 
 class PixelMap:
     origin: Vector2D
@@ -396,7 +465,179 @@ class PixelMap:
     def indexToCoords(self, index: int) -> tuple[int, int]:
         return (index % self.xlen, index // self.xlen)
 
-Geometry =  Polygon | Line | Vector2D
+class SparsePixelMap:
+    """PixelMap indexed the same way, stored in square tiles of tileSize pixels: a tile holding a single value is
+    kept as that value, and only tiles given different values are allocated. Fine resolutions then cost memory
+    near the boundaries of what's drawn only"""
+    origin: Vector2D
+    xspan: float
+    yspan: float
+    xlen: int
+    ylen: int
+    tileSize: int
+    uniform: np.ndarray
+    tiles: dict[tuple[int, int], np.ndarray]
+
+    def __init__(self, boundBottomLeft: Vector2D, boundTopRight: Vector2D, numberSidePixels: int = 200, tileSize: int = 32, fill: int = 0) -> None:
+        self.origin = boundBottomLeft
+        self.xspan = boundTopRight.x - boundBottomLeft.x
+        self.yspan = boundTopRight.y - boundBottomLeft.y
+
+        quantum = min(self.xspan, self.yspan) / numberSidePixels
+
+        self.xlen = int(self.xspan / quantum)
+        self.ylen = int(self.yspan / quantum)
+
+        self.tileSize = tileSize
+        self.uniform = np.full((ceil(self.ylen / tileSize), ceil(self.xlen / tileSize)), fill, dtype=np.uint32)
+        self.tiles = {}
+
+    def __len__(self) -> int:
+        return self.xlen * self.ylen
+
+    def coords(self, key: int | tuple[int, int] | Vector2D) -> tuple[int, int]:
+        if isinstance(key, int): return self.indexToCoords(key)
+        if isinstance(key, tuple):
+            if not list(map(type, key)) == [int, int]:
+                raise Exception("Accessing pixmaps can only be done using indices (int), pair or indicies (int, int), or a point (Vector2D)")
+            return key
+        return self.indexToCoords(self.vectorToIndex(key))
+
+    def __getitem__(self, key: int | tuple[int, int] | Vector2D) -> int:
+        x, y = self.coords(key)
+        tile = self.tiles.get((x // self.tileSize, y // self.tileSize))
+        if tile is None: return int(self.uniform[y // self.tileSize, x // self.tileSize])
+        return int(tile[y % self.tileSize, x % self.tileSize])
+
+    def __setitem__(self, key: int | tuple[int, int] | Vector2D, value: int):
+        x, y = self.coords(key)
+        tx, ty = x // self.tileSize, y // self.tileSize
+        if (tx, ty) not in self.tiles:
+            if self.uniform[ty, tx] == value: return
+            self.refine(tx, ty)
+        self.tiles[tx, ty][y % self.tileSize, x % self.tileSize] = value
+
+    def __iter__(self):
+        for y in range(self.ylen):
+            for x in range(self.xlen):
+                yield self[x, y]
+
+    def __repr__(self) -> str:
+        return f"SparsePixelMap=(origin={self.origin},xspan={self.xspan},yspan={self.yspan},xlen={self.xlen},ylen={self.ylen},refinedTiles={len(self.tiles)}/{self.uniform.size})"
+
+    def vectorToIndex(self, point: Vector2D) -> int:
+        xIndex = int((point.x - self.origin.x) / self.xspan * self.xlen)
+        yIndex = int((point.y - self.origin.y) / self.yspan * self.ylen)
+        return yIndex * self.xlen + xIndex
+
+    def coordsToIndex(self, x: int, y: int) -> int:
+        return y * self.xlen + x
+
+    def indexToVector(self, index: int) -> Vector2D:
+        x, y = self.indexToCoords(index)
+        return Vector2D(self.origin.x + x / self.xlen * self.xspan, self.origin.y + y / self.ylen * self.yspan)
+
+    def indexToCoords(self, index: int) -> tuple[int, int]:
+        return (index % self.xlen, index // self.xlen)
+
+    def tileBounds(self, tx: int, ty: int) -> tuple[Vector2D, Vector2D]:
+        """Position of the first pixel of the tile and of the one after its last"""
+        return (
+            self.indexToVector(self.coordsToIndex(tx * self.tileSize, ty * self.tileSize)),
+            Vector2D(
+                self.origin.x + (tx + 1) * self.tileSize / self.xlen * self.xspan,
+                self.origin.y + (ty + 1) * self.tileSize / self.ylen * self.yspan
+            )
+        )
+
+    def refine(self, tx: int, ty: int) -> np.ndarray:
+        """Allocates the pixels of a tile, set to its uniform value"""
+        if (tx, ty) not in self.tiles:
+            self.tiles[tx, ty] = np.full((self.tileSize, self.tileSize), self.uniform[ty, tx], dtype=np.uint32)
+        return self.tiles[tx, ty]
+
+    def fillTile(self, tx: int, ty: int, value: int):
+        self.tiles.pop((tx, ty), None)
+        self.uniform[ty, tx] = value
+
+    def compact(self):
+        """Turns the allocated tiles whose pixels all hold the same value back into uniform tiles"""
+        for (tx, ty), tile in list(self.tiles.items()):
+            if (tile == tile[0, 0]).all(): self.fillTile(tx, ty, int(tile[0, 0]))
+
+    def toDense(self) -> np.ndarray:
+        """(ylen, xlen) array of every pixel"""
+        dense = np.repeat(np.repeat(self.uniform, self.tileSize, axis=0), self.tileSize, axis=1)
+        for (tx, ty), tile in self.tiles.items():
+            dense[ty * self.tileSize:(ty + 1) * self.tileSize, tx * self.tileSize:(tx + 1) * self.tileSize] = tile
+        return dense[:self.ylen, :self.xlen]
+
+def nearestPoints(queries: np.ndarray, points: np.ndarray, chunkSize: int = 1 << 22) -> tuple[np.ndarray, np.ndarray]:
+    """Index of and distance to the nearest of the (m, 2) points for every one of the (n, 2) queries, by brute force
+    in chunks of about chunkSize distances"""
+    indices = np.empty(len(queries), dtype=np.int64)
+    distances = np.empty(len(queries))
+    step = max(chunkSize // max(len(points), 1), 1)
+
+    for start in range(0, len(queries), step):
+        chunk = queries[start:start + step]
+        squared = ((chunk[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+        nearest = squared.argmin(axis=1)
+        indices[start:start + step] = nearest
+        distances[start:start + step] = np.sqrt(squared[np.arange(len(chunk)), nearest])
+
+    return indices, distances
+
+def voronoiPixelMap(points: np.ndarray, labels: np.ndarray, boundBottomLeft: Vector2D, boundTopRight: Vector2D, numberSidePixels: int = 200, tileSize: int = 32) -> SparsePixelMap:
+    """Label of the nearest of the (n, 2) points at every pixel, computed over a quadtree of blocks of pixels.
+    The nearest point of any pixel of a block is no further from the block center than the farthest corner's
+    nearest point plus the block diagonal, so only the points that close are candidates. A block whose candidates
+    all have the same label is filled with it, others are split in four, down to a few pixels computed one by one.
+    Tiles of the map end up allocated where labels meet only"""
+    with profiling.stage("voronoiPixelMap"):
+        pixmap = SparsePixelMap(boundBottomLeft, boundTopRight, numberSidePixels, tileSize)
+        pixelX, pixelY = pixmap.xspan / pixmap.xlen, pixmap.yspan / pixmap.ylen
+        origin = np.array([pixmap.origin.x, pixmap.origin.y])
+
+        def block(x0: int, y0: int, x1: int, y1: int, candidates: np.ndarray, target: np.ndarray | None, tx: int, ty: int):
+            """Labels pixels [x0, x1) x [y0, y1), which are in tile (tx, ty), target being its pixels once refined"""
+            low, high = origin + (x0 * pixelX, y0 * pixelY), origin + (x1 * pixelX, y1 * pixelY)
+            corners = np.array([low, (high[0], low[1]), (low[0], high[1]), high])
+            _, distances = nearestPoints(corners, points[candidates])
+            reach = distances.max() + np.hypot(*(high - low))
+            candidates = candidates[((points[candidates] - (low + high) / 2) ** 2).sum(axis=1) <= reach * reach]
+
+            blockLabels = labels[candidates]
+            if (blockLabels == blockLabels[0]).all():
+                if target is None: pixmap.fillTile(tx, ty, int(blockLabels[0]))
+                else: target[y0 - ty * tileSize:y1 - ty * tileSize, x0 - tx * tileSize:x1 - tx * tileSize] = blockLabels[0]
+                return
+
+            if target is None: target = pixmap.refine(tx, ty)
+            profiling.count("voronoiBlocks")
+            if x1 - x0 <= 8 and y1 - y0 <= 8:
+                xs = origin[0] + (np.arange(x0, x1) + 0.5) * pixelX
+                ys = origin[1] + (np.arange(y0, y1) + 0.5) * pixelY
+                closest, _ = nearestPoints(np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2), points[candidates])
+                target[y0 - ty * tileSize:y1 - ty * tileSize, x0 - tx * tileSize:x1 - tx * tileSize] = blockLabels[closest].reshape(y1 - y0, x1 - x0)
+                return
+
+            xm, ym = (x0 + x1 + 1) // 2, (y0 + y1 + 1) // 2
+            for bx0, bx1 in ((x0, xm), (xm, x1)):
+                for by0, by1 in ((y0, ym), (ym, y1)):
+                    if bx1 > bx0 and by1 > by0: block(bx0, by0, bx1, by1, candidates, target, tx, ty)
+
+        everything = np.arange(len(points))
+        tilesY, tilesX = pixmap.uniform.shape
+        with progress.task("voronoi", tilesY * tilesX) as task:
+            for ty in range(tilesY):
+                for tx in range(tilesX):
+                    block(tx * tileSize, ty * tileSize, min((tx + 1) * tileSize, pixmap.xlen), min((ty + 1) * tileSize, pixmap.ylen), everything, None, tx, ty)
+                    task.advance()
+
+    return pixmap
+
+Geometry =  Polygon | Line | Vector2D | Arc | Circle | Polyline
 
 @dataclass
 class Intersection:
@@ -411,24 +652,26 @@ class Intersection:
 
 class LerpLine:
     start: Vector2D
+    end: Vector2D
     direction: Vector2D
-    step: float
-    t: float = 0
+    count: int
+    index: int = 0
 
     def __init__(self, line: Line, step: float) -> None:
         self.start = line.start
+        self.end = line.end
         self.direction = line.vector()
-        self.step = step / line.length()
-        pass
+        self.count = max(ceil(line.length() / step), 1)
 
     def __iter__(self) -> LerpLine:
-        self.t = 0
+        self.index = 0
         return self
 
     def __next__(self) -> Vector2D:
-        if self.t > 1: raise StopIteration 
-        newPoint = self.start + self.direction * self.t
-        self.t += self.step
+        if self.index > self.count: raise StopIteration
+        # Computing t from the index avoids accumulating errors and gives exact ends
+        newPoint = self.end if self.index == self.count else self.start + self.direction * (self.index / self.count)
+        self.index += 1
         return newPoint
 
 @dataclass
@@ -439,68 +682,704 @@ class GeometrySettigs:
     offset_x: float | None
     offset_y: float | None
     tolerance: float
+    rotate: float | None = None
+    scale: float | None = None
+    join: JoinStyle = "miter"
+
+    def affineTransform(self) -> AffineTransform:
+        """Mirror, scale, rotation (degrees, around the origin) and offset composed in that order"""
+        transform = AffineTransform.scaling(
+            -1 if self.mirror_x else 1,
+            -1 if self.mirror_y else 1
+        )
+        if self.scale is not None:
+            transform = AffineTransform.scaling(self.scale, self.scale) @ transform
+        if self.rotate:
+            transform = AffineTransform.rotation(self.rotate) @ transform
+        if self.offset_x or self.offset_y:
+            transform = AffineTransform.translation(self.offset_x or 0, self.offset_y or 0) @ transform
+        return transform
 
+@dataclass
+class AffineTransform:
+    """x' = a*x + b*y + c, y' = d*x + e*y + f"""
+    a: float = 1
+    b: float = 0
+    c: float = 0
+    d: float = 0
+    e: float = 1
+    f: float = 0
+
+    @staticmethod
+    def translation(x: float, y: float) -> AffineTransform:
+        return AffineTransform(c=x, f=y)
+
+    @staticmethod
+    def scaling(x: float, y: float) -> AffineTransform:
+        return AffineTransform(a=x, e=y)
+
+    @staticmethod
+    def rotation(degrees: float) -> AffineTransform:
+        angle = degrees * pi / 180
+        return AffineTransform(a=cos(angle), b=-sin(angle), d=sin(angle), e=cos(angle))
+
+    def __matmul__(self, other: AffineTransform) -> AffineTransform:
+        """Composition, other is applied first"""
+        return AffineTransform(
+            self.a * other.a + self.b * other.d,
+            self.a * other.b + self.b * other.e,
+            self.a * other.c + self.b * other.f + self.c,
+            self.d * other.a + self.e * other.d,
+            self.d * other.b + self.e * other.e,
+            self.d * other.c + self.e * other.f + self.f
+        )
 
-def transformGeometries(geometries: Sequence[Geometry], settings: GeometrySettigs) -> Sequence[Geometry]: 
+    def isIdentity(self) -> bool:
+        return self == AffineTransform()
+
+    def determinant(self) -> float:
+        return self.a * self.e - self.b * self.d
+
+    def apply(self, coords: np.ndarray) -> np.ndarray:
+        """Transforms an (n, 2) array of coordinates"""
+        matrix = np.array([[self.a, self.d], [self.b, self.e]])
+        return coords @ matrix + np.array([self.c, self.f])
+
+def packGeometries(geometries: Sequence[Geometry]) -> np.ndarray:
+    """All the coordinates of geometries in a single (n, 2) array, in order"""
+    count = sum(
+        1 if isinstance(g, Vector2D) else 2 if isinstance(g, (Line, Circle)) else 4 if isinstance(g, Arc) else len(g.points)
+        for g in geometries
+    )
+
+    def coordinates():
+        for g in geometries:
+            if isinstance(g, Vector2D):
+                yield g.x; yield g.y
+            elif isinstance(g, Line):
+                yield g.start.x; yield g.start.y
+                yield g.end.x; yield g.end.y
+            elif isinstance(g, Circle):
+                # The center and a point on the circle
+                yield g.center.x; yield g.center.y
+                yield g.center.x + g.radius; yield g.center.y
+            elif isinstance(g, Arc):
+                # The center, both ends and the middle of the arc, which tells the direction once transformed
+                yield g.center.x; yield g.center.y
+                for p in (g.startPoint(), g.pointAt(g.startAngle + g.sweep() / 2), g.endPoint()):
+                    yield p.x; yield p.y
+            else:
+                for p in g.points:
+                    yield p.x; yield p.y
+
+    return np.fromiter(coordinates(), dtype=np.float64, count=count * 2).reshape(-1, 2)
+
+def unpackGeometry(g: Geometry, values: Iterator[list[float]]) -> Geometry:
+    """New geometry shaped like g out of the next coordinates of values, laid out like packGeometries"""
+    if isinstance(g, Vector2D):
+        return Vector2D(*next(values))
+    if isinstance(g, Line):
+        return Line(Vector2D(*next(values)), Vector2D(*next(values)))
+    if isinstance(g, Circle):
+        center, point = Vector2D(*next(values)), Vector2D(*next(values))
+        return Circle(center, center.distanceTo(point))
+    if isinstance(g, Arc):
+        center, start, middle, end = (Vector2D(*next(values)) for _ in range(4))
+        startAngle, endAngle = (start - center).angle() * 180 / pi, (end - center).angle() * 180 / pi
+        if (middle - start).cross(end - middle) < 0: startAngle, endAngle = endAngle, startAngle
+        return Arc(center, center.distanceTo(start), startAngle, endAngle)
+    points = [Vector2D(*next(values)) for _ in g.points]
+    return Polyline(points) if isinstance(g, Polyline) else Polygon(points)
+
+def unpackGeometries(geometries: Sequence[Geometry], coords: np.ndarray) -> list[Geometry]:
+    """Rebuilds new geometries shaped like geometries out of coordinates laid out like packGeometries"""
+    values = iter(coords.tolist())
+    return [unpackGeometry(g, values) for g in geometries]
+
+
+def inflatePolygon(polygon: Polygon, amount: float, cache: InflateCache | None = None, join: JoinStyle = "miter") -> Polygon:
+    if cache is None: return polygon.inflate(amount, join)
+
+    key = cache.key(polygon, amount, join)
+    if (inflated := cache.get(key)) is None:
+        inflated = polygon.inflate(amount, join)
+        cache.put(key, inflated)
+    return inflated
+
+def mergeClosePoints(points: Sequence[Vector2D], distance: float) -> list[Vector2D]:
+    """Drops every point closer than distance to a point kept before it, neighbours are found with a spatial hash
+    of cells as large as distance, so only the 9 cells around each point are looked at"""
+    if distance <= 0: return list(points)
+    cells: dict[tuple[int, int], list[Vector2D]] = {}
+    kept: list[Vector2D] = []
+
+    for p in points:
+        cx, cy = floor(p.x / distance), floor(p.y / distance)
+        if any(
+            p.distanceTo(q) < distance
+            for x in (cx - 1, cx, cx + 1) for y in (cy - 1, cy, cy + 1)
+            for q in cells.get((x, y), [])
+        ): continue
+        cells.setdefault((cx, cy), []).append(p)
+        kept.append(p)
+
+    return kept
+
+def closedPolyline(g: Polygon | Circle) -> list[Vector2D]:
+    """Vertices of a closed geometry with the first one repeated at the end, circles are flattened"""
+    points = g.flatten() if isinstance(g, Circle) else g.points
+    return points + points[:1]
+
+def packPolylines(pointLists: Sequence[Sequence[Vector2D]], close: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """Packs lists of points in a single (n, 2) array, returns it along with the offset of each list
+    (list i spans offsets[i]:offsets[i+1]), closed lists repeat their first point at the end"""
+    lengths = np.fromiter((len(pl) + (close and len(pl) > 0) for pl in pointLists), dtype=np.int64, count=len(pointLists))
+    offsets = np.zeros(len(pointLists) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    coords = np.fromiter(
+        (c for pl in pointLists for p in (list(pl) + list(pl[:1]) if close else pl) for c in (p.x, p.y)),
+        dtype=np.float64,
+        count=int(offsets[-1]) * 2
+    ).reshape(-1, 2)
+
+    return coords, offsets
+
+def compactOffsets(keep: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Offsets of packed lists once only the points where keep is True remain"""
+    return np.concatenate(([0], np.cumsum(keep)))[offsets]
+
+def cyclicNeighbours(offsets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Index of the previous and next point of every point of packed closed lists"""
+    count = int(offsets[-1])
+    starts = np.repeat(offsets[:-1], np.diff(offsets))
+    ends = np.repeat(offsets[1:], np.diff(offsets))
+    indices = np.arange(count)
+    previous = np.where(indices == starts, ends - 1, indices - 1)
+    next = np.where(indices == ends - 1, starts, indices + 1)
+    return previous, next
+
+def mergeCloseVertices(coords: np.ndarray, offsets: np.ndarray, distance: float) -> np.ndarray:
+    """Mask of the points to keep so that no two consecutive points of the packed closed lists are closer than distance"""
+    previous, _ = cyclicNeighbours(offsets)
+    short = np.linalg.norm(coords - coords[previous], axis=1) < distance
+    keep = ~short
+    if not short.any(): return keep
+
+    # Only lists holding short segments need to be walked, comparing each point to the last one kept
+    values = coords.tolist()
+    for i in np.flatnonzero(np.add.reduceat(short, offsets[:-1])).tolist():
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        # Walking from a point far enough from its predecessor makes the result independent of the starting point
+        anchors = np.flatnonzero(~short[start:end])
+        anchor = start + (int(anchors[0]) if len(anchors) else 0)
+        kept = [anchor]
+        for j in [*range(anchor + 1, end), *range(start, anchor)]:
+            dx, dy = values[j][0] - values[kept[-1]][0], values[j][1] - values[kept[-1]][1]
+            if dx * dx + dy * dy >= distance * distance: kept.append(j)
+
+        while len(kept) > 1:
+            dx, dy = values[kept[0]][0] - values[kept[-1]][0], values[kept[0]][1] - values[kept[-1]][1]
+            if dx * dx + dy * dy >= distance * distance: break
+            kept.pop()
+
+        keep[start:end] = False
+        keep[kept] = True
+
+    return keep
+
+def collinearVertices(coords: np.ndarray, offsets: np.ndarray, distance: float = tolerance) -> np.ndarray:
+    """Mask of the points to drop because they lie less than distance away from the segment joining the points kept
+    around them (going the same way), so that no dropped point ends up further than distance from the result"""
+    previous, next = cyclicNeighbours(offsets)
+    incoming = coords - coords[previous]
+    outgoing = coords[next] - coords
+    chord = np.linalg.norm(coords[next] - coords[previous], axis=1)
+    cross = np.abs(incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0])
+    dot = (incoming * outgoing).sum(axis=1)
+    candidates = (chord > 0) & (cross < distance * np.maximum(chord, nearZero)) & (dot > 0)
+    drop = np.zeros(len(coords), dtype=bool)
+    if not candidates.any(): return drop
+
+    def deviation(point: list[float], start: list[float], end: list[float]) -> float:
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        length = sqrt(dx * dx + dy * dy)
+        if length < nearZero: return float("inf")
+        return abs((point[0] - start[0]) * dy - (point[1] - start[1]) * dx) / length
+
+    # Neighbouring candidates are only dropped together if they all stay close to the segment joining the kept points
+    values = coords.tolist()
+    for i in np.flatnonzero(np.add.reduceat(candidates, offsets[:-1])).tolist():
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        # Smooth loops (flattened arcs) have nothing but candidates, they're walked from their first point
+        anchors = np.flatnonzero(~candidates[start:end])
+        anchor = start + (int(anchors[0]) if len(anchors) else 0)
+        order = [*range(anchor, end), *range(start, anchor)]
+
+        kept = anchor
+        pending: list[int] = []
+        for k in range(1, len(order)):
+            j, following = order[k], order[(k + 1) % len(order)]
+            forward = (values[j][0] - values[kept][0]) * (values[following][0] - values[j][0]) + \
+                      (values[j][1] - values[kept][1]) * (values[following][1] - values[j][1]) > 0
+            if candidates[j] and forward and all(
+                deviation(values[m], values[kept], values[following]) < distance
+                for m in pending + [j]
+            ):
+                pending.append(j)
+            else:
+                kept = j
+                pending = []
+                continue
+            drop[j] = True
+
+    return drop
+
+def cleanupPolygons(polygons: Sequence[Polygon], mergeDistance: float = tolerance, removeDuplicates: bool = True) -> list[Polygon]:
+    """Merges vertices closer than mergeDistance, drops collinear vertices and polygons left with less than 3 vertices,
+    and (if removeDuplicates) keeps a single copy of polygons identical once snapped to mergeDistance"""
+    polygons = [p for p in polygons if p.points]
+    if not polygons: return []
+
+    coords, offsets = packPolylines([p.points for p in polygons])
+    keep = mergeCloseVertices(coords, offsets, mergeDistance)
+    coords, offsets = coords[keep], compactOffsets(keep, offsets)
+
+    # Lists with less than 3 points would lose everything to the collinear test
+    keep = ~collinearVertices(coords, offsets) | np.repeat(np.diff(offsets) < 3, np.diff(offsets))
+    coords, offsets = coords[keep], compactOffsets(keep, offsets)
+
+    values = coords.tolist()
+    offsets = offsets.tolist()
+    cleaned: list[Polygon] = []
+    fingerprints: set[str] = set()
+
+    for i in range(len(polygons)):
+        if offsets[i + 1] - offsets[i] < 3: continue
+        polygon = Polygon([Vector2D(x, y) for x, y in values[offsets[i]:offsets[i + 1]]])
+
+        if removeDuplicates:
+            fingerprint = polygon.fingerprint(mergeDistance)
+            if fingerprint in fingerprints: continue
+            fingerprints.add(fingerprint)
+
+        cleaned.append(polygon)
+
+    return cleaned
+
+def subdividePolylines(coords: np.ndarray, offsets: np.ndarray, maxLength: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Splits the segments of the packed polylines evenly so that none is longer than maxLength.
+    Returns the new coordinates, offsets, and for every new point the index of the point it was interpolated towards.
+    Original points are kept exactly, polylines must not be empty"""
+    if len(coords) < 2:
+        return coords, offsets, np.arange(len(coords))
+
+    lengths = np.linalg.norm(coords[1:] - coords[:-1], axis=1)
+
+    # Point i gets the points of the segment ending on it, first points of polylines only get themselves
+    pointCounts = np.ones(len(coords), dtype=np.int64)
+    pointCounts[1:] = np.maximum(np.ceil(lengths / maxLength), 1)
+    isFirst = np.zeros(len(coords), dtype=bool)
+    isFirst[offsets[:-1]] = True
+    pointCounts[isFirst] = 1
+
+    source = np.repeat(np.arange(len(coords)), pointCounts)
+    ends = np.cumsum(pointCounts)
+    step = np.arange(len(source)) - np.repeat(ends - pointCounts, pointCounts) + 1
+    t = step / np.repeat(pointCounts, pointCounts)
+
+    previous = np.where(isFirst[source], source, source - 1)
+    newCoords = coords[previous] + (coords[source] - coords[previous]) * t[:, None]
+    # Not relying on the interpolation for the original points, t == 1 is exact but a + (b - a) isn't
+    newCoords[ends - 1] = coords
+
+    newOffsets = np.concatenate(([0], ends[offsets[1:] - 1]))
+    return newCoords, newOffsets, source
+
+def transformGeometries(geometries: Sequence[Geometry], settings: GeometrySettigs, cache: InflateCache | None = None) -> Sequence[Geometry]: 
     newGeometries = [g for g in geometries]
 
     if settings.inflate is not None:
-        newGeometries = [
-            g.inflate(settings.inflate)
-            for g in newGeometries if isinstance(g, Polygon)
-        ] + [
-            g for g in newGeometries if not isinstance(g, Polygon)
+        polygons = [g for g in newGeometries if isinstance(g, Polygon)]
+        circles = [g for g in newGeometries if isinstance(g, Circle)]
+        with profiling.stage("inflate"), progress.task("inflate", len(polygons) + len(circles)) as task:
+            inflated: list[Geometry] = []
+            for g in polygons:
+                # Polygons shrunk away entirely are dropped, like circles
+                if (p := inflatePolygon(g, settings.inflate, cache, settings.join)).points: inflated.append(p)
+                task.advance()
+            inflated += [c for g in circles if (c := g.inflate(settings.inflate)).radius > 0]
+            task.advance(len(circles))
+        newGeometries = inflated + [
+            g for g in newGeometries if not isinstance(g, (Polygon, Circle))
         ]
 
-    if settings.mirror_x:
-        for g in newGeometries:
-            g.mirror("x")
-
-    if settings.mirror_y:
-        for g in newGeometries:
-            g.mirror("y")
-
-    if settings.offset_x or settings.offset_y:
-        for g in newGeometries:
-            offset = Vector2D(
-                settings.offset_x or 0,
-                settings.offset_y or 0
-            )
-            g.offset(offset)
+    transform = settings.affineTransform()
+    if not transform.isIdentity():
+        with profiling.stage("affine"):
+            newGeometries = unpackGeometries(newGeometries, transform.apply(packGeometries(newGeometries)))
 
     return newGeometries
 
-def sweepingLineIntersection(lines: Sequence[Line]) -> set[Intersection]:
-    class SweepedLine(LineWithIndex):
-        checkedAgainst: set[int] = set()
+def offsetCurve(points: list[tuple[float, float]], amount: float, join: JoinStyle | Sequence[JoinStyle], miterLimit: float, arcTolerance: float) -> list[tuple[float, float]]:
+    """Raw offset of a counter clockwise loop: every edge moved along its outward normal, joined around the corners
+    they move away from and by a backward arc around the original vertex where they overlap (whose winding numbers
+    are then sorted out by offsetLoops)"""
+    n = len(points)
+    normals: list[tuple[float, float]] = []
+    for i in range(n):
+        (x0, y0), (x1, y1) = points[i], points[(i+1) % n]
+        length = sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2)
+        normals.append(((y1 - y0) / length, (x0 - x1) / length))
+
+    roundStep = 2 * acos(max(-1, 1 - arcTolerance / abs(amount))) if arcTolerance < abs(amount) else pi / 2
+    curve: list[tuple[float, float]] = []
+
+    for i in range(n):
+        px, py = points[i]
+        corner = join if isinstance(join, str) else join[i]
+        (n0x, n0y), (n1x, n1y) = normals[i-1], normals[i]
+        a = (px + n0x * amount, py + n0y * amount)
+        b = (px + n1x * amount, py + n1y * amount)
+        turn = (n0x * n1y - n0y * n1x) * amount
+        cosine = n0x * n1x + n0y * n1y
+        curve.append(a)
+
+        if nearZero_precise(turn) and cosine < 0:
+            if corner == "bevel":
+                curve.append((px, py))
+            else:
+                # The edge folds back on itself, the offset goes around the tip: half a circle through the point
+                # amount away from it, along the incoming edge
+                start = atan2(a[1] - py, a[0] - px)
+                sweep = pi if amount > 0 else -pi
+                steps = ceil(pi / roundStep)
+                curve += [
+                    (px + abs(amount) * cos(start + sweep * k / steps), py + abs(amount) * sin(start + sweep * k / steps))
+                    for k in range(1, steps)
+                ]
+        elif turn < -nearZero or (turn > nearZero and corner == "round"):
+            # Round joins, and arcs going backwards where the offset edges overlap: the winding numbers only
+            # describe the offset when every point within amount of a vertex is wound around
+            start = atan2(a[1] - py, a[0] - px)
+            sweep = atan2(n0x * n1y - n0y * n1x, cosine)
+            steps = ceil(abs(sweep) / roundStep)
+            curve += [
+                (px + abs(amount) * cos(start + sweep * k / steps), py + abs(amount) * sin(start + sweep * k / steps))
+                for k in range(1, steps)
+            ]
+        elif turn > nearZero:
+            miterRatio = sqrt(2 / max(1 + cosine, nearZero))
+            if corner == "miter" and miterRatio <= miterLimit:
+                scale = amount / (1 + cosine)
+                curve.append((px + (n0x + n1x) * scale, py + (n0y + n1y) * scale))
+            elif corner != "bevel":
+                # Squaring the corner off, miter joins at their limit and square joins at the offset distance
+                distance = abs(amount) * (miterLimit if corner == "miter" else 1)
+                sign = 1 if amount > 0 else -1
+                wx, wy = (n0x + n1x) * sign, (n0y + n1y) * sign
+                wl = sqrt(wx * wx + wy * wy)
+                wx, wy = (wx / wl, wy / wl) if wl > nearZero else (-n0y, n0x)
+                along0 = (distance - abs(amount) * (n0x * wx + n0y * wy) * sign) / max(-n0y * wx + n0x * wy, nearZero)
+                along1 = (distance - abs(amount) * (n1x * wx + n1y * wy) * sign) / max(n1y * wx - n1x * wy, nearZero)
+                curve.append((a[0] - n0y * along0, a[1] + n0x * along0))
+                curve.append((b[0] + n1y * along1, b[1] - n1x * along1))
+
+        curve.append(b)
+
+    # Dropping zero length segments
+    cleaned = [p for i, p in enumerate(curve) if abs(p[0] - curve[i-1][0]) > nearZero or abs(p[1] - curve[i-1][1]) > nearZero]
+    return cleaned or curve[:1]
+
+def segmentIntersections(xs: np.ndarray, ys: np.ndarray, offsets: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Intersections between the non adjacent segments of the closed loop (xs, ys), or of the packed closed loops
+    spanning offsets, segment i goes from point i to the next point of its loop.
+    Candidate pairs come from a uniform grid, returns the segment indices and the parameters along both segments"""
+    n = len(xs)
+    _, following = cyclicNeighbours(np.array([0, n]) if offsets is None else offsets)
+    x0, y0 = xs, ys
+    x1, y1 = xs[following], ys[following]
+    minX, maxX = np.minimum(x0, x1), np.maximum(x0, x1)
+    minY, maxY = np.minimum(y0, y1), np.maximum(y0, y1)
+
+    extent = max(float(maxX.max() - minX.min()), float(maxY.max() - minY.min()), nearZero)
+    cellSize = max(extent / max(sqrt(n), 1), float(np.median(np.maximum(maxX - minX, maxY - minY))))
+    cellsX0 = ((minX - minX.min()) / cellSize).astype(np.int64).tolist()
+    cellsX1 = ((maxX - minX.min()) / cellSize).astype(np.int64).tolist()
+    cellsY0 = ((minY - minY.min()) / cellSize).astype(np.int64).tolist()
+    cellsY1 = ((maxY - minY.min()) / cellSize).astype(np.int64).tolist()
+
+    grid: dict[tuple[int, int], list[int]] = {}
+    for i in range(n):
+        for cx in range(cellsX0[i], cellsX1[i] + 1):
+            for cy in range(cellsY0[i], cellsY1[i] + 1):
+                grid.setdefault((cx, cy), []).append(i)
+
+    pairs: set[tuple[int, int]] = set()
+    for cell in grid.values():
+        for k, i in enumerate(cell):
+            for j in cell[k+1:]:
+                pairs.add((i, j))
+
+    profiling.count("intersectionTests", len(pairs))
+    empty = np.array([], dtype=np.int64)
+    if not pairs: return empty, empty, np.array([]), np.array([])
+
+    I, J = np.array(list(pairs), dtype=np.int64).T
+    I, J = np.minimum(I, J), np.maximum(I, J)
+    adjacent = (following[I] == J) | (following[J] == I)
+    overlapping = (minX[I] <= maxX[J]) & (minX[J] <= maxX[I]) & (minY[I] <= maxY[J]) & (minY[J] <= maxY[I])
+    I, J = I[~adjacent & overlapping], J[~adjacent & overlapping]
+
+    dxI, dyI = x1[I] - x0[I], y1[I] - y0[I]
+    dxJ, dyJ = x1[J] - x0[J], y1[J] - y0[J]
+    determinant = dxI * dyJ - dyI * dxJ
+    valid = np.abs(determinant) > nearZero
+    determinant = np.where(valid, determinant, 1)
+    ox, oy = x0[J] - x0[I], y0[J] - y0[I]
+    tI = (ox * dyJ - oy * dxJ) / determinant
+    tJ = (ox * dyI - oy * dxI) / determinant
+
+    hit = valid & (tI >= 0) & (tI <= 1) & (tJ >= 0) & (tJ <= 1)
+    return I[hit], J[hit], tI[hit], tJ[hit]
+
+def windingNumbers(xs: np.ndarray, ys: np.ndarray, queries: np.ndarray, chunkSize: int = 256, offsets: np.ndarray | None = None) -> np.ndarray:
+    """Winding number of the closed loop (xs, ys), or the sum of those of the packed closed loops spanning offsets,
+    around every query point. Only the edges spanning the height of a query count, so edges are bucketed in
+    horizontal bands and queries are only tested against the edges of their band"""
+    _, following = cyclicNeighbours(np.array([0, len(xs)]) if offsets is None else offsets)
+    windings = np.zeros(len(queries), dtype=np.int64)
+    if not len(queries) or not len(xs): return windings
+
+    bandCount = max(int(sqrt(len(xs) / 16)), 1)
+    low = float(ys.min())
+    height = (float(ys.max()) - low) / bandCount or 1
+    firstBand = np.clip(((np.minimum(ys, ys[following]) - low) // height).astype(np.int64), 0, bandCount - 1)
+    lastBand = np.clip(((np.maximum(ys, ys[following]) - low) // height).astype(np.int64), 0, bandCount - 1)
+    counts = lastBand - firstBand + 1
+    edges = np.repeat(np.arange(len(xs)), counts)
+    bands = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + firstBand[edges]
+    edges = edges[np.argsort(bands, kind="stable")]
+    bandStarts = np.searchsorted(np.sort(bands), np.arange(bandCount + 1))
+
+    queryBands = np.clip(((queries[:, 1] - low) // height).astype(np.int64), 0, bandCount - 1)
+    byBand = np.argsort(queryBands, kind="stable")
+    queryStarts = np.searchsorted(queryBands[byBand], np.arange(bandCount + 1))
+
+    for band in range(bandCount):
+        bandEdges = edges[bandStarts[band]:bandStarts[band + 1]]
+        bandQueries = byBand[queryStarts[band]:queryStarts[band + 1]]
+        if not len(bandEdges) or not len(bandQueries): continue
+        x0, y0 = xs[bandEdges][None, :], ys[bandEdges][None, :]
+        x1, y1 = xs[following[bandEdges]][None, :], ys[following[bandEdges]][None, :]
+
+        for start in range(0, len(bandQueries), chunkSize):
+            chunk = bandQueries[start:start + chunkSize]
+            qx, qy = queries[chunk, 0:1], queries[chunk, 1:2]
+            isLeft = (x1 - x0) * (qy - y0) - (qx - x0) * (y1 - y0)
+            upward = (y0 <= qy) & (y1 > qy) & (isLeft > 0)
+            downward = (y0 > qy) & (y1 <= qy) & (isLeft < 0)
+            windings[chunk] = upward.sum(axis=1) - downward.sum(axis=1)
+
+    return windings
+
+def nearLoops(queries: np.ndarray, coords: np.ndarray, offsets: np.ndarray, distance: float) -> np.ndarray:
+    """Whether every query point is closer than distance to a segment of the packed closed loops spanning offsets.
+    Segments are bucketed in cells as large as distance, every cell they come within distance of, so only the segments
+    of the cell holding a point are measured"""
+    _, following = cyclicNeighbours(offsets)
+    starts, ends = coords, coords[following]
+    low = np.floor((np.minimum(starts, ends) - distance) / distance).astype(np.int64)
+    high = np.floor((np.maximum(starts, ends) + distance) / distance).astype(np.int64)
+    widths = high[:, 0] - low[:, 0] + 1
+    counts = widths * (high[:, 1] - low[:, 1] + 1)
+    segments = np.repeat(np.arange(len(starts)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    keys = (low[segments, 0] + k % widths[segments]) * (1 << 32) + low[segments, 1] + k // widths[segments]
+    order = np.argsort(keys, kind="stable")
+    keys, segments = keys[order], segments[order]
+
+    cells = np.floor(queries / distance).astype(np.int64)
+    queryKeys = cells[:, 0] * (1 << 32) + cells[:, 1]
+    first, last = np.searchsorted(keys, queryKeys, "left"), np.searchsorted(keys, queryKeys, "right")
+    counts = last - first
+    owners = np.repeat(np.arange(len(queries)), counts)
+    pairs = segments[np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+
+    p, a, ab = queries[owners], starts[pairs], ends[pairs] - starts[pairs]
+    t = np.clip(((p - a) * ab).sum(axis=1) / np.maximum((ab * ab).sum(axis=1), nearZero), 0, 1)
+    squared = ((a + ab * t[:, None] - p) ** 2).sum(axis=1)
+    near = np.zeros(len(queries), dtype=bool)
+    near[owners[squared < distance * distance]] = True
+    return near
+
+def offsetLoops(points: list[tuple[float, float]], amount: float, join: JoinStyle | Sequence[JoinStyle] = "miter", miterLimit: float = 2, arcTolerance: float = 0.005) -> list[list[tuple[float, float]]]:
+    """Boundaries of a counter clockwise loop offset by amount, see boundaryLoops"""
+    if nearZero_precise(amount): return [points]
+
+    curve = offsetCurve(points, amount, join, miterLimit, arcTolerance)
+    if len(curve) < 3: return []
+    result = boundaryLoops([curve])
+    return result if amount > 0 else dropSpuriousLoops(result, [points], amount, arcTolerance)
+
+def offsetRegion(loops: Sequence[list[tuple[float, float]]], amount: float, join: JoinStyle = "round", miterLimit: float = 2, arcTolerance: float = 0.005) -> list[list[tuple[float, float]]]:
+    """Boundaries of the region enclosed by loops (counter clockwise outer boundaries and clockwise holes, which may
+    overlap) offset by amount, every loop is offset on its own and they are sorted out together. Offsetting the result
+    again by b with round joins gives the same region as a single offset by amount + b (within arcTolerance)"""
+    if nearZero_precise(amount): return [list(loop) for loop in loops]
+
+    curves = [offsetCurve(loop, amount, join, miterLimit, arcTolerance) for loop in loops if len(loop) >= 3]
+    curves = [curve for curve in curves if len(curve) >= 3]
+    result = boundaryLoops(curves) if curves else []
+    return result if amount > 0 else dropSpuriousLoops(result, loops, amount, arcTolerance)
+
+def dropSpuriousLoops(result: list[list[tuple[float, float]]], loops: Sequence[list[tuple[float, float]]], amount: float, arcTolerance: float) -> list[list[tuple[float, float]]]:
+    """Loops of a negative offset of loops that really bound its inside. Where the region is narrower than twice the
+    amount, the arcs around neighbouring convex corners can still wind around a few points (or around more than the
+    region itself once amount is past its size), loops of these are closer than amount to the region all along or
+    reach out of it, real ones only come that close along the chords of flattened arcs"""
+    loops = [loop for loop in loops if len(loop) >= 3]
+    if not result or not loops: return []
+    coords, offsets = packPolylines([[Vector2D(x, y) for x, y in loop] for loop in loops])
+    resultCoords = np.array([p for loop in result for p in loop])
+    resultOffsets = np.cumsum([0] + [len(loop) for loop in result])
+    # Shrinking by less than the arcs are flattened, real loops may come that close anywhere
+    if -amount > arcTolerance: near = nearLoops(resultCoords, coords, offsets, -amount - arcTolerance)
+    else: near = np.zeros(len(resultCoords), dtype=bool)
+    outside = windingNumbers(coords[:, 0].copy(), coords[:, 1].copy(), resultCoords, offsets=offsets) <= 0
+    spurious = np.minimum.reduceat(near, resultOffsets[:-1]) | np.maximum.reduceat(outside, resultOffsets[:-1])
+    return [loop for loop, drop in zip(result, spurious.tolist()) if not drop]
+
+def boundaryLoops(curves: Sequence[list[tuple[float, float]]]) -> list[list[tuple[float, float]]]:
+    """Loops bounding what the closed raw offset curves wind around: the curves are split where they cross themselves
+    or each other and only the pieces with a positive winding number on their left and none on their right are kept"""
+    points = [p for curve in curves for p in curve]
+    offsets = np.cumsum([0] + [len(curve) for curve in curves])
+    _, following = cyclicNeighbours(offsets)
+    nexts = following.tolist()
+    xs, ys = np.array(points).T
+
+    with profiling.stage("intersect"):
+        I, J, tI, tJ = segmentIntersections(xs, ys, offsets)
+
+    # Intersections closer than the snapping distance are the same node, vertices touched by a crossing become nodes
+    extent = max(float(xs.max() - xs.min()), float(ys.max() - ys.min()), 1)
+    snap = extent * 1e-9
+    nodes: dict[tuple[int, int], int] = {}
+    nodePoints: list[tuple[float, float]] = []
+    vertexNodes: dict[int, int] = {}
+    splits: dict[int, list[tuple[float, int]]] = {}
+
+    def node(x: float, y: float) -> int:
+        key = (round(x / snap), round(y / snap))
+        if key not in nodes:
+            nodes[key] = len(nodePoints)
+            nodePoints.append((x, y))
+        return nodes[key]
+
+    for i, j, ti, tj in zip(I.tolist(), J.tolist(), tI.tolist(), tJ.tolist()):
+        x, y = points[i][0] + (points[nexts[i]][0] - points[i][0]) * ti, points[i][1] + (points[nexts[i]][1] - points[i][1]) * ti
+        id = node(x, y)
+        for segment, t in ((i, ti), (j, tj)):
+            if t < 1e-12: vertexNodes[segment] = id
+            elif t > 1 - 1e-12: vertexNodes[nexts[segment]] = id
+            else: splits.setdefault(segment, []).append((t, id))
+
+    # Splitting every curve, with the intersections inserted as (x, y, node or -1), in runs going from a node to the
+    # next one, curves without nodes are a single run
+    runs: list[list[tuple[float, float, int]]] = []
+    for c in range(len(curves)):
+        vertices: list[tuple[float, float, int]] = []
+        for i in range(int(offsets[c]), int(offsets[c + 1])):
+            x, y = points[i]
+            vertices.append((x, y, vertexNodes.get(i, -1)))
+            nx, ny = points[nexts[i]]
+            for t, id in sorted(splits.get(i, [])):
+                vertices.append((x + (nx - x) * t, y + (ny - y) * t, id))
+
+        nodeIndices = [k for k, v in enumerate(vertices) if v[2] >= 0]
+        if not nodeIndices:
+            runs.append(vertices + vertices[:1])
+            continue
+
+        rotated = vertices[nodeIndices[0]:] + vertices[:nodeIndices[0]] + vertices[nodeIndices[0]:nodeIndices[0]+1]
+        current = [rotated[0]]
+        for v in rotated[1:]:
+            current.append(v)
+            if v[2] >= 0:
+                runs.append(current)
+                current = [v]
+
+    runs = [r for r in runs if len(r) >= 2]
+
+    # Sampling both sides of the longest segment of every run
+    queries = np.zeros((2 * len(runs), 2))
+    for k, run in enumerate(runs):
+        lengths = [(run[m+1][0] - run[m][0]) ** 2 + (run[m+1][1] - run[m][1]) ** 2 for m in range(len(run) - 1)]
+        m = lengths.index(max(lengths))
+        (ax, ay, _), (bx, by, _) = run[m], run[m+1]
+        length = sqrt(lengths[m]) or 1
+        nudge = min(extent * 1e-7, length * 0.25)
+        lx, ly = -(by - ay) / length * nudge, (bx - ax) / length * nudge
+        queries[2*k] = ((ax + bx) / 2 + lx, (ay + by) / 2 + ly)
+        queries[2*k+1] = ((ax + bx) / 2 - lx, (ay + by) / 2 - ly)
+
+    windings = windingNumbers(xs, ys, queries, offsets=offsets).tolist()
+    kept = [run for k, run in enumerate(runs) if windings[2*k] > 0 and windings[2*k+1] <= 0]
+
+    # Whole curves are loops already, the other runs are chained back into loops at the nodes
+    loops: list[list[tuple[float, float]]] = [[(x, y) for x, y, _ in run[:-1]] for run in kept if run[0][2] < 0]
+    kept = [run for run in kept if run[0][2] >= 0]
+    leaving: dict[int, list[int]] = {}
+    for k, run in enumerate(kept):
+        leaving.setdefault(run[0][2], []).append(k)
+
+    used = [False] * len(kept)
+    for k in range(len(kept)):
+        if used[k]: continue
+        loop: list[tuple[float, float]] = []
+        current = k
+        while current is not None and not used[current]:
+            used[current] = True
+            loop += [(x, y) for x, y, _ in kept[current][:-1]]
+            end = kept[current][-1][2]
+            candidates = [c for c in leaving.get(end, []) if not used[c]]
+            current = candidates[0] if candidates else None
+            if end == kept[k][0][2]: break
+
+        if len(loop) >= 3: loops.append(loop)
+
+    return loops
 
-    sortedLines: list[SweepedLine] = [
-        SweepedLine(Line(line.start, line.end), i)
+def sweepingLineIntersection(lines: Sequence[Line]) -> set[Intersection]:
+    sortedLines: list[LineWithIndex] = [
+        LineWithIndex(Line(line.start, line.end), i)
         if line.start.x < line.end.x else
-        SweepedLine(Line(line.end, line.start), i)
+        LineWithIndex(Line(line.end, line.start), i)
         for i, line in enumerate(lines)
     ]
     sortedLines.sort(key=lambda sl: sl.line.start.x)
 
     intersections: set[Intersection] = set()
-    evaluationBucket: list[SweepedLine] = []
+    evaluationBucket: list[LineWithIndex] = []
+    tests = 0
     for sl in sortedLines:
-        elementsToRemove = [
+        evaluationBucket = [
             e
             for e in evaluationBucket
-            if e.line.end.x + tolerance < sl.line.start.x
+            if e.line.end.x + tolerance >= sl.line.start.x
         ]
-        for e in elementsToRemove: evaluationBucket.remove(e)
+
+        # Every line is tested once against the lines it overlaps along X when it enters the bucket
+        for e in evaluationBucket:
+            tests += 1
+            intersection = e.line.intersects(sl.line, True)
+            if intersection is None: continue
+            intersections.add(Intersection(intersection, (e.index, sl.index)))
 
         evaluationBucket.append(sl)
-        for i, evaluee1 in enumerate(evaluationBucket[:-1]):
-            for evaluee2 in evaluationBucket[i+1:]:
-                if evaluee2.index in evaluee1.checkedAgainst: continue
-                evaluee1.checkedAgainst.add(evaluee2.index)
-                intersection = evaluee1.line.intersects(evaluee2.line, True)
-                if intersection is None: continue
-                intersections.add(Intersection(intersection, (evaluee1.index, evaluee2.index)))
 
+    profiling.count("intersectionTests", tests)
     return intersections
 
 def getBounds(geometries: Sequence[Geometry], padding: float = 0) -> tuple[Vector2D, Vector2D]:
@@ -519,6 +1398,12 @@ def getBounds(geometries: Sequence[Geometry], padding: float = 0) -> tuple[Vecto
         elif isinstance(g, Line):
             testPoint(g.start)
             testPoint(g.end)
+        elif isinstance(g, Circle):
+            testPoint(g.center - Vector2D(g.radius, g.radius))
+            testPoint(g.center + Vector2D(g.radius, g.radius))
+        elif isinstance(g, Arc):
+            for p in g.flatten():
+                testPoint(p)
         else:
             for p in g.points:
                 testPoint(p)
@@ -528,14 +1413,268 @@ def getBounds(geometries: Sequence[Geometry], padding: float = 0) -> tuple[Vecto
 def lerp():
     ...
 
-def interpolateGeometry(geo: Geometry, quantum: float = tolerance) -> list[Vector2D]:
-    if isinstance(geo, Vector2D): return [geo]
+def resampleGeometries(geometries: Sequence[Geometry], pitch: float) -> tuple[np.ndarray, np.ndarray]:
+    """Samples along every geometry, no further than pitch from one another, as a single (n, 2) array
+    along with the index of the geometry each sample belongs to. Vertices are always sampled exactly"""
+    indices = [i for i, g in enumerate(geometries) if not isinstance(g, (Polygon, Polyline)) or g.points]
+    paths = [
+        [g] if isinstance(g, Vector2D) else
+        [g.start, g.end] if isinstance(g, Line) else
+        g.flatten() if isinstance(g, Arc) else
+        g.points if isinstance(g, Polyline) else
+        closedPolyline(g)
+        for g in (geometries[i] for i in indices)
+    ]
+    coords, offsets = packPolylines(paths)
+    coords, offsets, _ = subdividePolylines(coords, offsets, pitch)
 
-    if isinstance(geo, Line): return [p for p in geo.lerp(quantum)]
+    # Closed polygons would otherwise sample their first point twice
+    closed = np.array([isinstance(geometries[i], (Polygon, Circle)) for i in indices], dtype=bool)
+    keep = np.ones(len(coords), dtype=bool)
+    keep[(offsets[1:] - 1)[closed]] = False
 
-    return [
-        p
-        for l in geo.breakAppart()
-        for p in l.lerp(quantum)
-    ]
+    sourceIndices = np.repeat(np.array(indices, dtype=np.int64), np.diff(offsets))
+    return coords[keep], sourceIndices[keep]
 
+def interpolateGeometry(geo: Geometry, quantum: float = tolerance) -> list[Vector2D]:
+    coords, _ = resampleGeometries([geo], quantum)
+    return [Vector2D(x, y) for x, y in coords.tolist()]
+
+
+def hilbertOrder(coords: np.ndarray, bits: int = 16) -> np.ndarray:
+    """Indices sorting the (n, 2) coordinates along a Hilbert curve, so that consecutive points are close"""
+    side = (1 << bits) - 1
+    low, high = coords.min(axis=0), coords.max(axis=0)
+    scaled = ((coords - low) / np.maximum(high - low, nearZero) * side).astype(np.int64)
+    x, y = scaled[:, 0].copy(), scaled[:, 1].copy()
+    d = np.zeros(len(coords), dtype=np.int64)
+
+    s = 1 << (bits - 1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotating the quadrant so that the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, side - x, x)
+        y = np.where(flip, side - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+
+    return np.argsort(d, kind="stable")
+
+class DelaunayTriangulation:
+    """Bowyer-Watson triangulation: every point is located by walking from the last triangle created, then the
+    triangles whose circumcircle holds it are replaced by a fan around it. Points are inserted along a Hilbert curve,
+    which keeps the walks short, so building is O(n log n) in practice (the sort dominates).
+    Triangle t has the counter clockwise vertices vertices[3t:3t+3], neighbours[3t+k] is the triangle on the other side
+    of the edge from vertex k to vertex k+1 (-1 on the outside), centers and radii hold the circumcircles"""
+    xs: list[float]
+    ys: list[float]
+    vertices: list[int]
+    neighbours: list[int]
+    centers: list[tuple[float, float]]
+    radii: list[float]
+    alive: list[bool]
+    vertexTriangle: list[int]
+    duplicates: dict[int, int]
+
+    def __init__(self, points: Sequence[Vector2D]) -> None:
+        n = len(points)
+        coords = np.array([(p.x, p.y) for p in points], dtype=np.float64).reshape(-1, 2)
+        low, high = (coords.min(axis=0), coords.max(axis=0)) if n else (np.zeros(2), np.ones(2))
+        center, extent = (low + high) / 2, max(float((high - low).max()), 1)
+
+        # The super triangle is far enough for its vertices not to change the cells around the points
+        far = extent * 1e3
+        self.xs = coords[:, 0].tolist() + [center[0] - far, center[0] + far, center[0]]
+        self.ys = coords[:, 1].tolist() + [center[1] - far, center[1] - far, center[1] + far]
+        self.vertices = [n, n + 1, n + 2]
+        self.neighbours = [-1, -1, -1]
+        self.centers, self.radii = [None], [0]
+        self.alive = [True]
+        self.free: list[int] = []
+        self.circumcircle(0)
+        self.vertexTriangle = [-1] * (n + 3)
+        self.duplicates = {}
+
+        last = 0
+        for i in (hilbertOrder(coords).tolist() if n else []):
+            last = self.insert(i, last)
+        profiling.count("delaunayPoints", n)
+
+    def circumcircle(self, t: int):
+        a, b, c = self.vertices[3*t:3*t+3]
+        ax, ay, bx, by, cx, cy = self.xs[a], self.ys[a], self.xs[b], self.ys[b], self.xs[c], self.ys[c]
+        d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+        if abs(d) < nearZero:
+            center, radius = ((ax + bx + cx) / 3, (ay + by + cy) / 3), float("inf")
+        else:
+            a2, b2, c2 = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+            center = ((a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d, (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d)
+            radius = (ax - center[0]) ** 2 + (ay - center[1]) ** 2
+
+        self.centers[t] = center
+        self.radii[t] = radius
+
+    def locate(self, x: float, y: float, start: int) -> int:
+        """Walks towards (x, y) crossing the first edge it lies on the outside of, starting from a different edge
+        every step so the walk can't cycle"""
+        t, steps = start, 0
+        xs, ys, vertices, neighbours = self.xs, self.ys, self.vertices, self.neighbours
+
+        while True:
+            steps += 1
+            for k in ((steps % 3), (steps + 1) % 3, (steps + 2) % 3):
+                a, b = vertices[3*t + k], vertices[3*t + (k + 1) % 3]
+                if (xs[b] - xs[a]) * (y - ys[a]) - (ys[b] - ys[a]) * (x - xs[a]) < 0 and neighbours[3*t + k] >= 0:
+                    t = neighbours[3*t + k]
+                    break
+            else:
+                profiling.count("delaunayWalkSteps", steps)
+                return t
+
+    def insert(self, i: int, start: int) -> int:
+        xs, ys, vertices, neighbours, centers, radii, alive, free = (
+            self.xs, self.ys, self.vertices, self.neighbours, self.centers, self.radii, self.alive, self.free
+        )
+        x, y = xs[i], ys[i]
+        t = self.locate(x, y, start)
+
+        for v in vertices[3*t:3*t+3]:
+            if abs(xs[v] - x) < nearZero and abs(ys[v] - y) < nearZero:
+                self.duplicates[i] = v
+                return t
+
+        # Cavity of the triangles whose circumcircle holds the point, it's connected so a flood fill finds it
+        cavity = {t}
+        stack = [t]
+        boundary: list[tuple[int, int, int]] = []
+        while stack:
+            c = stack.pop()
+            for k in range(3):
+                other = neighbours[3*c + k]
+                if other in cavity: continue
+                if other >= 0:
+                    cx, cy = centers[other]
+                    if (x - cx) ** 2 + (y - cy) ** 2 < radii[other]:
+                        cavity.add(other)
+                        stack.append(other)
+                        continue
+                boundary.append((vertices[3*c + k], vertices[3*c + (k + 1) % 3], other))
+
+        for c in cavity:
+            alive[c] = False
+        free += cavity
+
+        # Every boundary edge forms a new triangle with the point, linked to its neighbours around the point
+        created: dict[int, int] = {}
+        for a, b, outside in boundary:
+            if free:
+                t = free.pop()
+                vertices[3*t:3*t+3] = (a, b, i)
+                neighbours[3*t:3*t+3] = (outside, -1, -1)
+                alive[t] = True
+            else:
+                t = len(alive)
+                vertices += (a, b, i)
+                neighbours += (outside, -1, -1)
+                alive.append(True)
+                centers.append(None)
+                radii.append(0)
+            self.circumcircle(t)
+            created[a] = t
+
+            if outside >= 0:
+                k = 3 * outside
+                if vertices[k] == b: neighbours[k] = t
+                elif vertices[k + 1] == b: neighbours[k + 1] = t
+                else: neighbours[k + 2] = t
+            self.vertexTriangle[a] = t
+
+        for a, b, _ in boundary:
+            t, next = created[a], created[b]
+            neighbours[3*t + 1] = next
+            neighbours[3*next + 2] = t
+
+        self.vertexTriangle[i] = t
+        return t
+
+    def triangles(self) -> np.ndarray:
+        """(m, 3) vertex indices of the triangles between the points, without the super triangle"""
+        n = len(self.xs) - 3
+        triangles = np.array(self.vertices, dtype=np.int64).reshape(-1, 3)[np.array(self.alive, dtype=bool)]
+        return triangles[(triangles < n).all(axis=1)]
+
+    def fan(self, v: int) -> list[int]:
+        """Triangles around vertex v, counter clockwise"""
+        start = t = self.vertexTriangle[v]
+        fan: list[int] = []
+        while True:
+            fan.append(t)
+            k = self.vertices[3*t:3*t+3].index(v)
+            # The edge going into v is shared with the next triangle counter clockwise
+            t = self.neighbours[3*t + (k + 2) % 3]
+            if t == start or t < 0: return fan
+
+def delaunayTriangles(points: Sequence[Vector2D]) -> np.ndarray:
+    """(m, 3) indices in points of the counter clockwise Delaunay triangles"""
+    with profiling.stage("delaunay"):
+        return DelaunayTriangulation(points).triangles()
+
+def clipConvex(subject: list[tuple[float, float]], window: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    """Sutherland-Hodgman clipping of subject by the counter clockwise convex window"""
+    for i in range(len(window)):
+        if not subject: break
+        (ax, ay), (bx, by) = window[i-1], window[i]
+        def side(p): return (bx - ax) * (p[1] - ay) - (by - ay) * (p[0] - ax)
+
+        clipped: list[tuple[float, float]] = []
+        for j in range(len(subject)):
+            p, q = subject[j-1], subject[j]
+            sp, sq = side(p), side(q)
+            if (sp >= 0) != (sq >= 0):
+                t = sp / (sp - sq)
+                clipped.append((p[0] + (q[0] - p[0]) * t, p[1] + (q[1] - p[1]) * t))
+            if sq >= 0: clipped.append(q)
+        subject = clipped
+
+    return subject
+
+def voronoiCells(points: Sequence[Vector2D], bounds: Polygon) -> list[Polygon]:
+    """Voronoi cell of every point clipped to bounds, counter clockwise. Cells are the circumcenters of the Delaunay
+    triangles around their point, only the ones crossing the bounds are clipped. Duplicated points get an empty cell"""
+    with profiling.stage("voronoi"):
+        triangulation = DelaunayTriangulation(points)
+        centers = np.array(triangulation.centers)
+        boundsXs, boundsYs = np.array([p.x for p in bounds.points]), np.array([p.y for p in bounds.points])
+        inside = (windingNumbers(boundsXs, boundsYs, centers) != 0).tolist()
+
+        boundsLoop = [(p.x, p.y) for p in bounds.points]
+        if bounds.signedArea() < 0: boundsLoop.reverse()
+
+        # Cells holding a bounds vertex are those of the nearest points, they're clipped even if all their corners are inside
+        coords = np.array([(p.x, p.y) for p in points]).reshape(-1, 2)
+        holdingCorners: set[int] = set()
+        for start in range(0, len(boundsLoop), 64):
+            corners = np.array(boundsLoop[start:start + 64])
+            distances = ((coords[None, :, :] - corners[:, None, :]) ** 2).sum(axis=2)
+            holdingCorners.update(np.argmin(distances, axis=1).tolist())
+
+        cells: list[Polygon] = []
+        for i in range(len(points)):
+            if i in triangulation.duplicates:
+                cells.append(Polygon([]))
+                continue
+
+            fan = triangulation.fan(i)
+            if all(inside[t] for t in fan) and i not in holdingCorners:
+                cells.append(Polygon([Vector2D(*triangulation.centers[t]) for t in fan]))
+                continue
+
+            profiling.count("clippedCells")
+            window = [triangulation.centers[t] for t in fan]
+            cells.append(Polygon([Vector2D(x, y) for x, y in clipConvex(boundsLoop, window)]))
+
+    return cells
@@ -1,8 +1,11 @@
+from itertools import cycle
 from typing import Sequence
 from matplotlib import colormaps
+from matplotlib.collections import LineCollection
 import matplotlib.pyplot as plt
+import numpy as np
 
-from geometry import Geometry, Line, PixelMap, Polygon, Vector2D 
+from geometry import Arc, Circle, Geometry, Line, PixelMap, Polygon, Polyline, SparsePixelMap, Vector2D, closedPolyline, packPolylines
 
 plt.style.use("dark_background")
 plt.set_loglevel("critical")
@@ -15,53 +18,139 @@ pauseLength: float = -1
 xlim = None
 ylim = None
 
+lineStyles = {"-": "solid", "--": "dashed", "-.": "dashdot", ":": "dotted"}
+colorCycle = cycle(plt.rcParams["axes.prop_cycle"].by_key()["color"])
+
+def addSegments(segments: np.ndarray | list[np.ndarray], **kwargs):
+    if not len(segments): return
+    ax.add_collection(LineCollection(segments, **kwargs))
+    ax.autoscale_view()
+
 def plotGeometries(geometries: Sequence[Geometry], color = None, format="-"):
-    for g in geometries:
-        if isinstance(g, Polygon):
-            ax.plot(
-                [p.x for p in g.points + [g.points[0]]],
-                [p.y for p in g.points + [g.points[0]]],
-                format,
-                color = color
-            )
-        elif isinstance(g, Line):
-            ax.plot(
-                [g.start.x, g.end.x],
-                [g.start.y, g.end.y],
-                format,
-                color = color
-            )
-        elif isinstance(g, Vector2D):
-            ax.scatter(g.x, g.y, color=color, marker="x")
+    color = color or next(colorCycle)
+    lineStyle = lineStyles.get(format.strip("ox+.,*"), "solid")
+
+    polylines = [closedPolyline(g) for g in geometries if isinstance(g, Circle) or isinstance(g, Polygon) and g.points]
+    polylines += [g.flatten() for g in geometries if isinstance(g, Arc)]
+    polylines += [g.points for g in geometries if isinstance(g, Polyline) and g.points]
+    coords, offsets = packPolylines(polylines)
+    addSegments(np.split(coords, offsets[1:-1]) if polylines else [], colors=color, linestyles=lineStyle)
+
+    lines = [(g.start, g.end) for g in geometries if isinstance(g, Line)]
+    coords, _ = packPolylines(lines)
+    addSegments(coords.reshape(-1, 2, 2), colors=color, linestyles=lineStyle)
+
+    points = [g for g in geometries if isinstance(g, Vector2D)]
+    if points:
+        coords, _ = packPolylines([points])
+        ax.scatter(coords[:, 0], coords[:, 1], color=color, marker="x")
+
+def plotNormals(polygons: Sequence[Polygon], normals: list[list[Vector2D]], color = None):
+    pairs = [(p.points, n) for p, n in zip(polygons, normals) if len(p.points) == len(n)]
+    coords, _ = packPolylines([p for p, _ in pairs])
+    directions, _ = packPolylines([n for _, n in pairs])
+    addSegments(
+        np.stack((coords, coords + directions * normalScaleFactor), axis=1),
+        colors=color or next(colorCycle)
+    )
 
 def plotEdgeNormals(polygons: Sequence[Polygon], color = None):
-    for p in polygons:
-        for p, n in zip(p.points, p.edgeNormals):
-            ax.plot(
-                [p.x, p.x + n.x * normalScaleFactor],
-                [p.y, p.y + n.y * normalScaleFactor],
-                color = color
-            )
+    plotNormals(polygons, [p.edgeNormals for p in polygons], color)
 
 def plotVertexNormals(polygons: Sequence[Polygon], color = None):
-    for p in polygons:
-        for p, n in zip(p.points, p.vertexNormals):
-            ax.plot(
-                [p.x, p.x + n.x * normalScaleFactor],
-                [p.y, p.y + n.y * normalScaleFactor],
-                color = color
-            )
+    plotNormals(polygons, [p.vertexNormals for p in polygons], color)
 
 def plotLinesRainbow(lines: list[Line]):
-    for i, l in enumerate(lines):
-        ax.plot(
-            [l.start.x, l.end.x],
-            [l.start.y, l.end.y],
-            color=colormaps["hsv"](5*i/len(lines)%1)
+    coords, _ = packPolylines([(l.start, l.end) for l in lines])
+    addSegments(
+        coords.reshape(-1, 2, 2),
+        colors=colormaps["hsv"](5 * np.arange(len(lines)) / max(len(lines), 1) % 1)
+    )
+
+class LevelOfDetailCollection(LineCollection):
+    """Line collection that only draws the polylines in view, decimated to the screen resolution"""
+
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray, levels: int = 12, **kwargs):
+        super().__init__([], **kwargs)
+        self.coords = coords
+        self.offsets = offsets
+        self.decimated: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        self.lastView: tuple | None = None
+
+        starts, ends = offsets[:-1], offsets[1:]
+        self.boundsMin = np.minimum.reduceat(coords, starts, axis=0)
+        self.boundsMax = np.maximum.reduceat(coords, starts, axis=0)
+        self.firstPoint = starts
+        self.middlePoint = starts + (ends - starts) // 2
+
+        # Level 0 is about a pixel on a full view of the whole layout, every next level halves the quantum
+        self.span = float(np.max(self.boundsMax.max(axis=0) - self.boundsMin.min(axis=0)))
+        self.levels = levels
+
+    def quantum(self, level: int) -> float:
+        return self.span / 1024 / 2**level
+
+    def decimate(self, level: int) -> tuple[np.ndarray, np.ndarray]:
+        """Snaps vertices to a grid of the level quantum and drops consecutive duplicates"""
+        if level in self.decimated: return self.decimated[level]
+
+        snapped = np.round(self.coords / self.quantum(level))
+        keep = np.ones(len(self.coords), dtype=bool)
+        keep[1:] = np.any(snapped[1:] != snapped[:-1], axis=1)
+        # Keeping two points per polyline so that sub-pixel geometries still show up as a dot
+        keep[self.firstPoint] = True
+        keep[self.middlePoint] = True
+
+        kept = np.cumsum(keep)
+        offsets = np.concatenate(([0], kept[self.offsets[1:] - 1]))
+        self.decimated[level] = (self.coords[keep], offsets)
+        return self.decimated[level]
+
+    def updateView(self):
+        xmin, xmax = self.axes.get_xlim()
+        ymin, ymax = self.axes.get_ylim()
+        pixelSize = (xmax - xmin) / max(self.axes.bbox.width, 1)
+        level = int(np.clip(np.ceil(np.log2(max(self.quantum(0) / max(pixelSize, 1e-12), 1))), 0, self.levels))
+
+        view = (xmin, xmax, ymin, ymax, level)
+        if view == self.lastView: return
+        self.lastView = view
+
+        visible = np.flatnonzero(
+            (self.boundsMax[:, 0] >= xmin) & (self.boundsMin[:, 0] <= xmax) &
+            (self.boundsMax[:, 1] >= ymin) & (self.boundsMin[:, 1] <= ymax)
         )
+        coords, offsets = self.decimate(level)
+        self.set_segments([coords[offsets[i]:offsets[i + 1]] for i in visible])
+
+    def draw(self, renderer):
+        self.updateView()
+        super().draw(renderer)
+
+def plotGeometriesLOD(geometries: Sequence[Geometry], color = None, levels: int = 12):
+    """Same as plotGeometries, but only the visible polylines are drawn, at screen resolution"""
+    color = color or next(colorCycle)
+
+    polylines = [g.points + g.points[:1] for g in geometries if isinstance(g, Polygon) and g.points]
+    polylines += [closedPolyline(g) for g in geometries if isinstance(g, Circle)]
+    polylines += [g.flatten() for g in geometries if isinstance(g, Arc)]
+    polylines += [[g.start, g.end] for g in geometries if isinstance(g, Line)]
+    polylines += [g.points for g in geometries if isinstance(g, Polyline) and g.points]
+    if polylines:
+        coords, offsets = packPolylines(polylines)
+        collection = LevelOfDetailCollection(coords, offsets, levels, colors=color)
+        ax.add_collection(collection, autolim=False)
+        ax.update_datalim(np.vstack((collection.boundsMin.min(axis=0), collection.boundsMax.max(axis=0))))
+        ax.autoscale_view()
+
+    points = [g for g in geometries if isinstance(g, Vector2D)]
+    if points:
+        coords, _ = packPolylines([points])
+        ax.scatter(coords[:, 0], coords[:, 1], color=color, marker="x")
 
-def plotPixelmap(pixmap: PixelMap, colormap: str = "hsv"):
+def plotPixelmap(pixmap: PixelMap | SparsePixelMap, colormap: str = "hsv"):
     ax.imshow(
+        pixmap.toDense() if isinstance(pixmap, SparsePixelMap) else
         [[pixmap[x, y] for x in range(pixmap.xlen)] for y in range(pixmap.ylen)],
         extent=(
             pixmap.origin.x,
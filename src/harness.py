@@ -0,0 +1,602 @@
+import argparse, json, platform, statistics, sys, time
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from math import cos, log, pi, sin
+from random import Random
+from typing import Callable
+import numpy as np
+from geometry import Line, Polygon, Vector2D, nearZero, segmentIntersections, sweepingLineIntersection, windingNumbers
+
+Loop = list[tuple[float, float]]
+
+@dataclass
+class Case:
+    kind: str
+    seed: int
+    points: Loop
+
+@dataclass
+class Failure:
+    check: str
+    case: Case
+    message: str
+
+# Generators of closed loops, the ones not listed in selfIntersecting are simple polygons (possibly with duplicate,
+# collinear or nearly overlapping vertices)
+
+def starLoop(rng: Random, n: int) -> Loop:
+    cx, cy, scale = rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(1, 50)
+    angles = sorted(rng.uniform(0, 2 * pi) for _ in range(n))
+    return [(cx + scale * r * cos(a), cy + scale * r * sin(a)) for a in angles for r in [rng.uniform(0.3, 1)]]
+
+def pourLoop(rng: Random, n: int) -> Loop:
+    """Evenly spaced vertices around a slightly noisy circle, like the copper pours of benchmark boards"""
+    cx, cy, scale = rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(1, 50)
+    return [(cx + scale * r * cos(2 * pi * i / n), cy + scale * r * sin(2 * pi * i / n)) for i in range(n) for r in [rng.uniform(0.7, 1)]]
+
+def collinearLoop(rng: Random, n: int) -> Loop:
+    """Rectangle whose sides hold many evenly or randomly spaced points"""
+    x, y, w, h = rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0.5, 50), rng.uniform(0.5, 50)
+    side = max(n // 4, 1)
+    even = rng.random() < 0.5
+    ts = [i / side if even else rng.random() for i in range(side)]
+    ts = sorted(set(ts) | {0})
+    return (
+        [(x + w * t, y) for t in ts] + [(x + w, y + h * t) for t in ts] +
+        [(x + w * (1 - t), y + h) for t in ts] + [(x, y + h * (1 - t)) for t in ts]
+    )
+
+def spikeLoop(rng: Random, n: int) -> Loop:
+    """Star with thin spikes, some of them less than a nanometer wide"""
+    points = starLoop(rng, max(n, 3))
+    cx, cy = np.mean(points, axis=0).tolist()
+    spiked: Loop = []
+    for i, (x, y) in enumerate(points):
+        spiked.append((x, y))
+        if rng.random() < 0.2:
+            nx, ny = points[(i + 1) % len(points)]
+            width = 10 ** rng.uniform(-10, -3)
+            mx, my = (x + nx) / 2, (y + ny) / 2
+            length = rng.uniform(1, 20)
+            dx, dy = mx - cx, my - cy
+            norm = max((dx * dx + dy * dy) ** 0.5, 1e-9)
+            spiked += [
+                (mx - dy / norm * width, my + dx / norm * width),
+                (mx + dx / norm * length, my + dy / norm * length),
+                (mx + dy / norm * width, my - dx / norm * width)
+            ]
+    return spiked
+
+def duplicateLoop(rng: Random, n: int) -> Loop:
+    """Star with repeated vertices, exactly or within a few ulps to a micrometer"""
+    points: Loop = []
+    for x, y in starLoop(rng, max(n, 3)):
+        points.append((x, y))
+        if rng.random() < 0.2:
+            jitter = 0 if rng.random() < 0.5 else 10 ** rng.uniform(-14, -3)
+            points.append((x + jitter, y - jitter))
+    return points
+
+def combLoop(rng: Random, n: int) -> Loop:
+    """Comb whose teeth are thin, and sometimes closer than the inflate amount"""
+    teeth = max(n // 4, 1)
+    x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+    width, gap, length = rng.uniform(0.05, 1), 10 ** rng.uniform(-3, 0), rng.uniform(1, 10)
+    points: Loop = [(x, y)]
+    for t in range(teeth):
+        left = x + t * (width + gap)
+        points += [(left, y + length), (left + width, y + length), (left + width, y + 1)]
+        if t < teeth - 1: points.append((left + width + gap, y + 1))
+    points.append((x + teeth * (width + gap) - gap, y))
+    return points
+
+def gridLoop(rng: Random, n: int) -> Loop:
+    """Star snapped to a lattice, giving exactly collinear and axis aligned edges"""
+    loop: Loop = []
+    for x, y in starLoop(rng, n):
+        p = (float(round(x)), float(round(y)))
+        if not loop or p != loop[-1]: loop.append(p)
+    while len(loop) > 1 and loop[0] == loop[-1]: loop.pop()
+    return loop if len(loop) >= 3 else [(0.0, 0.0), (1.0, 0.0), (0.0, 1.0)]
+
+def randomLoop(rng: Random, n: int) -> Loop:
+    """Uniformly random vertices, crossing itself all over"""
+    scale = rng.uniform(1, 100)
+    return [(rng.uniform(0, scale), rng.uniform(0, scale)) for _ in range(max(n, 3))]
+
+generators: dict[str, Callable[[Random, int], Loop]] = {
+    "star": starLoop,
+    "pour": pourLoop,
+    "collinear": collinearLoop,
+    "spikes": spikeLoop,
+    "duplicates": duplicateLoop,
+    "comb": combLoop,
+    "grid": gridLoop,
+    "random": randomLoop
+}
+selfIntersecting = {"random"}
+
+def generateCases(count: int, maxVertices: int, hugeVertices: int, seed: int) -> list[Case]:
+    """count cases of every kind with up to maxVertices vertices, and a star with hugeVertices"""
+    cases: list[Case] = []
+    for kind, generate in generators.items():
+        for i in range(count):
+            caseSeed = seed * 1_000_003 + len(cases)
+            rng = Random(caseSeed)
+            cases.append(Case(kind, caseSeed, generate(rng, rng.randint(3, maxVertices))))
+    if hugeVertices:
+        cases.append(Case("huge", seed, starLoop(Random(seed), hugeVertices)))
+    return cases
+
+# Brute force references, written for obviousness rather than speed
+
+def exactSegmentParameters(a0, a1, b0, b1) -> tuple[Fraction, Fraction] | None:
+    """Parameters along a and b of the crossing of their lines, in exact arithmetic, None for parallel lines"""
+    ax, ay, bx, by = (Fraction(a1[0]) - Fraction(a0[0]), Fraction(a1[1]) - Fraction(a0[1]),
+                      Fraction(b1[0]) - Fraction(b0[0]), Fraction(b1[1]) - Fraction(b0[1]))
+    determinant = ax * by - ay * bx
+    if determinant == 0: return None
+    ox, oy = Fraction(b0[0]) - Fraction(a0[0]), Fraction(b0[1]) - Fraction(a0[1])
+    return (ox * by - oy * bx) / determinant, (ox * ay - oy * ax) / determinant
+
+def exactOnSegment(p, s0, s1, error: float) -> bool | None:
+    """Line.pointOnSegment in exact arithmetic: p within nearZero of the line through s0, s1 and between its ends
+    (within nearZero too), None when the rounding errors of the kernel, up to error, could decide either way"""
+    vx, vy = Fraction(s1[0]) - Fraction(s0[0]), Fraction(s1[1]) - Fraction(s0[1])
+    dx, dy = Fraction(p[0]) - Fraction(s0[0]), Fraction(p[1]) - Fraction(s0[1])
+    length = float(vx * vx + vy * vy) ** 0.5
+    if abs(length - nearZero) <= error: return None
+    if length < nearZero:
+        margins = [nearZero - float(dx * dx + dy * dy) ** 0.5]
+    else:
+        perpendicular, along = abs(float(dx * vy - dy * vx)) / length, float(dx * vx + dy * vy) / length
+        margins = [nearZero - perpendicular, along + nearZero, length + nearZero - along]
+    if any(abs(m) <= error for m in margins): return None
+    return all(m > 0 for m in margins)
+
+def exactIntersection(a0, a1, b0, b1) -> tuple[bool | None, tuple[float, float] | None, float]:
+    """What Line.intersects must answer with the tolerances it documents, in exact arithmetic: whether the segments
+    meet (None when its rounding errors could decide either way), where they cross unless they're parallel, and
+    how far from there it may find the crossing"""
+    # Every difference of coordinates is off by a few ulps of the largest one, products and quotients carry it along
+    coordinates = max(abs(c) for p in (a0, a1, b0, b1) for c in p) + 1
+    ulps = 4e-15
+    ax, ay = Fraction(a1[0]) - Fraction(a0[0]), Fraction(a1[1]) - Fraction(a0[1])
+    bx, by = Fraction(b1[0]) - Fraction(b0[0]), Fraction(b1[1]) - Fraction(b0[1])
+    la, lb = float(ax * ax + ay * ay) ** 0.5, float(bx * bx + by * by) ** 0.5
+    determinant = float(ax * by - ay * bx)
+    determinantError = ulps * coordinates * (la + lb)
+    if abs(abs(determinant) - nearZero) <= determinantError: return None, None, 0
+
+    if abs(determinant) < nearZero:
+        # Parallel: they meet where an end lies on the other segment
+        error = ulps * coordinates
+        ends = [exactOnSegment(b0, a0, a1, error), exactOnSegment(b1, a0, a1, error), exactOnSegment(a0, b0, b1, error), exactOnSegment(a1, b0, b1, error)]
+        if True in ends: return True, None, 0
+        return (None if None in ends else False), None, 0
+
+    t, u = exactSegmentParameters(a0, a1, b0, b1)
+    span = ((b0[0] - a0[0]) ** 2 + (b0[1] - a0[1]) ** 2) ** 0.5
+    error = ulps * coordinates * (la + lb + span) / abs(determinant)
+    bounds = [float(v) - limit for v in (t, u) for limit in (-nearZero, 1 + nearZero)]
+    if any(abs(b) <= error for b in bounds): return None, None, 0
+    if not all(-nearZero < float(v) < 1 + nearZero for v in (t, u)): return False, None, 0
+    point = (float(a0[0] + ax * t), float(a0[1] + ay * t))
+    return True, point, 2 * error * la + ulps * coordinates
+
+def exactIsLeft(q, s0, s1) -> tuple[Fraction, float]:
+    """Twice the signed area of s0, s1, q in exact arithmetic, positive with q left of s0 to s1, along with how far
+    the floating point formula of windingNumbers may be off: a few ulps of both products, each rounding being relative"""
+    vx, vy = Fraction(s1[0]) - Fraction(s0[0]), Fraction(s1[1]) - Fraction(s0[1])
+    dx, dy = Fraction(q[0]) - Fraction(s0[0]), Fraction(q[1]) - Fraction(s0[1])
+    return vx * dy - dx * vy, 1e-15 * float(abs(vx * dy) + abs(dx * vy))
+
+def exactSegmentHit(a0, a1, b0, b1) -> tuple[bool | None, tuple[float, float] | None, float]:
+    """What segmentIntersections must answer in exact arithmetic: whether the determinant is over nearZero and both
+    parameters within [0, 1] (None when its rounding errors could decide either way), the parameters, and how far
+    from them it may find them"""
+    coordinates = max(abs(c) for p in (a0, a1, b0, b1) for c in p) + 1
+    ulps = 4e-15
+    ax, ay = Fraction(a1[0]) - Fraction(a0[0]), Fraction(a1[1]) - Fraction(a0[1])
+    bx, by = Fraction(b1[0]) - Fraction(b0[0]), Fraction(b1[1]) - Fraction(b0[1])
+    la, lb = float(ax * ax + ay * ay) ** 0.5, float(bx * bx + by * by) ** 0.5
+    determinant = float(ax * by - ay * bx)
+    if abs(abs(determinant) - nearZero) <= ulps * coordinates * (la + lb): return None, None, 0
+    if abs(determinant) <= nearZero: return False, None, 0
+
+    t, u = exactSegmentParameters(a0, a1, b0, b1)
+    span = ((b0[0] - a0[0]) ** 2 + (b0[1] - a0[1]) ** 2) ** 0.5
+    error = ulps * coordinates * (la + lb + span) / abs(determinant)
+    if any(abs(float(v) - limit) <= error for v in (t, u) for limit in (0, 1)): return None, None, 0
+    return all(0 <= v <= 1 for v in (t, u)), (float(t), float(u)), error
+
+def referenceWindingNumbers(xs: np.ndarray, ys: np.ndarray, queries: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Every query against every edge of the closed loop spanning its height, in exact arithmetic unless the floating
+    point sign is certain. Also tells which queries lie so close to the line of such an edge that the rounding errors
+    of windingNumbers could go either way"""
+    x0, y0 = xs[None, :], ys[None, :]
+    x1, y1 = np.roll(xs, -1)[None, :], np.roll(ys, -1)[None, :]
+    windings = np.zeros(len(queries), dtype=np.int64)
+    ambiguous = np.zeros(len(queries), dtype=bool)
+    for start in range(0, len(queries), 256):
+        qx, qy = queries[start:start + 256, 0:1], queries[start:start + 256, 1:2]
+        upward, downward = (y0 <= qy) & (y1 > qy), (y0 > qy) & (y1 <= qy)
+        first, second = (x1 - x0) * (qy - y0), (qx - x0) * (y1 - y0)
+        isLeft = np.sign(first - second).astype(np.int64)
+        for k, i in zip(*np.nonzero((upward | downward) & (np.abs(first - second) <= 4e-15 * (np.abs(first) + np.abs(second))))):
+            exact, error = exactIsLeft(queries[start + k], (xs[i], ys[i]), (x1[0, i], y1[0, i]))
+            isLeft[k, i] = (exact > 0) - (exact < 0)
+            # Both products vanish exactly with q on the start of the edge, which windingNumbers computes exactly too
+            if error and abs(exact) <= error: ambiguous[start + k] = True
+        windings[start:start + 256] = (upward & (isLeft > 0)).sum(axis=1) - (downward & (isLeft < 0)).sum(axis=1)
+    return windings, ambiguous
+
+def referenceSegmentIntersections(xs: np.ndarray, ys: np.ndarray) -> tuple[dict[tuple[int, int], tuple[float, float, float]], set[tuple[int, int]]]:
+    """Every pair of non adjacent edges of the closed loop whose bounds overlap, tested in exact arithmetic unless the
+    floating point answer is clear of the limits by twice its error. Returns the crossing pairs with their parameters
+    and how far off they may be found, and the pairs too close to call"""
+    n = len(xs)
+    hits: dict[tuple[int, int], tuple[float, float, float]] = {}
+    ambiguous: set[tuple[int, int]] = set()
+    x1, y1 = np.roll(xs, -1), np.roll(ys, -1)
+    minX, maxX, minY, maxY = np.minimum(xs, x1), np.maximum(xs, x1), np.minimum(ys, y1), np.maximum(ys, y1)
+    for i in range(n - 1):
+        J = np.arange(i + 1, n)
+        J = J[(J != i + 1) & ~((i == 0) & (J == n - 1))]
+        J = J[(minX[J] <= maxX[i]) & (minX[i] <= maxX[J]) & (minY[J] <= maxY[i]) & (minY[i] <= maxY[J])]
+        dxI, dyI = x1[i] - xs[i], y1[i] - ys[i]
+        dxJ, dyJ = x1[J] - xs[J], y1[J] - ys[J]
+        ox, oy = xs[J] - xs[i], ys[J] - ys[i]
+        coordinates = np.maximum.reduce([np.abs(xs[J]), np.abs(ys[J]), np.abs(x1[J]), np.abs(y1[J])])
+        coordinates = np.maximum(coordinates, max(abs(xs[i]), abs(ys[i]), abs(x1[i]), abs(y1[i]))) + 1
+        la, lb = np.hypot(dxI, dyI), np.hypot(dxJ, dyJ)
+        determinant = dxI * dyJ - dyI * dxJ
+        safe = np.where(determinant != 0, determinant, 1)
+        tI, tJ = (ox * dyJ - oy * dxJ) / safe, (ox * dyI - oy * dxI) / safe
+        error = 4e-15 * coordinates * (la + lb + np.hypot(ox, oy)) / np.abs(safe)
+        margins = np.minimum.reduce([np.abs(tI), np.abs(tI - 1), np.abs(tJ), np.abs(tJ - 1)])
+        parallel = np.abs(determinant) <= nearZero
+        close = np.abs(np.abs(determinant) - nearZero) <= 8e-15 * coordinates * (la + lb)
+        close |= ~parallel & (margins <= 2 * error)
+        hit = ~close & ~parallel & (tI > 0) & (tI < 1) & (tJ > 0) & (tJ < 1)
+        for j, a, b, e in zip(J[hit].tolist(), tI[hit].tolist(), tJ[hit].tolist(), error[hit].tolist()): hits[i, j] = (a, b, e)
+        for j in J[close].tolist():
+            hit, parameters, e = exactSegmentHit((xs[i], ys[i]), (x1[i], y1[i]), (xs[j], ys[j]), (x1[j], y1[j]))
+            if hit is None: ambiguous.add((i, j))
+            elif hit: hits[i, j] = (*parameters, e)
+    return hits, ambiguous
+
+def referenceSweep(lines: list[Line]) -> set[tuple[int, int]]:
+    """Every pair tested the way sweepingLineIntersection tests them: left to right, ends excluded"""
+    ordered = sorted(
+        ((Line(l.start, l.end) if l.start.x < l.end.x else Line(l.end, l.start), i) for i, l in enumerate(lines)),
+        key=lambda li: li[0].start.x
+    )
+    return {
+        (min(i, j), max(i, j))
+        for k, (a, i) in enumerate(ordered) for b, j in ordered[k + 1:]
+        if a.intersects(b, True) is not None
+    }
+
+def boundaryDistances(queries: np.ndarray, loop: np.ndarray) -> np.ndarray:
+    """Distance of every query to the closest edge of the closed loop"""
+    starts, ends = loop, np.roll(loop, -1, axis=0)
+    ab = ends - starts
+    lengths = np.maximum((ab * ab).sum(axis=1), 1e-300)
+    distances = np.empty(len(queries))
+    for start in range(0, len(queries), 256):
+        p = queries[start:start + 256, None, :]
+        t = np.clip(((p - starts) * ab).sum(axis=2) / lengths, 0, 1)
+        distances[start:start + 256] = np.sqrt(((starts + ab * t[..., None] - p) ** 2).sum(axis=2)).min(axis=1)
+    return distances
+
+# Checks, returning a description of the first mismatch, or None. ambiguous counts comparisons too close to call
+
+class Checker:
+    """Every check draws its random numbers from the case seed, so that a case fails the same way every time"""
+
+    def __init__(self) -> None:
+        self.comparisons = 0
+        self.ambiguous = 0
+
+    def intersects(self, case: Case) -> str | None:
+        """Line.intersects against exact arithmetic, on edges of the case and adversarial pairs built on them:
+        collinear, touching, and nearly parallel segments"""
+        points, rng = case.points, Random(case.seed)
+        pairs: list[tuple[tuple[float, float], ...]] = []
+        for _ in range(min(200, len(points) ** 2)):
+            i, j = rng.randrange(len(points)), rng.randrange(len(points))
+            a0, a1 = points[i], points[(i + 1) % len(points)]
+            b0, b1 = points[j], points[(j + 1) % len(points)]
+            mode = rng.randrange(4)
+            if mode == 1:
+                # Collinear with a, overlapping it or not
+                t0, t1 = rng.uniform(-2, 2), rng.uniform(-2, 2)
+                b0 = (a0[0] + (a1[0] - a0[0]) * t0, a0[1] + (a1[1] - a0[1]) * t0)
+                b1 = (a0[0] + (a1[0] - a0[0]) * t1, a0[1] + (a1[1] - a0[1]) * t1)
+            elif mode == 2:
+                # Starting on a
+                t = rng.choice([0, 1, rng.random()])
+                b0 = (a0[0] + (a1[0] - a0[0]) * t, a0[1] + (a1[1] - a0[1]) * t)
+            elif mode == 3:
+                # Nearly parallel to a
+                angle = 10 ** rng.uniform(-12, -2)
+                dx, dy = a1[0] - a0[0], a1[1] - a0[1]
+                b1 = (b0[0] + dx * cos(angle) - dy * sin(angle), b0[1] + dx * sin(angle) + dy * cos(angle))
+            pairs.append((a0, a1, b0, b1))
+
+        for a0, a1, b0, b1 in pairs:
+            la, lb = ((a1[0] - a0[0]) ** 2 + (a1[1] - a0[1]) ** 2) ** 0.5, ((b1[0] - b0[0]) ** 2 + (b1[1] - b0[1]) ** 2) ** 0.5
+            if la == 0 or lb == 0: continue
+            self.comparisons += 1
+            found = Line(Vector2D(*a0), Vector2D(*a1)).intersects(Line(Vector2D(*b0), Vector2D(*b1)))
+            expected, point, error = exactIntersection(a0, a1, b0, b1)
+            if expected is None:
+                self.ambiguous += 1
+            elif expected and found is None:
+                return f"{a0}-{a1} and {b0}-{b1} meet at {point} but no intersection was found"
+            elif not expected and found is not None:
+                return f"{a0}-{a1} and {b0}-{b1} don't meet, yet intersect at {found}"
+            elif point and ((found.x - point[0]) ** 2 + (found.y - point[1]) ** 2) ** 0.5 > error:
+                return f"{a0}-{a1} and {b0}-{b1} cross at {point}, not at {found}"
+        return None
+
+    def sweep(self, case: Case) -> str | None:
+        """sweepingLineIntersection finds every pair the quadratic loop does"""
+        if len(case.points) > 400: return None
+        lines = [Line(Vector2D(*case.points[i - 1]), Vector2D(*case.points[i])) for i in range(len(case.points))]
+        self.comparisons += 1
+        found = {i.between for i in sweepingLineIntersection(lines)}
+        expected = referenceSweep(lines)
+        if found != expected:
+            return f"missing pairs {sorted(expected - found)[:5]}, extra pairs {sorted(found - expected)[:5]}"
+        return None
+
+    def segmentIntersections(self, case: Case) -> str | None:
+        """segmentIntersections finds every pair of crossing edges exact arithmetic does, at the same parameters,
+        but for pairs its rounding errors could decide either way"""
+        if len(case.points) > 6000: return None
+        coords = np.array(case.points)
+        xs, ys = coords[:, 0].copy(), coords[:, 1].copy()
+        I, J, tI, tJ = segmentIntersections(xs, ys)
+        found = {(i, j): (a, b) for i, j, a, b in zip(I.tolist(), J.tolist(), tI.tolist(), tJ.tolist())}
+        expected, ambiguous = referenceSegmentIntersections(xs, ys)
+        self.comparisons += len(found.keys() | expected.keys() | ambiguous)
+        self.ambiguous += len(ambiguous)
+        if missing := expected.keys() - found.keys(): return f"missing pairs {sorted(missing)[:5]}"
+        if extra := found.keys() - expected.keys() - ambiguous: return f"extra pairs {sorted(extra)[:5]}"
+        for key, (a, b, error) in expected.items():
+            if abs(found[key][0] - a) > error or abs(found[key][1] - b) > error:
+                return f"pair {key} crosses at {found[key]} instead of {(a, b)}"
+        return None
+
+    def windingNumbers(self, case: Case) -> str | None:
+        """Banded windingNumbers against exact arithmetic, at random points, vertices and points on edges"""
+        coords = np.array(case.points)
+        low, high = coords.min(axis=0), coords.max(axis=0)
+        rng = np.random.default_rng(case.seed)
+        edges = rng.integers(0, len(coords), 200)
+        t = rng.random(200)[:, None]
+        queries = np.concatenate((
+            low + (high - low) * rng.random((500, 2)),
+            coords[rng.integers(0, len(coords), 200)],
+            coords[edges] + (np.roll(coords, -1, axis=0)[edges] - coords[edges]) * t
+        ))
+        found = windingNumbers(coords[:, 0].copy(), coords[:, 1].copy(), queries)
+        expected, ambiguous = referenceWindingNumbers(coords[:, 0], coords[:, 1], queries)
+        self.comparisons += len(queries)
+        self.ambiguous += int(ambiguous.sum())
+        if (wrong := np.flatnonzero((found != expected) & ~ambiguous)).size:
+            k = int(wrong[0])
+            return f"winding around {queries[k].tolist()} is {found[k]} instead of {expected[k]} ({len(wrong)} wrong)"
+        return None
+
+    def inflate(self, case: Case) -> str | None:
+        """Polygon.inflate grows the polygon by the amount: every vertex of the result lies amount away from the polygon
+        (further at squared off miters, or as much closer as arcs are flattened), and every point closer than
+        that is inside it. Shrinking keeps the vertices inside the polygon, amount away from its boundary.
+        Vertices closer than arcTolerance (or half the amount) are merged first, which moves the result by as much.
+        Amounts go up to the size of the polygon, and shrinking by all of it leaves nothing. The huge polygon is only
+        offset by up to a hundredth of its size, its corner arcs would overlap each other by the thousand"""
+        if case.kind in selfIntersecting: return None
+        coords = np.array(case.points)
+        # Spikes may cross other edges, and shrinking may make any polygon cross itself
+        if len(segmentIntersections(coords[:, 0].copy(), coords[:, 1].copy())[0]):
+            self.ambiguous += 1
+            return None
+        extent = float((coords.max(axis=0) - coords.min(axis=0)).max())
+        miterLimit, arcTolerance = 2, 0.005
+        rng = Random(case.seed)
+
+        # No point of the polygon is further than half the extent from its boundary
+        for join in ("round", "miter", "bevel"):
+            self.comparisons += 1
+            if (vanished := Polygon([Vector2D(x, y) for x, y in case.points]).inflate(-extent, join)).points:
+                return f"shrinking by the extent {extent} with {join} joins left a polygon of area {abs(vanished.signedArea())}"
+
+        for join in ("round", "miter"):
+            for sign in (1, -1):
+                amount = sign * extent * 10 ** rng.uniform(-3, 0 if case.kind != "huge" else -2)
+                self.comparisons += 1
+                try:
+                    inflated = Polygon([Vector2D(x, y) for x, y in case.points]).inflate(amount, join)
+                except Exception as e:
+                    return f"inflating by {amount} with {join} joins raised {e!r}"
+                if not inflated.points:
+                    if sign > 0: return f"inflating by {amount} with {join} joins gave nothing"
+                    continue
+
+                result = np.array([(p.x, p.y) for p in inflated.points])
+                distances = boundaryDistances(result, coords)
+                # Miters cut at the limit end at points of the offset edges, beyond the corner
+                farthest = abs(amount) * ((1 + miterLimit ** 2) ** 0.5 if join == "miter" else 1)
+                slack = 1e-9 * max(extent, 1) + min(arcTolerance, abs(amount) / 2)
+                if (wrong := np.flatnonzero((distances < abs(amount) - arcTolerance - slack) | (distances > farthest + arcTolerance + slack))).size:
+                    k = int(wrong[0])
+                    return f"inflating by {amount} with {join} joins, vertex {result[k].tolist()} is {distances[k]} away from the polygon"
+
+                inside = referenceWindingNumbers(coords[:, 0], coords[:, 1], result)[0] != 0
+                if sign < 0 and (wrong := np.flatnonzero(~inside)).size:
+                    return f"shrinking by {amount} with {join} joins, vertex {result[int(wrong[0])].tolist()} is outside the polygon"
+                if sign < 0: continue
+
+                # Points of the grown polygon, clear of the tolerances, must be inside the result
+                low, high = coords.min(axis=0) - abs(amount), coords.max(axis=0) + abs(amount)
+                samples = low + (high - low) * np.random.default_rng(case.seed).random((1000, 2))
+                near = boundaryDistances(samples, coords) < abs(amount) - arcTolerance - slack
+                grown = near | (referenceWindingNumbers(coords[:, 0], coords[:, 1], samples)[0] != 0)
+                covered = referenceWindingNumbers(result[:, 0], result[:, 1], samples)[0] != 0
+                clear = boundaryDistances(samples, result) > slack
+                if (wrong := np.flatnonzero(grown & ~covered & clear)).size:
+                    return f"inflating by {amount} with {join} joins leaves {samples[int(wrong[0])].tolist()} out ({len(wrong)} points)"
+        return None
+
+checks = ["intersects", "sweep", "segmentIntersections", "windingNumbers", "inflate"]
+
+def shrink(check: str, case: Case, budget: int = 200) -> Case:
+    """Drops vertices of a failing case as long as it keeps failing, for a smaller reproduction"""
+    points = list(case.points)
+    i = 0
+    while i < len(points) and len(points) > 3 and budget > 0:
+        budget -= 1
+        candidate = Case(case.kind, case.seed, points[:i] + points[i + 1:])
+        try:
+            failing = getattr(Checker(), check)(candidate) is not None
+        except Exception:
+            failing = True
+        if failing: points = candidate.points
+        else: i += 1
+    return Case(case.kind, case.seed, points)
+
+def runChecks(cases: list[Case], selected: list[str]) -> tuple[dict, list[Failure]]:
+    summary: dict[str, dict] = {}
+    failures: list[Failure] = []
+    for check in selected:
+        checker = Checker()
+        failed = 0
+        for case in cases:
+            try:
+                message = getattr(checker, check)(case)
+            except Exception as e:
+                message = f"raised {e!r}"
+            if message is None: continue
+            failed += 1
+            failures.append(Failure(check, shrink(check, case), message))
+        summary[check] = {"cases": len(cases), "comparisons": checker.comparisons, "ambiguous": checker.ambiguous, "failures": failed}
+    return summary, failures
+
+# Timing curves
+
+def timeKernel(kernel: str, kind: str, n: int, seed: int, repeat: int) -> float:
+    """Best time of repeat runs of kernel on an n vertex polygon of the kind (n segment pairs for Line.intersects)"""
+    rng = Random(seed)
+    points = generators[kind](rng, n)
+    n = len(points)
+    coords = np.array(points)
+    xs, ys = coords[:, 0].copy(), coords[:, 1].copy()
+
+    if kernel == "intersects":
+        lines = [Line(Vector2D(*points[i - 1]), Vector2D(*points[i])) for i in range(n)]
+        pairs = [(lines[rng.randrange(n)], lines[rng.randrange(n)]) for _ in range(n)]
+        run = lambda: [a.intersects(b) for a, b in pairs]
+    elif kernel == "sweep":
+        lines = [Line(Vector2D(*points[i - 1]), Vector2D(*points[i])) for i in range(n)]
+        run = lambda: sweepingLineIntersection(lines)
+    elif kernel == "segmentIntersections":
+        run = lambda: segmentIntersections(xs, ys)
+    elif kernel == "windingNumbers":
+        queries = coords.min(axis=0) + (coords.max(axis=0) - coords.min(axis=0)) * np.random.default_rng(seed).random((n, 2))
+        run = lambda: windingNumbers(xs, ys, queries)
+    else:
+        polygon = Polygon([Vector2D(*p) for p in points])
+        run = lambda: polygon.inflate(0.5)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def timingCurves(sizes: list[int], kind: str, seed: int, repeat: int) -> dict:
+    """Time against vertex count of every kernel, with the exponent of the power law fitted through it"""
+    curves: dict[str, dict] = {}
+    for kernel in checks:
+        times = [timeKernel(kernel, kind, n, seed, repeat) for n in sizes]
+        logs = [(log(n), log(max(t, 1e-9))) for n, t in zip(sizes, times)]
+        meanX, meanY = statistics.fmean(x for x, _ in logs), statistics.fmean(y for _, y in logs)
+        spread = sum((x - meanX) ** 2 for x, _ in logs)
+        exponent = sum((x - meanX) * (y - meanY) for x, y in logs) / spread if spread else 0
+        curves[kernel] = {"kind": kind, "sizes": sizes, "times": times, "exponent": exponent}
+    return curves
+
+def compareCurves(curves: dict, reference: dict, threshold: float) -> list[str]:
+    """Lists every kernel and size whose time grew by more than threshold (relative) compared to reference"""
+    regressions: list[str] = []
+    for kernel, curve in curves.items():
+        if not (referenceCurve := reference.get("timing", {}).get(kernel)): continue
+        referenceTimes = dict(zip(referenceCurve["sizes"], referenceCurve["times"]))
+        for n, t in zip(curve["sizes"], curve["times"]):
+            if n not in referenceTimes: continue
+            ratio = t / max(referenceTimes[n], 1e-9)
+            if ratio > 1 + threshold:
+                regressions.append(f"{kernel}@{n}: {referenceTimes[n]:.5f}s -> {t:.5f}s (x{ratio:.2f})")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="PCB Engraving Tool Harness",
+        description="Cross-checks the geometry kernels against brute force references on random and adversarial "
+                    "polygons, and times them against the vertex count"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cases", type=int, default=20, help="Number of polygons of every kind (default 20)")
+    parser.add_argument("--max-vertices", type=int, default=60, help="Most vertices of the random polygons (default 60)")
+    parser.add_argument("--huge", type=int, default=5000, help="Vertices of the one huge polygon, 0 to skip it (default 5000)")
+    parser.add_argument("--check", type=str, action="append", choices=checks, help="Only runs this check (repeatable)")
+    parser.add_argument("--sizes", type=str, default="250,500,1000,2000,4000", help="Vertex counts the kernels are timed at")
+    parser.add_argument("--timing-kind", type=str, choices=list(generators), default="pour",
+                        help="Kind of polygon the kernels are timed on, star shows how spiky polygons scale (default pour)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs, the best is kept (default 3)")
+    parser.add_argument("--no-timing", action="store_true", help="Only checks correctness")
+    parser.add_argument("-o", "--output", type=str, help="Write the results as JSON to this file")
+    parser.add_argument("--compare", type=str, help="JSON results of a previous run, exits with an error on timing regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown considered a regression (default 0.2)")
+    args = parser.parse_args()
+
+    cases = generateCases(args.cases, args.max_vertices, args.huge, args.seed)
+    summary, failures = runChecks(cases, args.check or checks)
+
+    print(f"{'Check':<24}{'Cases':>8}{'Comparisons':>14}{'Ambiguous':>12}{'Failures':>10}")
+    for check, s in summary.items():
+        print(f"{check:<24}{s['cases']:>8}{s['comparisons']:>14}{s['ambiguous']:>12}{s['failures']:>10}")
+    for f in failures:
+        print(f"\n{f.check} failed on a {f.case.kind} polygon (seed {f.case.seed}): {f.message}\n  shrunk to {f.case.points}", file=sys.stderr)
+
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "checks": summary,
+        "failures": [asdict(f) for f in failures]
+    }
+
+    regressions: list[str] = []
+    if not args.no_timing:
+        sizes = [int(n) for n in args.sizes.split(",")]
+        results["timing"] = timingCurves(sizes, args.timing_kind, args.seed, args.repeat)
+        print(f"\n{'Kernel':<24}" + "".join(f"{n:>10}" for n in sizes) + f"{'Exponent':>10}")
+        for kernel, curve in results["timing"].items():
+            print(f"{kernel:<24}" + "".join(f"{t * 1000:>8.2f}ms" for t in curve["times"]) + f"{curve['exponent']:>10.2f}")
+
+        if args.compare:
+            with open(args.compare) as f:
+                regressions = compareCurves(results["timing"], json.load(f), args.threshold)
+            for r in regressions:
+                print(f"Regression {r}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if failures or regressions: exit(1)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import numpy as np
+from geometry import subdividePolylines
+
+class Heightmap:
+    """Regular grid of probed Z offsets, interpolated bilinearly and clamped at the grid edges"""
+    xs: np.ndarray
+    ys: np.ndarray
+    z: np.ndarray
+
+    def __init__(self, xs: np.ndarray, ys: np.ndarray, z: np.ndarray) -> None:
+        if z.shape != (len(ys), len(xs)): raise Exception("Heightmap grid should have one row per Y and one column per X")
+        if len(xs) < 2 or len(ys) < 2: raise Exception("Heightmap needs at least 2 probe points in each direction")
+        self.xs = xs
+        self.ys = ys
+        self.z = z
+
+    @staticmethod
+    def load(path: str) -> Heightmap:
+        """Reads "x y z" probe points (whitespace or comma separated, # comments) forming a full grid"""
+        with open(path) as f:
+            rows = [
+                [float(v) for v in line.replace(",", " ").split()]
+                for line in f
+                if line.split("#")[0].strip()
+            ]
+        points = np.array([r[:3] for r in rows])
+
+        xs, xIndices = np.unique(np.round(points[:, 0], 6), return_inverse=True)
+        ys, yIndices = np.unique(np.round(points[:, 1], 6), return_inverse=True)
+        z = np.full((len(ys), len(xs)), np.nan)
+        z[yIndices, xIndices] = points[:, 2]
+
+        if np.isnan(z).any(): raise Exception(f"Probe points in {path} don't form a complete grid")
+        return Heightmap(xs, ys, z)
+
+    def resolution(self) -> float:
+        return float(min(np.diff(self.xs).min(), np.diff(self.ys).min()))
+
+    def sample(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        xi = np.clip(np.searchsorted(self.xs, x) - 1, 0, len(self.xs) - 2)
+        yi = np.clip(np.searchsorted(self.ys, y) - 1, 0, len(self.ys) - 2)
+        tx = np.clip((x - self.xs[xi]) / (self.xs[xi + 1] - self.xs[xi]), 0, 1)
+        ty = np.clip((y - self.ys[yi]) / (self.ys[yi + 1] - self.ys[yi]), 0, 1)
+
+        bottom = self.z[yi, xi] * (1 - tx) + self.z[yi, xi + 1] * tx
+        top = self.z[yi + 1, xi] * (1 - tx) + self.z[yi + 1, xi + 1] * tx
+        return bottom * (1 - ty) + top * ty
+
+    def segment(self, coords: np.ndarray, offsets: np.ndarray, resolution: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Splits the segments of the polylines packed in coords (delimited by offsets) so that none
+        is longer than resolution, returns the new coordinates and offsets"""
+        coords, offsets, _ = subdividePolylines(coords, offsets, resolution or self.resolution())
+        return coords, offsets
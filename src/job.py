@@ -0,0 +1,245 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+import os
+from typing import Sequence
+from gcode import DrillSettings, GCodeSettings, PanelSettings, generateDrillGCode, generateGCode, generatePanelGCode
+from geometry import Geometry, GeometrySettigs, Vector2D, getBounds, transformGeometries
+from pocket import PocketSettings, clearingToolpaths
+from sharedgeometry import SharedGeometry, SharedGeometryHandle, attachCached
+import profiling, progress
+
+@dataclass
+class JobConfig:
+    """Contents of a TOML config: options named like the command line ones (dashes or underscores), and the
+    [[layer]] tables of a job, each with an input, an optional name and output, and options of its own"""
+    path: str
+    options: dict
+    layers: list[dict] = field(default_factory=lambda: [])
+
+def normalizeKeys(table: dict, known: set[str], where: str) -> dict:
+    options = {key.replace("-", "_"): value for key, value in table.items()}
+    if unknown := set(options) - known:
+        raise ValueError(f"Unknown setting(s) in {where}: {', '.join(sorted(unknown))}")
+    return options
+
+def loadConfig(path: str, known: set[str]) -> JobConfig:
+    """Reads a config, known being the settings it may hold (the command line destinations)"""
+    import tomllib
+
+    with open(path, "rb") as f:
+        table = tomllib.load(f)
+
+    layers = table.pop("layer", [])
+    config = JobConfig(path, normalizeKeys(table, known | {"origin"}, path))
+    for i, layer in enumerate(layers):
+        layer = dict(layer)
+        if "input" not in layer:
+            raise ValueError(f"Layer {i + 1} of {path} has no input")
+        name = layer.pop("name", os.path.splitext(os.path.basename(layer["input"]))[0])
+        config.layers.append({"name": name} | normalizeKeys(layer, known | {"input"}, f"layer {name}"))
+    return config
+
+def geometrySettingsFrom(options: dict) -> GeometrySettigs:
+    return GeometrySettigs(
+        tolerance=options["tolerance"],
+        inflate=options["inflate"],
+        offset_x=options["offset_x"],
+        offset_y=options["offset_y"],
+        mirror_x=options["mirror_x"],
+        mirror_y=options["mirror_y"],
+        rotate=options["rotate"],
+        scale=options["scale"],
+        join=options["join"]
+    )
+
+def gcodeSettingsFrom(options: dict) -> GCodeSettings:
+    settings = GCodeSettings(
+        depth=options["depth"],
+        feed=options["feed_rate"],
+        plunge=options["plunge_rate"],
+        rapid=options["rapid_height"],
+        safe=options["safe_height"],
+        spindle=options["spindle"]
+    )
+    if options["heightmap"]:
+        from heightmap import Heightmap
+        settings.heightmap = Heightmap.load(options["heightmap"])
+    return settings
+
+def drillSettingsFrom(options: dict) -> DrillSettings | None:
+    if not (options["canned_cycles"] or options["peck"] or options["combine_tools"]): return None
+    return DrillSettings(peck=options["peck"], retractToRapid=options["retract_rapid"])
+
+def panelSize(value: str) -> tuple[int, int]:
+    """Columns and rows of a panel given as COLUMNSxROWS, both at least 1"""
+    parts = str(value).lower().split("x")
+    if len(parts) != 2 or not all(part.strip().isdigit() and int(part) >= 1 for part in parts):
+        raise ValueError(f"Panel must be given as COLUMNSxROWS with at least one column and row, e.g. 3x2, not {value}")
+    columns, rows = map(int, parts)
+    return columns, rows
+
+def panelSettingsFrom(options: dict, boundsMin: Vector2D, boundsMax: Vector2D) -> PanelSettings | None:
+    """Copies of the board on a grid, spaced by its bounds unless pitches are given"""
+    if not options["panel"]: return None
+    columns, rows = panelSize(options["panel"])
+    return PanelSettings(
+        columns=columns,
+        rows=rows,
+        pitch_x=options["panel_pitch_x"] or boundsMax.x - boundsMin.x + options["panel_spacing"],
+        pitch_y=options["panel_pitch_y"] or boundsMax.y - boundsMin.y + options["panel_spacing"]
+    )
+
+def pocketSettingsFrom(options: dict) -> PocketSettings | None:
+    """Settings clearing the copper around the geometries, the tool radius defaults to the verified one, then to the
+    inflate amount, and the stepover to the tool radius"""
+    if not options["clear"]: return None
+    radius = options["clear_tool_radius"] or options["tool_radius"] or abs(options["inflate"] or 0)
+    if radius <= 0:
+        raise ValueError("Clearing needs a tool radius, given by --clear-tool-radius, --tool-radius or --inflate")
+    stepover = options["clear_stepover"] or radius
+    # Passes further apart than the tool diameter leave ridges of copper between them
+    if stepover <= 0 or stepover > 2 * radius:
+        raise ValueError(f"The clearing stepover must be more than 0 and at most the tool diameter ({2 * radius}), not {stepover}")
+    return PocketSettings(radius, stepover, options["clear_strategy"], margin=options["clear_margin"])
+
+def clearingOutputPath(outputPath: str) -> str:
+    return os.path.splitext(outputPath)[0] + "_clear.gcode"
+
+def clearingGCode(geometries: Sequence[Geometry], geometry: GeometrySettigs, gcode: GCodeSettings, clearing: PocketSettings, panel: PanelSettings | None = None) -> str:
+    """G-code clearing the copper around the geometries (as read), moved like the isolation toolpaths but not inflated"""
+    copper = transformGeometries(geometries, replace(geometry, inflate=None))
+    with profiling.stage("clear"):
+        paths = clearingToolpaths(copper, clearing)
+    return generatePanelGCode(paths, gcode, panel) if panel else generateGCode(paths, gcode)
+
+@dataclass
+class LayerTask:
+    """Everything a worker needs to turn a layer in G-code, files being (output path, tool, geometries) with the
+    geometries in shared memory when the layer is processed in another process"""
+    name: str
+    outputPath: str
+    files: list[tuple[str, float | None, SharedGeometryHandle | Sequence[Geometry]]]
+    geometry: GeometrySettigs
+    gcode: GCodeSettings
+    drill: DrillSettings | None
+    panel: PanelSettings | None
+    combineTools: bool
+    clearing: PocketSettings | None = None
+
+def processLayer(task: LayerTask, cache=None) -> list[tuple[str, int]]:
+    """Transforms the layer, writes its G-code and returns the path and line count of every written file"""
+    files = [
+        (path, tool, attachCached(source).geometries() if isinstance(source, SharedGeometryHandle) else source)
+        for path, tool, source in task.files
+    ]
+    transformed = [(path, tool, transformGeometries(geometries, task.geometry, cache)) for path, tool, geometries in files]
+
+    if task.combineTools and all(tool is not None for _, tool, _ in transformed):
+        outputs = [(task.outputPath, [(tool, geometries) for _, tool, geometries in transformed])]
+    else:
+        outputs = [(path, [(tool, geometries)]) for path, tool, geometries in transformed]
+
+    written: list[tuple[str, int]] = []
+    for outputPath, tools in outputs:
+        if task.drill and all(tool is not None for tool, _ in tools):
+            gcode = generateDrillGCode(tools, task.gcode, task.drill, task.panel)
+        elif task.panel:
+            gcode = generatePanelGCode(tools[0][1], task.gcode, task.panel)
+        else:
+            gcode = generateGCode(tools[0][1], task.gcode)
+
+        with open(outputPath, "w") as f:
+            f.write(gcode)
+        written.append((outputPath, gcode.count("\n") + 1))
+
+    # Drill files have no copper to clear
+    if task.clearing:
+        for path, tool, geometries in files:
+            if tool is not None: continue
+            gcode = clearingGCode(geometries, task.geometry, task.gcode, task.clearing, task.panel)
+            with open(clearingOutputPath(path), "w") as f:
+                f.write(gcode)
+            written.append((clearingOutputPath(path), gcode.count("\n") + 1))
+
+    return written
+
+# Options of a single file that jobs can't honour
+jobUnsupported = ["tile_size", "verify", "preview", "plot_original", "plot_result", "plot_all"]
+
+def runJob(config: JobConfig, defaults: dict, overrides: dict, workers: int = 1, cache=None) -> list[tuple[str, list[tuple[str, int]]]]:
+    """Processes every layer of the job with the same origin: a layer's options are the defaults, then the top level
+    options of the config, then its own, then overrides (from the command line). With origin = "board" the bottom
+    left corner of the bounds shared by all layers (once mirrored, rotated and scaled like each layer) is moved to
+    offset_x, offset_y, so that layers mirrored for the back side still line up with the others.
+    Layers are processed in up to workers processes, returns the files written for every layer"""
+    from readers import extractors
+
+    origin = config.options.get("origin", "file")
+    if origin not in ("file", "board"):
+        raise ValueError(f"origin must be file or board, not {origin}")
+    base = os.path.splitext(config.path)[0]
+
+    layers: list[tuple[dict, list]] = []
+    with profiling.stage("read"):
+        for layer in config.layers:
+            options = defaults | {k: v for k, v in config.options.items() if k != "origin"} | layer | overrides
+            # Verification, previews and plots are made from the geometries of a single file, which jobs don't keep
+            if unsupported := [name for name in jobUnsupported if options.get(name)]:
+                names = ", ".join("--" + name.replace("_", "-") for name in unsupported)
+                raise ValueError(f"{names} can't be used in jobs (layer {layer['name']})")
+
+            inputPath = os.path.join(os.path.dirname(config.path), options["input"])
+            options["output"] = os.path.join(os.path.dirname(config.path), layer["output"]) if "output" in layer else f"{base}_{layer['name']}.gcode"
+            extention = os.path.splitext(inputPath)[1][1:].lower()
+            if extention not in extractors:
+                raise ValueError(f"File type (extention) of layer {layer['name']} must be DXF or DRL")
+
+            with open(inputPath) as f:
+                layers.append((options, extractors[extention](f, options["output"], options["tolerance"])))
+
+    # Computed once for the whole job, every layer is positioned and panelized from the same rectangle
+    boundsMin, boundsMax = getBounds([g for _, files in layers for file in files for g in file.originalGeometries])
+
+    tasks: list[LayerTask] = []
+    shared: list[SharedGeometry] = []
+    for options, files in layers:
+        settings = geometrySettingsFrom(options)
+        corners = [Vector2D(x, y) for x in (boundsMin.x, boundsMax.x) for y in (boundsMin.y, boundsMax.y)]
+        layerMin, layerMax = getBounds(transformGeometries(corners, replace(settings, inflate=None, offset_x=None, offset_y=None)))
+
+        if origin == "board":
+            settings.offset_x = (settings.offset_x or 0) - layerMin.x
+            settings.offset_y = (settings.offset_y or 0) - layerMin.y
+
+        sources: list[tuple[str, float | None, SharedGeometryHandle | Sequence[Geometry]]] = []
+        for file in files:
+            if workers > 1:
+                shared.append(SharedGeometry.create(file.originalGeometries))
+                sources.append((file.outputPath, file.tool, shared[-1].handle))
+            else:
+                sources.append((file.outputPath, file.tool, file.originalGeometries))
+
+        tasks.append(LayerTask(
+            options["name"], options["output"], sources, settings,
+            gcodeSettingsFrom(options), drillSettingsFrom(options), panelSettingsFrom(options, layerMin, layerMax),
+            options["combine_tools"], pocketSettingsFrom(options)
+        ))
+
+    try:
+        with profiling.stage("layers"), progress.task("layers", len(tasks)) as counter:
+            results: list[list[tuple[str, int]]] = []
+            if workers <= 1:
+                for task in tasks:
+                    results.append(processLayer(task, cache))
+                    counter.advance()
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(min(workers, len(tasks))) as executor:
+                    for written in executor.map(processLayer, tasks):
+                        results.append(written)
+                        counter.advance()
+    finally:
+        for s in shared: s.unlink()
+
+    profiling.count("layers", len(tasks))
+    return [(task.name, written) for task, written in zip(tasks, results)]
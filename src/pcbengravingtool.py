@@ -1,8 +1,20 @@
-import argparse, os
-from gcode import GCodeSettings, generateGCode
-from geometry import GeometrySettigs, transformGeometries
+import argparse, os, signal, sys
+import profiling, progress
+from gcode import generateDrillGCode, generateGCode, generatePanelGCode, parseToolpath
+from geometry import getBounds, transformGeometries
+from job import (
+    clearingGCode, clearingOutputPath, drillSettingsFrom, gcodeSettingsFrom, geometrySettingsFrom, loadConfig, panelSettingsFrom,
+    panelSize, pocketSettingsFrom, runJob
+)
 from readers import extractors
 
+def panelOption(value: str) -> str:
+    try:
+        panelSize(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
 parser = argparse.ArgumentParser(
     prog="PCB Engraving Tool",
     description="A tool to process DXF and DRL files and transform them to be suited for CNC engraving PCBs"
@@ -11,7 +23,8 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "inputfile",
     type=argparse.FileType("r"),
-    help="Input file to process, can be DXF or DRL file"
+    nargs="?",
+    help="Input file to process, can be DXF or DRL file, not needed when the config describes a job"
 )
 parser.add_argument(
     "-o", "--output",
@@ -21,7 +34,9 @@ parser.add_argument(
 parser.add_argument(
     "-c", "--config",
     type=str,
-    help="Path to a TOML config file with the same settings in the CLI, settings in the CLI will override what is specified in the config"
+    help="Path to a TOML config file with the same settings in the CLI, settings in the CLI will override what is specified in the config. "
+         "With [[layer]] tables (each with an input, and optionally a name, an output and settings of its own), "
+         "the config is a job processing all layers in one run, from the same origin (origin = \"board\" aligns their common bounds on the offsets)"
 )
 
 parser_geometry = parser.add_argument_group("Geometry", "Settings controlling how geometry is read and modified")
@@ -36,6 +51,18 @@ parser_geometry.add_argument(
     type=float,
     help="Length to inflate all geometries by"
 )
+parser_geometry.add_argument(
+    "--join",
+    type=str,
+    choices=["miter", "round", "square", "bevel"],
+    default="miter",
+    help="Shape of the corners grown by --inflate, miters longer than twice the inflate length are squared off (default miter)"
+)
+parser_geometry.add_argument(
+    "--cache",
+    type=str,
+    help="File keeping inflated polygons between runs, only polygons added or changed since the previous run are inflated again"
+)
 parser_geometry.add_argument(
     "-Ox", "--offset-x",
     type=float,
@@ -46,6 +73,16 @@ parser_geometry.add_argument(
     type=float,
     help="Length to offset all geometries by in the Y axis, effectively moving the origin"
 )
+parser_geometry.add_argument(
+    "-R", "--rotate",
+    type=float,
+    help="Angle in degrees to rotate all geometries by, around the origin, applied after mirroring and before offsetting"
+)
+parser_geometry.add_argument(
+    "--scale",
+    type=float,
+    help="Factor to scale all geometries by, applied after mirroring and before rotating"
+)
 parser_geometry.add_argument(
     "-mx", "--mirror-x",
     action="store_true",
@@ -88,6 +125,11 @@ parser_gcode.add_argument(
     default=1,
     help="Height under which all movements are slow, must be lower than safe fast height (default 1mm)"
 )
+parser_gcode.add_argument(
+    "--heightmap",
+    type=str,
+    help="File of probed \"x y z\" points on a grid, cuts are split to the grid resolution and follow the interpolated surface"
+)
 parser_gcode.add_argument(
     "-S", "--spindle",
     type=int,
@@ -95,6 +137,64 @@ parser_gcode.add_argument(
     help="Spindle speed (default 5000rpm)"
 )
 
+parser_drill = parser.add_argument_group("Drilling", "Settings used with DRL files, canned cycles are not supported by every controller (GRBL doesn't)")
+parser_drill.add_argument(
+    "--canned-cycles",
+    action="store_true",
+    help="Drills with G81 canned cycles, every hole after the first is a single coordinates line"
+)
+parser_drill.add_argument(
+    "--peck",
+    type=float,
+    help="Depth drilled before retracting to clear chips, uses G83 peck cycles (implies --canned-cycles)"
+)
+parser_drill.add_argument(
+    "--retract-rapid",
+    action="store_true",
+    help="Retracts to the rapid height between holes (G98) instead of the safe height (G99)"
+)
+parser_drill.add_argument(
+    "--combine-tools",
+    action="store_true",
+    help="Writes all tools to the output file, from the smallest to the largest with tool changes (implies --canned-cycles)"
+)
+
+parser_tiling = parser.add_argument_group("Tiling", "Settings processing the board in tiles, keeping memory use proportional to the tile size")
+parser_tiling.add_argument(
+    "--tile-size",
+    type=float,
+    help="Side of the square tiles the board is split in, G-code is written tile by tile (incompatible with --panel)"
+)
+parser_tiling.add_argument(
+    "-j", "--workers",
+    type=int,
+    default=1,
+    help="Number of processes tiles are processed in, the cache is not used with more than 1 worker (default 1)"
+)
+
+parser_panel = parser.add_argument_group("Panelization", "Settings repeating the processed board in a grid, the geometry is only processed once")
+parser_panel.add_argument(
+    "--panel",
+    type=panelOption,
+    help="Number of copies as COLUMNSxROWS, e.g. 3x2"
+)
+parser_panel.add_argument(
+    "--panel-spacing",
+    type=float,
+    default=2,
+    help="Gap between the bounds of neighbouring copies (default 2mm)"
+)
+parser_panel.add_argument(
+    "--panel-pitch-x",
+    type=float,
+    help="Distance between the origins of neighbouring copies in X, overrides --panel-spacing, use to align several layers"
+)
+parser_panel.add_argument(
+    "--panel-pitch-y",
+    type=float,
+    help="Distance between the origins of neighbouring copies in Y, overrides --panel-spacing, use to align several layers"
+)
+
 parser_graphics = parser.add_argument_group("Plotting", "Settings enabling display of processed geometries, these settings require matplotlib to be installed")
 parser_graphics.add_argument(
     "--plot-original",
@@ -111,55 +211,322 @@ parser_graphics.add_argument(
     action="store_true",
     help="Equivalent to --plot-original --plot-result"
 )
+parser_graphics.add_argument(
+    "--plot-lod",
+    action="store_true",
+    help="Only redraws visible geometries, decimated to the screen resolution, keeps navigation smooth on huge layouts"
+)
+parser_graphics.add_argument(
+    "--preview",
+    type=str,
+    help="Writes an SVG or PNG (depending on the extention) preview of the geometries and toolpaths, does not need a GUI"
+)
+parser_graphics.add_argument(
+    "--preview-size",
+    type=int,
+    default=2000,
+    help="Size in pixels of the longest side of PNG previews (default 2000)"
+)
 
+parser_verify = parser.add_argument_group("Verification", "Settings checking the generated toolpaths against the original copper")
+parser_verify.add_argument(
+    "--verify",
+    action="store_true",
+    help="Reports the places where the tool comes closer than its radius to the copper, in G-code coordinates, on every copy of a panel"
+)
+parser_verify.add_argument(
+    "--tool-radius",
+    type=float,
+    help="Radius of the tool used by --verify, defaults to the inflate amount"
+)
+parser_verify.add_argument(
+    "--verify-resolution",
+    type=float,
+    help="Pixel size used by --verify, defaults to an eighth of the tool radius"
+)
 
-args = parser.parse_args()
-
-filename = args.inputfile.name
-extention = str(os.path.splitext(filename)[1]).lower()
+parser_clear = parser.add_argument_group("Clearing", "Settings removing the copper left around the geometries, over their bounds")
+parser_clear.add_argument(
+    "--clear",
+    action="store_true",
+    help="Also writes G-code clearing all the copper that isn't part of the geometries, to OUTPUT_clear.gcode"
+)
+parser_clear.add_argument(
+    "--clear-tool-radius",
+    type=float,
+    help="Radius of the tool clearing copper, defaults to --tool-radius, then to the inflate amount"
+)
+parser_clear.add_argument(
+    "--clear-stepover",
+    type=float,
+    help="Distance between neighbouring clearing passes, at most the tool diameter, defaults to the tool radius"
+)
+parser_clear.add_argument(
+    "--clear-strategy",
+    type=str,
+    choices=["contour", "zigzag"],
+    default="contour",
+    help="Passes parallel to the copper outlines, or rows inside a single pass along them (default contour)"
+)
+parser_clear.add_argument(
+    "--clear-margin",
+    type=float,
+    default=1,
+    help="Distance the cleared area extends past the bounds of the geometries (default 1mm)"
+)
 
-geometrySettings = GeometrySettigs(
-    tolerance=args.tolerance,
-    inflate=args.inflate,
-    offset_x=args.offset_x,
-    offset_y=args.offset_y,
-    mirror_x=args.mirror_x,
-    mirror_y=args.mirror_y
+parser_progress = parser.add_argument_group("Progress", "Settings reporting how far processing is and stopping it")
+parser_progress.add_argument(
+    "--progress",
+    action="store_true",
+    help="Shows a progress bar with the rate and remaining time of every stage on stderr, the first Ctrl+C then stops at the next work unit"
+)
+parser_progress.add_argument(
+    "--timeout",
+    type=float,
+    help="Seconds after which processing is cancelled"
 )
 
-gcodeSettings = GCodeSettings(
-    depth=args.depth,
-    feed=args.feed_rate,
-    plunge=args.plunge_rate,
-    rapid=args.rapid_height,
-    safe=args.safe_height,
-    spindle=args.spindle
+parser_profiling = parser.add_argument_group("Profiling", "Settings used to measure where processing time is spent")
+parser_profiling.add_argument(
+    "--profile",
+    action="store_true",
+    help="Prints wall time and counters for every processing stage"
 )
+parser_profiling.add_argument(
+    "--profile-memory",
+    action="store_true",
+    help="Prints the memory peak of every processing stage instead of its wall time, tracing memory slows processing down (implies --profile)"
+)
+parser_profiling.add_argument(
+    "--profile-output",
+    type=str,
+    help="Dumps profiling data to a file, a JSON trace if the extention is .json, cProfile stats otherwise (implies --profile)"
+)
+
+def commandLineOptions() -> dict:
+    """Options actually given on the command line, whatever their value, the defaults being suppressed"""
+    defaults = {action.dest: action.default for action in parser._actions}
+    for action in parser._actions:
+        if action.dest != "inputfile": action.default = argparse.SUPPRESS
+    try:
+        return vars(parser.parse_known_args()[0])
+    finally:
+        for action in parser._actions: action.default = defaults[action.dest]
+
+config = None
+given: dict = {}
+if (configPath := parser.parse_known_args()[0].config):
+    given = commandLineOptions()
+    try:
+        config = loadConfig(configPath, {action.dest for action in parser._actions} - {"help", "inputfile", "config"})
+    except (OSError, ValueError) as e:
+        print(e)
+        exit(1)
+    parser.set_defaults(**{k: v for k, v in config.options.items() if k != "origin"})
+
+args = parser.parse_args()
+
+if args.profile or args.profile_output or args.profile_memory:
+    profiling.enable(
+        cprofile=bool(args.profile_output) and not args.profile_output.lower().endswith(".json"),
+        memory=args.profile_memory
+    )
+
+bar = None
+if args.progress:
+    bar = progress.ProgressBar()
+    progress.listeners.append(bar)
+
+    def interrupt(signum, frame):
+        # Stopping cleanly at the next work unit, a second Ctrl+C stops right away
+        progress.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGINT, interrupt)
+
+if args.timeout:
+    progress.listeners.append(progress.Deadline(args.timeout))
+
+def reportCancelled(kind, value, traceback):
+    if not issubclass(kind, progress.Cancelled): return sys.__excepthook__(kind, value, traceback)
+    if bar: bar.clear()
+    print("Cancelled", file=sys.stderr)
+sys.excepthook = reportCancelled
+
+def reportProfile():
+    profiling.disable()
+    print(profiling.report())
+
+    if args.profile_output:
+        if args.profile_output.lower().endswith(".json"):
+            profiling.dumpTrace(args.profile_output)
+        else:
+            profiling.dumpCProfile(args.profile_output)
+
+if config and config.layers:
+    # Settings given on the command line override the ones of every layer, even when equal to top level ones
+    defaults = {action.dest: parser.get_default(action.dest) for action in parser._actions}
+    overrides = {k: v for k, v in given.items() if k not in ("inputfile", "output", "config")}
+    cache = None
+    if args.cache:
+        from cache import InflateCache
+        cache = InflateCache(args.cache)
+
+    try:
+        layers = runJob(config, defaults, overrides, args.workers, cache)
+    except (OSError, ValueError) as e:
+        print(e)
+        exit(1)
+    if cache: cache.save()
+
+    for name, written in layers:
+        for path, lines in written:
+            print(f"{name}: {path} ({lines} lines)")
+
+    if profiling.enabled: reportProfile()
+    exit(0)
+
+if not args.inputfile:
+    parser.error("the inputfile is required, unless the config describes a job with [[layer]] tables")
+
+geometrySettings = geometrySettingsFrom(vars(args))
+gcodeSettings = gcodeSettingsFrom(vars(args))
+drillSettings = drillSettingsFrom(vars(args))
+try:
+    pocketSettings = pocketSettingsFrom(vars(args))
+except ValueError as e:
+    print(e)
+    exit(1)
 
 if not args.output:
     args.output = str(os.path.splitext(args.inputfile.name)[0]) + ".gcode"
 
 if extractor := extractors.get(str(os.path.splitext(args.inputfile.name)[1])[1:].lower()):
-    outputFiles = extractor(args.inputfile, args.output, args.tolerance)
+    with profiling.stage("read"):
+        outputFiles = extractor(args.inputfile, args.output, args.tolerance)
 else:
     print(f"File type (extention) must be DXF or DRL")
     exit(1)
 
-for file in outputFiles:
-    file.transformedGeometries = transformGeometries(file.originalGeometries, geometrySettings)
-    gcode = generateGCode(file.transformedGeometries, gcodeSettings)
+cache = None
+if args.cache:
+    from cache import InflateCache
+    cache = InflateCache(args.cache)
+
+if args.tile_size and args.panel:
+    print("Tiled processing can't be combined with panelization")
+    exit(1)
+
+if args.tile_size and drillSettings:
+    print("Tiled processing can't be combined with canned drilling cycles")
+    exit(1)
+
+moves = []
+verified: list[tuple[str, list]] = []
+panelSettings = None
+if args.tile_size:
+    from gcode import gcodeFooter, gcodeHeader, geometriesGCode
+    from tiling import processTiled
+
+    keepGeometries = bool(args.preview or args.plot_result or args.plot_all)
+    for file in outputFiles:
+        with profiling.stage("tiled"), open(file.outputPath, "w") as f:
+            f.write("\n".join(gcodeHeader(gcodeSettings)) + "\n")
+            for geometries in processTiled(file.originalGeometries, geometrySettings, args.tile_size, args.workers, cache):
+                f.writelines(line + "\n" for line in geometriesGCode(geometries, gcodeSettings))
+                if keepGeometries: file.transformedGeometries += geometries
+            f.write("\n".join(gcodeFooter()))
+
+        verified.append((file.outputPath, [file]))
+        if args.preview:
+            with open(file.outputPath) as f:
+                moves += parseToolpath(f)
+else:
+    for file in outputFiles:
+        with profiling.stage("transform"):
+            file.transformedGeometries = transformGeometries(file.originalGeometries, geometrySettings, cache)
 
-    with open(file.outputPath, "w") as f:
-        f.write(gcode)
+    if args.panel:
+        panelSettings = panelSettingsFrom(vars(args), *getBounds([g for f in outputFiles for g in f.transformedGeometries]))
+
+    if args.combine_tools and all(file.tool is not None for file in outputFiles):
+        outputs = [(args.output, outputFiles)]
+    else:
+        outputs = [(file.outputPath, [file]) for file in outputFiles]
+
+    for outputPath, files in outputs:
+        with profiling.stage("gcode"):
+            if drillSettings and all(file.tool is not None for file in files):
+                gcode = generateDrillGCode([(file.tool, file.transformedGeometries) for file in files], gcodeSettings, drillSettings, panelSettings)
+            elif panelSettings:
+                gcode = generatePanelGCode(files[0].transformedGeometries, gcodeSettings, panelSettings)
+            else:
+                gcode = generateGCode(files[0].transformedGeometries, gcodeSettings)
+
+        with profiling.stage("write"), open(outputPath, "w") as f:
+            f.write(gcode)
+        verified.append((outputPath, files))
+
+        if args.preview:
+            moves += parseToolpath(gcode.splitlines())
+
+if cache:
+    cache.save()
+
+# Radius verified for the files written with another tool than the isolation one
+verifyRadius: dict[str, float] = {}
+if pocketSettings:
+    for file in outputFiles:
+        if file.tool is not None: continue
+        clearPath = clearingOutputPath(file.outputPath)
+        gcode = clearingGCode(file.originalGeometries, geometrySettings, gcodeSettings, pocketSettings, panelSettings)
+        with profiling.stage("write"), open(clearPath, "w") as f:
+            f.write(gcode)
+        verified.append((clearPath, [file]))
+        verifyRadius[clearPath] = pocketSettings.toolRadius
+
+        if args.preview:
+            moves += parseToolpath(gcode.splitlines())
+
+if args.verify:
+    from verify import reportViolations, verifyGCode
+
+    toolRadius = args.tool_radius or abs(args.inflate or 0)
+    if toolRadius <= 0:
+        print("Verification needs a tool radius, given by --tool-radius or --inflate")
+        exit(1)
+
+    # Drill files have no copper to check against
+    for outputPath, files in verified:
+        if any(file.tool is not None for file in files): continue
+        with open(outputPath) as f:
+            result = verifyGCode(f, [g for file in files for g in file.originalGeometries], geometrySettings, verifyRadius.get(outputPath, toolRadius), args.verify_resolution, panelSettings)
+        reportViolations(outputPath, result)
+
+if args.preview:
+    from preview import writePreview
+
+    with profiling.stage("preview"):
+        writePreview(
+            args.preview,
+            [g for f in outputFiles for g in f.originalGeometries],
+            [g for f in outputFiles for g in f.transformedGeometries],
+            moves,
+            args.preview_size
+        )
+
+if profiling.enabled: reportProfile()
 
 if args.plot_original or args.plot_result or args.plot_all:
     import graphics
 
+    plot = graphics.plotGeometriesLOD if args.plot_lod else graphics.plotGeometries
+
     if args.plot_original or args.plot_all:
-        graphics.plotGeometries([g for f in outputFiles for g in f.originalGeometries], color="blue")
+        plot([g for f in outputFiles for g in f.originalGeometries], color="blue")
 
     if args.plot_result or args.plot_all:
-        graphics.plotGeometries([g for f in outputFiles for g in f.transformedGeometries], color="green")
+        plot([g for f in outputFiles for g in f.transformedGeometries], color="green")
 
     graphics.show()
 
@@ -0,0 +1,288 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from math import ceil
+from typing import Literal, Sequence
+import numpy as np
+from geometry import (
+    Circle, Geometry, Polygon, Polyline, Vector2D, boundaryLoops, closedPolyline, collinearVertices, compactOffsets,
+    getBounds, mergeCloseVertices, offsetRegion, subdividePolylines
+)
+import profiling
+
+Loop = list[tuple[float, float]]
+
+@dataclass
+class PocketSettings:
+    toolRadius: float
+    # Distance between neighbouring passes, at most the tool diameter
+    stepover: float
+    strategy: Literal["contour", "zigzag"] = "contour"
+    # Longest move from one pass to the next made without lifting the tool, twice the stepover when None
+    maxLink: float | None = None
+    arcTolerance: float = 0.005
+    # Distance the area cleared around copper extends past its bounds
+    margin: float = 1
+
+def packLoops(loops: Sequence[Loop], close: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """packPolylines for loops of (x, y) tuples"""
+    offsets = np.zeros(len(loops) + 1, dtype=np.int64)
+    np.cumsum([len(loop) + close for loop in loops], out=offsets[1:])
+    coords = np.array([p for loop in loops for p in (list(loop) + list(loop[:1]) if close else loop)], dtype=np.float64)
+    return coords.reshape(-1, 2), offsets
+
+def simplifyLoops(loops: Sequence[Loop], distance: float) -> list[Loop]:
+    """Drops the vertices closer than distance to their neighbours or to the segment around them, so that offsetting
+    the previous pass again doesn't pile up the vertices of round joins"""
+    loops = [loop for loop in loops if len(loop) >= 3]
+    if not loops: return []
+
+    coords, offsets = packLoops(loops)
+    keep = mergeCloseVertices(coords, offsets, distance)
+    coords, offsets = coords[keep], compactOffsets(keep, offsets)
+    keep = ~collinearVertices(coords, offsets, distance) | np.repeat(np.diff(offsets) < 3, np.diff(offsets))
+    coords, offsets = coords[keep], compactOffsets(keep, offsets)
+
+    values, offsets = coords.tolist(), offsets.tolist()
+    return [
+        [(x, y) for x, y in values[offsets[i]:offsets[i + 1]]]
+        for i in range(len(offsets) - 1) if offsets[i + 1] - offsets[i] >= 3
+    ]
+
+def contourPasses(loops: Sequence[Loop], settings: PocketSettings) -> list[list[Loop]]:
+    """Loops of every pass, from the one running at toolRadius from the region boundary inwards. Every pass is the
+    previous one offset by the stepover, so each offset only deals with what is left of the region"""
+    passes: list[list[Loop]] = []
+    current = offsetRegion(loops, -settings.toolRadius, arcTolerance=settings.arcTolerance)
+
+    while current:
+        passes.append(current)
+        with profiling.stage("offset"):
+            current = simplifyLoops(offsetRegion(current, -settings.stepover, arcTolerance=settings.arcTolerance), settings.arcTolerance / 2)
+
+    profiling.count("pocketPasses", len(passes))
+    return passes
+
+def scanlineIntervals(loops: Sequence[Loop], spacing: float) -> list[tuple[float, float, float]]:
+    """(y, x0, x1) spans inside the loops (nonzero winding) along rows spacing apart, from the bottom row up"""
+    coords, offsets = packLoops(loops, close=True)
+    last = np.zeros(len(coords), dtype=bool)
+    last[offsets[1:] - 1] = True
+    starts, ends = coords[:-1][~last[:-1]], coords[1:][~last[:-1]]
+
+    low, high = coords[:, 1].min(), coords[:, 1].max()
+    rowCount = max(ceil((high - low) / spacing), 1)
+    pitch = (high - low) / rowCount
+
+    # Rows whose y lies in [min(y0, y1), max(y0, y1)) of every edge, with the x and direction of the crossings
+    edgeLow, edgeHigh = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+    first = np.clip(np.ceil((edgeLow - low) / pitch - 0.5), 0, rowCount).astype(np.int64)
+    stop = np.clip(np.ceil((edgeHigh - low) / pitch - 0.5), 0, rowCount).astype(np.int64)
+    counts = stop - first
+    edges = np.repeat(np.arange(len(starts)), counts)
+    rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + first[edges]
+    y = low + (rows + 0.5) * pitch
+
+    (x0, y0), (x1, y1) = starts[edges].T, ends[edges].T
+    crossings = x0 + (y - y0) / (y1 - y0) * (x1 - x0)
+    direction = np.where(y1 > y0, 1, -1)
+
+    # The winding number right of a crossing is the sum of the directions of the crossings further right, the
+    # directions of every row adding up to 0, that's minus the running sum over the sorted crossings
+    order = np.lexsort((crossings, rows))
+    crossings, y = crossings[order], y[order]
+    after = -np.cumsum(direction[order])
+    before = after + direction[order]
+    entering = np.flatnonzero((before <= 0) & (after > 0))
+    leaving = np.flatnonzero((before > 0) & (after <= 0))
+
+    return list(zip(y[entering].tolist(), crossings[entering].tolist(), crossings[leaving].tolist()))
+
+class SegmentGrid:
+    """Segments bucketed in square cells, answering whether a short move crosses any of them"""
+
+    def __init__(self, loops: Sequence[Loop], cellSize: float) -> None:
+        coords, offsets = packLoops(loops, close=True)
+        last = np.zeros(len(coords), dtype=bool)
+        last[offsets[1:] - 1] = True
+        self.starts, self.ends = coords[:-1][~last[:-1]], coords[1:][~last[:-1]]
+        self.cellSize = cellSize
+
+        low = np.floor(np.minimum(self.starts, self.ends) / cellSize).astype(np.int64)
+        high = np.floor(np.maximum(self.starts, self.ends) / cellSize).astype(np.int64)
+        cells: dict[tuple[int, int], list[int]] = {}
+        for i, (x0, y0, x1, y1) in enumerate(np.hstack((low, high)).tolist()):
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cells.setdefault((cx, cy), []).append(i)
+        self.cells = {cell: np.array(segments, dtype=np.int64) for cell, segments in cells.items()}
+
+    def crosses(self, a: tuple[float, float], b: tuple[float, float]) -> bool:
+        """Whether the move from a to b crosses a segment anywhere but at its very ends"""
+        x0, x1 = sorted((int(a[0] // self.cellSize), int(b[0] // self.cellSize)))
+        y0, y1 = sorted((int(a[1] // self.cellSize), int(b[1] // self.cellSize)))
+        buckets = [self.cells[cell] for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1) if (cell := (cx, cy)) in self.cells]
+        if not buckets: return False
+
+        segments = np.unique(np.concatenate(buckets))
+        p, q = self.starts[segments], self.ends[segments]
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        ex, ey = q[:, 0] - p[:, 0], q[:, 1] - p[:, 1]
+        determinant = dx * ey - dy * ex
+        valid = np.abs(determinant) > 1e-12
+        determinant = np.where(valid, determinant, 1)
+        ox, oy = p[:, 0] - a[0], p[:, 1] - a[1]
+        t = (ox * ey - oy * ex) / determinant
+        u = (ox * dy - oy * dx) / determinant
+        return bool((valid & (t > 1e-9) & (t < 1 - 1e-9) & (u >= 0) & (u <= 1)).any())
+
+def linkPieces(
+    pieces: Sequence[tuple[Loop, bool]],
+    boundary: Sequence[Loop],
+    maxLink: float,
+    start: tuple[float, float] = (0, 0),
+    ranks: Sequence[int] | None = None
+) -> list[Polyline]:
+    """Chains (points, closed) pieces into as few polylines as possible: after each piece, the tool moves without lifting
+    to the nearest point of another piece if it's no further than maxLink and the move stays within boundary (the
+    loops the tool center must not leave), closed pieces being entered anywhere along them and open ones at either end.
+    With ranks (the pass of every piece), chains start from the highest rank left and move to the highest rank no
+    higher than the current one, so that they don't end surrounded by pieces already cut"""
+    # Places pieces can be entered at: points along closed pieces (a vertex or within maxLink / 2 of one) and the
+    # ends of open pieces, with the segment closed pieces are entered on
+    closedIndices = [k for k, (points, closed) in enumerate(pieces) if closed]
+    openIndices = [k for k, (points, closed) in enumerate(pieces) if not closed]
+    entries, entryPieces, entrySegments = [np.zeros((0, 2))], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+
+    if closedIndices:
+        coords, vertexOffsets = packLoops([pieces[k][0] for k in closedIndices], close=True)
+        coords, offsets, source = subdividePolylines(coords, vertexOffsets, maxLink / 2)
+        last = np.zeros(len(coords), dtype=bool)
+        last[offsets[1:] - 1] = True
+        piece = np.repeat(np.array(closedIndices, dtype=np.int64), np.diff(offsets))
+        # Points lie on the segment ending at the vertex they were interpolated towards (or are that vertex)
+        segment = source - np.repeat(vertexOffsets[:-1], np.diff(offsets))
+        entries.append(coords[~last]); entryPieces.append(piece[~last]); entrySegments.append(segment[~last])
+
+    if openIndices:
+        ends = [p for k in openIndices for p in (pieces[k][0][0], pieces[k][0][-1])]
+        entries.append(np.array(ends)); entryPieces.append(np.repeat(np.array(openIndices, dtype=np.int64), 2))
+        entrySegments.append(np.tile(np.array([0, -1], dtype=np.int64), len(openIndices)))
+
+    entries, entryPieces, entrySegments = np.concatenate(entries), np.concatenate(entryPieces), np.concatenate(entrySegments)
+    if not len(entries): return []
+
+    # Entries sorted by cell, so the ones around a point are found with a few binary searches
+    cellKeys = np.floor(entries / maxLink).astype(np.int64)
+    keys = cellKeys[:, 0] * (1 << 32) + cellKeys[:, 1]
+    byCell = np.argsort(keys, kind="stable")
+    sortedKeys = keys[byCell]
+
+    grid = SegmentGrid(boundary, maxLink)
+    pieceRanks = np.zeros(len(pieces), dtype=np.int64) if ranks is None else np.asarray(ranks, dtype=np.int64)
+    entryRanks = pieceRanks[entryPieces]
+    rank = 0
+    done = np.zeros(len(pieces), dtype=bool)
+    chains: list[Polyline] = []
+    chain: list[tuple[float, float]] = []
+    position = start
+    links = 0
+
+    def nearby(point: tuple[float, float]) -> np.ndarray:
+        cx, cy = int(point[0] // maxLink), int(point[1] // maxLink)
+        found = []
+        for x in (cx - 1, cx, cx + 1):
+            low = np.searchsorted(sortedKeys, x * (1 << 32) + cy - 1, side="left")
+            high = np.searchsorted(sortedKeys, x * (1 << 32) + cy + 1, side="right")
+            found.append(byCell[low:high])
+        return np.concatenate(found)
+
+    def enter(entry: int) -> list[tuple[float, float]]:
+        """Points of the piece entry is on, starting and ending at the entry for closed pieces"""
+        points, closed = pieces[int(entryPieces[entry])]
+        segment = int(entrySegments[entry])
+        if not closed: return list(points) if segment == 0 else list(points[::-1])
+
+        point = (float(entries[entry, 0]), float(entries[entry, 1]))
+        # Segment k runs from vertex k - 1 to vertex k
+        rotated = list(points[segment:]) + list(points[:segment])
+        if point == rotated[0]: return rotated + rotated[:1]
+        return [point] + rotated + [point]
+
+    with profiling.stage("link"):
+        for _ in range(len(pieces)):
+            entry = -1
+            if chain:
+                candidates = nearby(position)
+                candidates = candidates[~done[entryPieces[candidates]]]
+                distances = np.hypot(entries[candidates, 0] - position[0], entries[candidates, 1] - position[1])
+                candidates, distances = candidates[distances <= maxLink], distances[distances <= maxLink]
+                for k in np.lexsort((distances, -entryRanks[candidates], entryRanks[candidates] > rank)).tolist():
+                    if not grid.crosses(position, (float(entries[candidates[k], 0]), float(entries[candidates[k], 1]))):
+                        entry = int(candidates[k])
+                        links += 1
+                        break
+
+            if entry < 0:
+                if len(chain) > 1: chains.append(Polyline([Vector2D(x, y) for x, y in chain]))
+                remaining = np.flatnonzero(~done[entryPieces])
+                remaining = remaining[entryRanks[remaining] == entryRanks[remaining].max()]
+                entry = int(remaining[np.argmin(np.hypot(entries[remaining, 0] - position[0], entries[remaining, 1] - position[1]))])
+                chain = []
+
+            path = enter(entry)
+            chain += path[1:] if chain and path[0] == chain[-1] else path
+            done[entryPieces[entry]] = True
+            position, rank = chain[-1], int(entryRanks[entry])
+
+        if len(chain) > 1: chains.append(Polyline([Vector2D(x, y) for x, y in chain]))
+
+    profiling.count("pocketLinks", links)
+    profiling.count("pocketRetracts", len(chains))
+    return chains
+
+def pocketToolpaths(loops: Sequence[Loop], settings: PocketSettings) -> list[Polyline]:
+    """Toolpaths clearing the region enclosed by loops (counter clockwise outer boundaries, clockwise holes) without
+    the tool coming closer than its radius to the boundaries, either as passes parallel to the boundaries or as rows
+    inside a single pass along them"""
+    with profiling.stage("pocket"):
+        if settings.strategy == "contour":
+            passes = contourPasses(loops, settings)
+            if not passes: return []
+            pieces = [(loop, True) for loops in passes for loop in loops]
+            ranks = [k for k, loops in enumerate(passes) for _ in loops]
+        else:
+            boundaryPass = offsetRegion(loops, -settings.toolRadius, arcTolerance=settings.arcTolerance)
+            if not boundaryPass: return []
+            inner = offsetRegion(boundaryPass, -settings.stepover / 2, arcTolerance=settings.arcTolerance)
+            rows = scanlineIntervals(inner, settings.stepover) if inner else []
+            passes = [boundaryPass]
+            pieces = [(loop, True) for loop in boundaryPass] + [([(x0, y), (x1, y)], False) for y, x0, x1 in rows]
+            ranks = None
+
+        lowest = min((p for loop in passes[0] for p in loop), key=lambda p: (p[1], p[0]))
+        return linkPieces(pieces, passes[0], settings.maxLink or 2 * settings.stepover, lowest, ranks)
+
+def regionLoops(boundary: Sequence[Vector2D], islands: Sequence[Geometry]) -> list[Loop]:
+    """Loops of the region inside boundary and outside of the closed islands (polygons and circles, filled by the
+    nonzero rule like the verification does), oriented like offsetRegion expects them. Islands are merged first,
+    polygons crossing themselves would otherwise wind around the region in places"""
+    loop = [(p.x, p.y) for p in boundary]
+    area = sum(loop[i-1][0] * loop[i][1] - loop[i][0] * loop[i-1][1] for i in range(len(loop)))
+    outlines: list[Loop] = []
+
+    with profiling.stage("merge"):
+        for g in islands:
+            if not (isinstance(g, Circle) or isinstance(g, Polygon) and len(g.points) >= 3): continue
+            points = [(p.x, p.y) for p in closedPolyline(g)[:-1]]
+            # The parts wound around either way
+            outlines += boundaryLoops([points]) + boundaryLoops([points[::-1]])
+        merged = boundaryLoops(outlines) if outlines else []
+
+    return [loop if area > 0 else loop[::-1]] + [outline[::-1] for outline in merged]
+
+def clearingToolpaths(copper: Sequence[Geometry], settings: PocketSettings) -> list[Polyline]:
+    """Toolpaths removing all the copper around the closed copper geometries, over their bounds grown by
+    settings.margin. Open geometries (lines and arcs) have no area to keep and are ignored"""
+    boundsMin, boundsMax = getBounds(copper, settings.margin)
+    boundary = [boundsMin, Vector2D(boundsMax.x, boundsMin.y), boundsMax, Vector2D(boundsMin.x, boundsMax.y)]
+    return pocketToolpaths(regionLoops(boundary, copper), settings)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Sequence
+from gcode import Move
+from geometry import Arc, Circle, Geometry, Line, Polygon, Polyline as PolylineGeometry, Vector2D, closedPolyline, getBounds
+
+Polyline = list[tuple[float, float]]
+
+@dataclass
+class PreviewLayer:
+    name: str
+    color: str
+    polylines: Iterable[Polyline]
+    dashed: bool = False
+
+def geometryPolylines(geometries: Sequence[Geometry], crossSize: float = 0.3) -> Iterator[Polyline]:
+    for g in geometries:
+        if isinstance(g, Polygon):
+            if g.points: yield [(p.x, p.y) for p in g.points + g.points[:1]]
+        elif isinstance(g, Circle):
+            yield [(p.x, p.y) for p in closedPolyline(g)]
+        elif isinstance(g, PolylineGeometry):
+            if g.points: yield [(p.x, p.y) for p in g.points]
+        elif isinstance(g, Arc):
+            yield [(p.x, p.y) for p in g.flatten()]
+        elif isinstance(g, Line):
+            yield [(g.start.x, g.start.y), (g.end.x, g.end.y)]
+        elif isinstance(g, Vector2D):
+            yield [(g.x - crossSize, g.y - crossSize), (g.x + crossSize, g.y + crossSize)]
+            yield [(g.x - crossSize, g.y + crossSize), (g.x + crossSize, g.y - crossSize)]
+
+def movePolylines(moves: Iterable[Move], rapid: bool) -> Iterator[Polyline]:
+    """Chains consecutive moves of the same kind (rapid or cut) into polylines"""
+    polyline: Polyline = []
+
+    for m in moves:
+        if m.rapid != rapid:
+            if len(polyline) > 1: yield polyline
+            polyline = []
+            continue
+
+        if not polyline or polyline[-1] != (m.start.x, m.start.y):
+            if len(polyline) > 1: yield polyline
+            polyline = [(m.start.x, m.start.y)]
+        polyline.append((m.end.x, m.end.y))
+
+    if len(polyline) > 1: yield polyline
+
+def previewLayers(original: Sequence[Geometry], transformed: Sequence[Geometry], moves: Sequence[Move]) -> list[PreviewLayer]:
+    return [
+        PreviewLayer("original", "#3060ff", geometryPolylines(original)),
+        PreviewLayer("transformed", "#20c040", geometryPolylines(transformed)),
+        PreviewLayer("rapids", "#ff4040", movePolylines(moves, True), dashed=True),
+        PreviewLayer("cuts", "#ffd020", movePolylines(moves, False))
+    ]
+
+def writeSVG(path: str, layers: Sequence[PreviewLayer], bounds: tuple[Vector2D, Vector2D]):
+    bl, tr = bounds
+    width, height = tr.x - bl.x, tr.y - bl.y
+
+    with open(path, "w") as f:
+        f.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            f'viewBox="{bl.x:.4f} {-tr.y:.4f} {width:.4f} {height:.4f}" '
+            f'width="{width:.4f}mm" height="{height:.4f}mm">\n'
+            f'<rect x="{bl.x:.4f}" y="{-tr.y:.4f}" width="{width:.4f}" height="{height:.4f}" fill="black"/>\n'
+            '<g transform="scale(1,-1)" fill="none" stroke-width="1" vector-effect="non-scaling-stroke">\n'
+        )
+
+        for layer in layers:
+            dash = ' stroke-dasharray="4 3"' if layer.dashed else ""
+            f.write(f'<g id="{layer.name}" stroke="{layer.color}"{dash}>\n')
+            for polyline in layer.polylines:
+                f.write('<path vector-effect="non-scaling-stroke" d="M')
+                f.write(" L".join(f"{x:.4f} {y:.4f}" for x, y in polyline))
+                f.write('"/>\n')
+            f.write("</g>\n")
+
+        f.write("</g>\n</svg>\n")
+
+def writePNG(path: str, layers: Sequence[PreviewLayer], bounds: tuple[Vector2D, Vector2D], size: int = 2000, chunkSize: int = 50000):
+    """Draws straight on an Agg renderer, without creating a figure or any artist"""
+    import numpy as np
+    from matplotlib.backends.backend_agg import RendererAgg
+    from matplotlib.image import imsave
+    from matplotlib.path import Path
+    from matplotlib.transforms import Affine2D
+
+    bl, tr = bounds
+    scale = size / max(tr.x - bl.x, tr.y - bl.y, 1e-9)
+    width, height = max(int((tr.x - bl.x) * scale), 1), max(int((tr.y - bl.y) * scale), 1)
+
+    renderer = RendererAgg(width, height, 72)
+    background = renderer.new_gc()
+    background.set_foreground("black")
+    renderer.draw_path(
+        background,
+        Path([(0, 0), (width, 0), (width, height), (0, height), (0, 0)], closed=True),
+        Affine2D(),
+        (0, 0, 0, 1)
+    )
+    transform = Affine2D().translate(-bl.x, -bl.y).scale(scale)
+
+    for layer in layers:
+        gc = renderer.new_gc()
+        gc.set_foreground(layer.color)
+        gc.set_linewidth(0.75)
+        gc.set_antialiased(True)
+        if layer.dashed: gc.set_dashes(0, [4, 3])
+
+        vertices: list[tuple[float, float]] = []
+        codes: list[int] = []
+
+        def flush():
+            if vertices:
+                renderer.draw_path(gc, Path(np.array(vertices), np.array(codes, dtype=np.uint8)), transform)
+            vertices.clear()
+            codes.clear()
+
+        for polyline in layer.polylines:
+            vertices += polyline
+            codes += [Path.MOVETO] + [Path.LINETO] * (len(polyline) - 1)
+            if len(vertices) > chunkSize: flush()
+        flush()
+
+    imsave(path, np.asarray(renderer.buffer_rgba()), origin="upper")
+
+def writePreview(path: str, original: Sequence[Geometry], transformed: Sequence[Geometry], moves: Sequence[Move], size: int = 2000):
+    """Writes an SVG or PNG (depending on the extention) preview of geometries and toolpaths"""
+    points = [p for m in moves for p in (m.start, m.end)]
+    bl, tr = getBounds(list(original) + list(transformed) + points, 1)
+    if bl.x > tr.x: bl, tr = Vector2D(-1, -1), Vector2D(1, 1)
+
+    layers = previewLayers(original, transformed, moves)
+
+    if path.lower().endswith(".svg"):
+        writeSVG(path, layers, (bl, tr))
+    else:
+        writePNG(path, layers, (bl, tr), size)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+import json, os, time, tracemalloc
+
+enabled = False
+counters: dict[str, int] = {}
+stages: dict[str, StageRecord] = {}
+events: list[dict] = []
+
+_stack: list[StageRecord] = []
+_frames: list[int] = []
+_profiler = None
+_origin = 0.0
+_disabledStage = nullcontext()
+_traceMemory = False
+
+@dataclass
+class StageRecord:
+    name: str
+    calls: int = 0
+    wallTime: float = 0
+    memoryPeak: int = 0
+
+def enable(cprofile: bool = False, memory: bool = False):
+    """Start collecting stage timings and counters, or memory peaks instead of timings when memory is True:
+    tracing memory slows everything down (unevenly across stages), so both can't be measured in the same run"""
+    global enabled, _profiler, _origin, _traceMemory
+    enabled = True
+    counters.clear()
+    stages.clear()
+    events.clear()
+    _origin = time.perf_counter()
+    _traceMemory = memory
+    if memory: tracemalloc.start()
+
+    if cprofile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+def disable():
+    global enabled
+    enabled = False
+    if _profiler: _profiler.disable()
+    if tracemalloc.is_tracing(): tracemalloc.stop()
+
+def count(name: str, amount: int = 1):
+    if not enabled: return
+    counters[name] = counters.get(name, 0) + amount
+
+def stage(name: str):
+    """Context manager timing a pipeline stage, does nothing unless profiling is enabled"""
+    if not enabled: return _disabledStage
+    return _stage(name)
+
+@contextmanager
+def _stage(name: str):
+    record = stages.setdefault(name, StageRecord(name))
+
+    # Memory peaks are tracked per frame so that nested stages don't hide each others peaks
+    if _traceMemory:
+        if _frames: _frames[-1] = max(_frames[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    _frames.append(0)
+    _stack.append(record)
+    start = time.perf_counter()
+
+    try:
+        yield record
+    finally:
+        end = time.perf_counter()
+        peak = _frames.pop()
+        _stack.pop()
+        if _traceMemory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            if _frames: _frames[-1] = max(_frames[-1], peak)
+
+        record.calls += 1
+        record.wallTime += end - start
+        record.memoryPeak = max(record.memoryPeak, peak)
+        events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - _origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": len(_stack),
+            "args": {"memoryPeak": peak}
+        })
+
+def report() -> str:
+    """Wall times of the stages, or their memory peaks when memory was traced"""
+    if _traceMemory:
+        lines = [f"{'Stage':<28}{'Calls':>8}{'Memory peak (MiB)':>20}"]
+        lines += [f"{s.name:<28}{s.calls:>8}{s.memoryPeak / 2**20:>20.2f}" for s in stages.values()]
+    else:
+        lines = [f"{'Stage':<28}{'Calls':>8}{'Wall time (s)':>16}"]
+        lines += [f"{s.name:<28}{s.calls:>8}{s.wallTime:>16.4f}" for s in stages.values()]
+
+    if counters:
+        lines.append("")
+        lines.append(f"{'Counter':<28}{'Value':>12}")
+        for name, value in counters.items():
+            lines.append(f"{name:<28}{value:>12}")
+
+    return "\n".join(lines)
+
+def dumpTrace(path: str):
+    """Write the recorded stages as a chrome://tracing compatible JSON file"""
+    with open(path, "w") as f:
+        json.dump({
+            "traceEvents": events,
+            "stages": {s.name: vars(s) for s in stages.values()},
+            "counters": counters
+        }, f, indent=1)
+
+def dumpCProfile(path: str):
+    if not _profiler: raise Exception("cProfile was not enabled, call enable(cprofile=True) first")
+    _profiler.dump_stats(path)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+import sys, time
+from typing import Callable, TextIO
+
+class Cancelled(Exception):
+    """Raised by the work in progress once cancel() was called"""
+
+@dataclass
+class Progress:
+    """State of a task given to listeners, total is None when the amount of work isn't known upfront"""
+    task: str
+    done: int
+    total: int | None
+    elapsed: float
+    finished: bool = False
+    # Number of tasks running around this one when it started, tiles holding inflate tasks for instance
+    depth: int = 0
+
+    @property
+    def rate(self) -> float:
+        """Work units per second"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0
+
+    @property
+    def fraction(self) -> float | None:
+        if not self.total: return None
+        return min(self.done / self.total, 1)
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds left at the current rate"""
+        if not self.total or not self.rate: return None
+        return max(self.total - self.done, 0) / self.rate
+
+Listener = Callable[[Progress], None]
+
+listeners: list[Listener] = []
+# Seconds between two updates of a task given to the listeners, its start and end are always given
+interval = 0.1
+cancelled = False
+_running = 0
+
+def cancel():
+    """Asks the running work to stop, it raises Cancelled at its next work unit (from any thread)"""
+    global cancelled
+    cancelled = True
+
+def reset():
+    global cancelled
+    cancelled = False
+
+def checkCancelled():
+    if cancelled: raise Cancelled()
+
+@contextmanager
+def listening(listener: Listener):
+    listeners.append(listener)
+    try:
+        yield listener
+    finally:
+        listeners.remove(listener)
+
+class Task:
+    """Work counted in units (entities, polygons, lines...) by advance(), which is also where cancellation happens.
+    Listeners are only called every interval seconds, so advancing once per unit stays cheap"""
+    name: str
+    total: int | None
+    done: int
+    start: float
+    nextUpdate: float
+    depth: int
+
+    def __init__(self, name: str, total: int | None = None) -> None:
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+        self.nextUpdate = self.start + interval
+        self.depth = 0
+
+    def state(self, finished: bool = False) -> Progress:
+        return Progress(self.name, self.done, self.total, time.perf_counter() - self.start, finished, self.depth)
+
+    def notify(self, finished: bool = False):
+        state = self.state(finished)
+        for listener in list(listeners): listener(state)
+
+    def advance(self, amount: int = 1):
+        self.done += amount
+        if cancelled: raise Cancelled()
+        if not listeners: return
+
+        now = time.perf_counter()
+        if now >= self.nextUpdate:
+            self.nextUpdate = now + interval
+            self.notify()
+
+    def __enter__(self) -> Task:
+        global _running
+        checkCancelled()
+        self.depth = _running
+        _running += 1
+        if listeners: self.notify()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        global _running
+        _running -= 1
+        if listeners and kind is None: self.notify(finished=True)
+
+def task(name: str, total: int | None = None) -> Task:
+    """Context manager counting the work of a pipeline stage, with task("inflate", len(polygons)) as t: t.advance()"""
+    return Task(name, total)
+
+def formatDuration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}" if seconds >= 3600 else f"{seconds // 60}:{seconds % 60:02}"
+
+def formatRate(rate: float) -> str:
+    for threshold, suffix in ((1e6, "M"), (1e3, "k")):
+        if rate >= threshold: return f"{rate / threshold:.1f}{suffix}"
+    return f"{rate:.0f}"
+
+def describe(state: Progress) -> str:
+    """One line summary of a task: done out of total, rate and ETA (or elapsed time once finished)"""
+    done = f"{state.done}/{state.total}" if state.total else f"{state.done}"
+    if state.finished: timing = f" in {formatDuration(state.elapsed)}"
+    elif state.eta is not None: timing = f" ETA {formatDuration(state.eta)}"
+    else: timing = ""
+    return f"{state.task} {done} {formatRate(state.rate)}/s{timing}"
+
+class ProgressBar:
+    """Listener drawing the current task on a single terminal line (stderr by default), every finished outermost task
+    is left on a line of its own. When the stream isn't a terminal, only those are written"""
+
+    def __init__(self, stream: TextIO = sys.stderr, width: int = 30) -> None:
+        self.stream = stream
+        self.width = width
+        self.interactive = stream.isatty()
+        self.lineLength = 0
+
+    def __call__(self, state: Progress):
+        final = state.finished and state.depth == 0
+        if not (final or self.interactive): return
+
+        if (fraction := state.fraction) is not None:
+            filled = round(fraction * self.width)
+            line = f"[{'#' * filled}{'.' * (self.width - filled)}] {fraction * 100:3.0f}% {describe(state)}"
+        else:
+            line = describe(state)
+
+        if self.interactive:
+            self.stream.write("\r" + line.ljust(self.lineLength))
+            self.lineLength = len(line)
+        else:
+            self.stream.write(line)
+        if final:
+            self.stream.write("\n")
+            self.lineLength = 0
+        self.stream.flush()
+
+    def clear(self):
+        """Erases an unfinished task's line, before printing something else"""
+        if self.lineLength:
+            self.stream.write("\r" + " " * self.lineLength + "\r")
+            self.stream.flush()
+            self.lineLength = 0
+
+class Deadline:
+    """Listener cancelling the work once it ran for longer than timeout seconds, checked at every update"""
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.start = time.perf_counter()
+
+    def __call__(self, state: Progress):
+        if time.perf_counter() - self.start > self.timeout: cancel()
+
+class Summary:
+    """Listener keeping the last state of every finished task"""
+
+    def __init__(self) -> None:
+        self.tasks: list[Progress] = []
+
+    def __call__(self, state: Progress):
+        if state.finished: self.tasks.append(state)
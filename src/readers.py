@@ -1,7 +1,9 @@
 from dataclasses import dataclass
+from math import isclose, pi
 import os
 from typing import Callable, Sequence, TextIO
-from geometry import Geometry, Line, Vector2D, Polygon
+from geometry import Arc, Circle, Geometry, Line, Vector2D, Polygon, cleanupPolygons, mergeClosePoints
+import profiling, progress
 import re
 
 
@@ -10,6 +12,39 @@ class File:
     outputPath: str
     originalGeometries: Sequence[Geometry]
     transformedGeometries: Sequence[Geometry]
+    # Drill diameter of DRL files
+    tool: float | None = None
+
+def bulgeArc(start: Vector2D, end: Vector2D, bulge: float) -> tuple[Arc, list[Vector2D]]:
+    """Arc of a polyline segment with a bulge, along with its points going from start to end"""
+    from ezdxf.math import bulge_to_arc
+
+    center, startAngle, endAngle, radius = bulge_to_arc((start.x, start.y), (end.x, end.y), bulge)
+    arc = Arc(Vector2D(center.x, center.y), radius, startAngle * 180 / pi, endAngle * 180 / pi)
+    # Clockwise arcs (negative bulges) are described counter clockwise, from end to start
+    points = arc.flatten()
+    return arc, points if bulge > 0 else points[::-1]
+
+def extractPolyline(entity) -> list[Geometry]:
+    """Closed polylines become polygons (or circles when made of two half circles), open ones lines and arcs"""
+    vertices = [(Vector2D(float(x), float(y)), float(bulge)) for x, y, bulge in entity.get_points("xyb")]
+    if not vertices: return []
+
+    if entity.closed and len(vertices) == 2 and all(isclose(abs(b), 1) for _, b in vertices) and vertices[0][1] == vertices[1][1]:
+        (start, _), (end, _) = vertices
+        return [Circle((start + end) / 2, start.distanceTo(end) / 2)]
+
+    segments = list(zip(vertices, vertices[1:] + (vertices[:1] if entity.closed else [])))
+    if entity.closed:
+        points: list[Vector2D] = []
+        for (start, bulge), (end, _) in segments:
+            points += bulgeArc(start, end, bulge)[1][:-1] if bulge else [start]
+        return [Polygon(points)]
+
+    return [
+        bulgeArc(start, end, bulge)[0] if bulge else Line(start, end)
+        for (start, bulge), (end, _) in segments
+    ]
 
 def extractGeometryDXF(inputFile: TextIO, outputFileName: str, tolerance: float = 0.05) -> Sequence[File]:
     import ezdxf.filemanagement as dxf
@@ -18,36 +53,75 @@ def extractGeometryDXF(inputFile: TextIO, outputFileName: str, tolerance: float
 
     rawGeometries: list[Geometry] = []
 
-    for entity in dxffile.entities:
-        entityType = entity.dxftype()
-
-        if entityType == "LINE":
-            rawGeometries.append(Line(
-                Vector2D(*entity.get_dxf_attrib("start").vec2),
-                Vector2D(*entity.get_dxf_attrib("end").vec2)
-            ))
-
-    lines = [g for g in rawGeometries if isinstance(g, Line)]
-    polygons = [Polygon([lines[0].start])]
-    previousLine = lines[0]
-
-    for line in lines[1:]:
-        if line.start.distanceTo(previousLine.end) < tolerance:
-            polygons[-1].points.append(line.start)
+    with progress.task("read", len(dxffile.entities)) as task:
+        for entity in dxffile.entities:
+            task.advance()
+            entityType = entity.dxftype()
+            entityGeometries: list[Geometry] = []
+
+            if entityType == "LINE":
+                entityGeometries.append(Line(
+                    Vector2D(*entity.get_dxf_attrib("start").vec2),
+                    Vector2D(*entity.get_dxf_attrib("end").vec2)
+                ))
+            elif entityType == "ARC":
+                entityGeometries.append(Arc(
+                    Vector2D(*entity.get_dxf_attrib("center").vec2),
+                    entity.get_dxf_attrib("radius"),
+                    entity.get_dxf_attrib("start_angle"),
+                    entity.get_dxf_attrib("end_angle")
+                ))
+            elif entityType == "CIRCLE":
+                entityGeometries.append(Circle(
+                    Vector2D(*entity.get_dxf_attrib("center").vec2),
+                    entity.get_dxf_attrib("radius")
+                ))
+            elif entityType == "LWPOLYLINE":
+                entityGeometries += extractPolyline(entity)
+
+            # Arcs, circles and polylines are in the entity coordinate system, which is mirrored when its Z axis points down
+            if entityGeometries and entityType != "LINE" and entity.dxf.hasattr("extrusion") and entity.dxf.extrusion[2] < 0:
+                for g in entityGeometries: g.mirror("x")
+            rawGeometries += entityGeometries
+
+    # Lines and arcs following each other end to start are chained into polygons, arcs being flattened.
+    # Arcs can be chained either way, since they always go counter clockwise
+    chains: list[list[Vector2D]] = []
+    chainArcs: list[Arc | None] = []
+    previousEnd: Vector2D | None = None
+
+    for g in rawGeometries:
+        if isinstance(g, Line):
+            path = [g.start, g.end]
+        elif isinstance(g, Arc):
+            path = g.flatten()
+            if previousEnd is not None and path[-1].distanceTo(previousEnd) < tolerance <= path[0].distanceTo(previousEnd):
+                path.reverse()
         else:
-            polygons.append(Polygon([line.start]))
-        previousLine = line
-
-    for p in polygons:
-        i = 0
-        while i < len(p.points):
-            if p.points[i-1].distanceTo(p.points[i]) < tolerance:
-                p.points.pop(i)
-            i += 1
-
-    return [File(outputFileName, polygons, [])]
+            continue
 
-def extractGeometryDRL(inputFile: TextIO, outputFileName: str, _) -> Sequence[File]:
+        if previousEnd is not None and path[0].distanceTo(previousEnd) < tolerance:
+            chains[-1] += path[:-1]
+            chainArcs[-1] = None
+        else:
+            chains.append(path[:-1])
+            chainArcs.append(g if isinstance(g, Arc) else None)
+        previousEnd = path[-1]
+
+    # An arc chained to nothing stays an arc, instead of becoming a polygon closed by its chord
+    arcs = [arc for arc in chainArcs if arc]
+    polygons = [Polygon(c) for c, arc in zip(chains, chainArcs) if not arc] + [g for g in rawGeometries if isinstance(g, Polygon)]
+    polygons = cleanupPolygons(polygons, tolerance)
+    circles = [g for g in rawGeometries if isinstance(g, Circle)]
+
+    profiling.count("polygons", len(polygons))
+    if profiling.enabled: profiling.count("vertices", sum(len(p.points) for p in polygons))
+    profiling.count("circles", len(circles))
+    profiling.count("arcs", len(arcs))
+    return [File(outputFileName, polygons + circles + arcs, [])]
+
+def extractGeometryDRL(inputFile: TextIO, outputFileName: str, tolerance: float = 0.05) -> Sequence[File]:
+    """One file per tool, hits of a tool closer than tolerance are drilled once"""
     files: list[File] = []
     selectedFile = 0
 
@@ -60,7 +134,8 @@ def extractGeometryDRL(inputFile: TextIO, outputFileName: str, _) -> Sequence[Fi
             basename, ext = os.path.splitext(outputFileName)
             files.append(File(
                 basename + f"_{float(matches[0])}" + ext,
-                [], []
+                [], [],
+                float(matches[0])
             ))
             continue
 
@@ -75,6 +150,10 @@ def extractGeometryDRL(inputFile: TextIO, outputFileName: str, _) -> Sequence[Fi
             ))
             continue
 
+    profiling.count("drillHits", sum(len(f.originalGeometries) for f in files))
+    for f in files:
+        f.originalGeometries = mergeClosePoints(f.originalGeometries, tolerance)
+    profiling.count("uniqueDrillHits", sum(len(f.originalGeometries) for f in files))
     return files
 
 extractors: dict[str, Callable[[TextIO, str, float], Sequence[File]]] = {
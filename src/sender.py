@@ -0,0 +1,408 @@
+from __future__ import annotations
+import argparse, asyncio, os, re, sys, threading, time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterable, Iterator
+import profiling, progress
+
+# Size of the GRBL serial receive buffer, what's sent but not acknowledged yet must fit in it
+rxBufferSize = 127
+
+def cleanLine(line: str) -> str:
+    """Line without comments and spaces, the controller would skip them but they take room in its buffer"""
+    return re.sub(r"\(.*?\)|;.*", "", line).replace(" ", "").strip().upper()
+
+@dataclass
+class StreamStats:
+    lines: int = 0
+    bytes: int = 0
+    elapsed: float = 0
+    # Time spent waiting for the generator with nothing left to send
+    generatorWait: float = 0
+    # Most bytes waiting in the controller buffer at once
+    peakInFlight: int = 0
+    errors: list[tuple[int, str, str]] = field(default_factory=lambda: [])
+    messages: list[str] = field(default_factory=lambda: [])
+
+    @property
+    def linesPerSecond(self) -> float:
+        return self.lines / self.elapsed if self.elapsed else 0
+
+    @property
+    def bytesPerSecond(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed else 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.lines} lines ({self.bytes} bytes) in {self.elapsed:.2f}s, "
+            f"{self.linesPerSecond:.0f} lines/s, {self.bytesPerSecond:.0f} bytes/s, "
+            f"waited {self.generatorWait:.2f}s for the generator, {len(self.errors)} error(s)"
+        )
+
+class TerminalTransport:
+    """Serial port (or pseudo terminal) in raw mode, read through the event loop"""
+
+    def __init__(self, path: str, baudrate: int = 115200):
+        import termios, tty
+
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(self.fd, termios.TCSANOW)
+        attributes = termios.tcgetattr(self.fd)
+        speed = getattr(termios, f"B{baudrate}", None)
+        if speed is None: raise ValueError(f"Unsupported baudrate {baudrate}")
+        attributes[4] = attributes[5] = speed
+        termios.tcsetattr(self.fd, termios.TCSANOW, attributes)
+
+        self.reader = asyncio.StreamReader()
+        asyncio.get_running_loop().add_reader(self.fd, self.onReadable)
+
+    def onReadable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if data: self.reader.feed_data(data)
+        else: self.reader.feed_eof()
+
+    async def readline(self) -> bytes:
+        return await self.reader.readline()
+
+    async def write(self, data: bytes):
+        while data:
+            try:
+                data = data[os.write(self.fd, data):]
+            except BlockingIOError:
+                await asyncio.sleep(0.001)
+
+    def close(self):
+        asyncio.get_running_loop().remove_reader(self.fd)
+        os.close(self.fd)
+
+class SocketTransport:
+    """Controllers bridged over TCP (socket://host:port), as with ESP32 or ser2net bridges"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def readline(self) -> bytes:
+        return await self.reader.readline()
+
+    async def write(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+async def openTransport(port: str, baudrate: int = 115200) -> TerminalTransport | SocketTransport:
+    if port.startswith("socket://"):
+        host, _, portNumber = port.removeprefix("socket://").rpartition(":")
+        return SocketTransport(*await asyncio.open_connection(host, int(portNumber)))
+    return TerminalTransport(port, baudrate)
+
+class SimulatedController:
+    """GRBL-like controller on the master side of a pseudo terminal: lines go from a 127 byte receive buffer to a
+    16 block planner, acknowledged with ok as they enter the planner (blank lines right away), and blocks take
+    lineTime each to execute. Overflows of the receive buffer and moments the planner runs dry are counted"""
+
+    def __init__(self, lineTime: float = 0.001, plannerSize: int = 16):
+        import pty
+
+        self.lineTime = lineTime
+        self.plannerSize = plannerSize
+        self.master, slave = pty.openpty()
+        self.path = os.ttyname(slave)
+        # Keeping the slave open so that the master doesn't see hangups between connections
+        self.slave = slave
+        os.set_blocking(self.master, False)
+
+        self.received = bytearray()
+        self.planner: deque[str] = deque()
+        self.overflows = 0
+        self.starved = 0
+        self.executed = 0
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        import tty
+
+        tty.setraw(self.master)
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.master, self.onReadable)
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+        self.reply("Grbl 1.1h ['$' for help]")
+
+    def reply(self, text: str):
+        os.write(self.master, text.encode() + b"\r\n")
+
+    def onReadable(self):
+        try:
+            self.received += os.read(self.master, 4096)
+        except BlockingIOError:
+            return
+        if len(self.received) > rxBufferSize:
+            self.overflows += 1
+        self.wakeup.set()
+
+    def parse(self):
+        """Moves complete lines from the receive buffer to the planner while it has room"""
+        while len(self.planner) < self.plannerSize and b"\n" in self.received:
+            line, _, rest = self.received.partition(b"\n")
+            self.received = bytearray(rest)
+            line = line.strip().decode()
+            # Like GRBL, blank lines are acknowledged too
+            if not line:
+                self.reply("ok")
+                continue
+            if line.startswith("$") or not re.match(r"^[GMXYZFSTIJKRPQN]", line):
+                self.reply("error:1")
+                continue
+            self.planner.append(line)
+            self.reply("ok")
+
+    async def run(self):
+        dry = False
+        while True:
+            self.parse()
+            if not self.planner:
+                dry = self.executed > 0
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            if dry: self.starved += 1
+            dry = False
+
+            await asyncio.sleep(self.lineTime)
+            self.planner.popleft()
+            self.executed += 1
+
+    async def stop(self):
+        if self.task: self.task.cancel()
+        asyncio.get_running_loop().remove_reader(self.master)
+        os.close(self.master)
+        os.close(self.slave)
+
+async def produce(lines: Iterable[str], queue: asyncio.Queue, batchSize: int = 64):
+    """Runs the generator in a thread, queueing lines in batches. The queue being bounded, the generator is paused
+    when it gets too far ahead of the machine"""
+    loop = asyncio.get_running_loop()
+
+    failure: list[BaseException] = []
+
+    def run():
+        batch: list[str] = []
+        try:
+            for line in lines:
+                if line := cleanLine(line):
+                    batch.append(line)
+                if len(batch) >= batchSize:
+                    asyncio.run_coroutine_threadsafe(queue.put(batch), loop).result()
+                    batch = []
+            asyncio.run_coroutine_threadsafe(queue.put(batch), loop).result()
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    thread = threading.Thread(target=run, name="gcode generator", daemon=True)
+    thread.start()
+    await asyncio.to_thread(thread.join)
+    if failure: raise failure[0]
+
+async def queuedLines(queue: asyncio.Queue, stats: StreamStats) -> AsyncIterator[str]:
+    while True:
+        start = time.perf_counter()
+        batch = await queue.get()
+        stats.generatorWait += time.perf_counter() - start
+        if batch is None: return
+        for line in batch: yield line
+
+class GrblSender:
+    """Streams G-code with character counting: a line is sent as soon as the unacknowledged lines and itself fit
+    in the controller receive buffer, instead of waiting for every ok"""
+
+    def __init__(self, transport: TerminalTransport | SocketTransport, bufferSize: int = rxBufferSize, stopOnError: bool = True):
+        self.transport = transport
+        self.bufferSize = bufferSize
+        self.stopOnError = stopOnError
+
+    async def wake(self, timeout: float = 3):
+        """Waits for the startup banner (opening a serial port resets most boards), going on anyway after timeout"""
+        await self.transport.write(b"\r\n\r\n")
+        try:
+            async with asyncio.timeout(timeout):
+                while not (await self.transport.readline()).startswith(b"Grbl"): pass
+        except TimeoutError:
+            pass
+
+    async def stream(self, lines: AsyncIterator[str], stats: StreamStats | None = None) -> StreamStats:
+        stats = stats or StreamStats()
+        pending: deque[tuple[int, str]] = deque()
+        inFlight = 0
+        room = asyncio.Condition()
+        failed = False
+        start = time.perf_counter()
+
+        async def receive():
+            nonlocal inFlight, failed
+            while True:
+                response = (await self.transport.readline()).decode(errors="replace").strip()
+                if not response and self.transport.reader.at_eof():
+                    raise ConnectionError("Controller disconnected")
+
+                if (response == "ok" or response.startswith("error")) and not pending:
+                    # Acknowledgements of lines the sender didn't count, like the blank lines sent by wake()
+                    stats.messages.append(f"Unexpected {response}")
+                elif response == "ok" or response.startswith("error"):
+                    async with room:
+                        length, line = pending.popleft()
+                        inFlight -= length
+                        if response != "ok":
+                            stats.errors.append((stats.lines - len(pending), line, response))
+                            failed = self.stopOnError
+                        room.notify_all()
+                elif response:
+                    # Alarms, status reports and [MSG:...] feedback
+                    stats.messages.append(response)
+                    if response.startswith("ALARM"):
+                        failed = True
+                        async with room: room.notify_all()
+
+        receiver = asyncio.create_task(receive())
+        try:
+            async for line in lines:
+                data = (line + "\n").encode()
+                async with room:
+                    await room.wait_for(lambda: failed or receiver.done() or inFlight + len(data) <= self.bufferSize)
+                    if failed or receiver.done(): break
+                    pending.append((len(data), line))
+                    inFlight += len(data)
+                    stats.peakInFlight = max(stats.peakInFlight, inFlight)
+                await self.transport.write(data)
+                stats.lines += 1
+                stats.bytes += len(data)
+
+            # Every line must be acknowledged before the stream is done
+            async with room:
+                await room.wait_for(lambda: failed or receiver.done() or not pending)
+        finally:
+            receiver.cancel()
+            stats.elapsed = time.perf_counter() - start
+
+        if receiver.done() and not receiver.cancelled() and receiver.exception():
+            raise receiver.exception()
+        profiling.count("sentLines", stats.lines)
+        profiling.count("sentBytes", stats.bytes)
+        return stats
+
+async def sendGCode(lines: Iterable[str], transport: TerminalTransport | SocketTransport, stopOnError: bool = True, queueSize: int = 64) -> StreamStats:
+    """Streams lines (typically a generator such as gcode.streamGCode) to the controller while they're produced"""
+    sender = GrblSender(transport, stopOnError=stopOnError)
+    await sender.wake()
+
+    stats = StreamStats()
+    queue: asyncio.Queue = asyncio.Queue(queueSize)
+    producer = asyncio.create_task(produce(lines, queue))
+    try:
+        await sender.stream(queuedLines(queue, stats), stats)
+    finally:
+        # When the stream stopped early, the generator is cancelled and unblocked until it notices
+        stopped = not producer.done()
+        if stopped: progress.cancel()
+        while not producer.done():
+            while not queue.empty(): queue.get_nowait()
+            await asyncio.sleep(0.01)
+        if stopped: progress.reset()
+    try:
+        await producer
+    except progress.Cancelled:
+        if not stopped: raise
+    return stats
+
+def convertLines(path: str, geometrySettings, gcodeSettings, tileSize: float | None = None) -> Iterator[str]:
+    """G-code of a DXF (or single tool DRL) file, produced tile by tile with tileSize, geometry by geometry otherwise"""
+    from gcode import gcodeFooter, gcodeHeader, geometriesGCode, streamGCode
+    from geometry import transformGeometries
+    from readers import extractors
+
+    with open(path) as f:
+        files = extractors[os.path.splitext(path)[1][1:].lower()](f, path, geometrySettings.tolerance)
+    if len(files) != 1:
+        raise ValueError("Only files with a single output can be sent, DRL files must use one tool")
+
+    if tileSize:
+        from tiling import processTiled
+        yield from gcodeHeader(gcodeSettings)
+        for geometries in processTiled(files[0].originalGeometries, geometrySettings, tileSize):
+            yield from geometriesGCode(geometries, gcodeSettings)
+        yield from gcodeFooter()
+    else:
+        yield from streamGCode(transformGeometries(files[0].originalGeometries, geometrySettings), gcodeSettings)
+
+async def main(args) -> StreamStats:
+    simulator = None
+    if args.simulate:
+        simulator = SimulatedController(args.line_time)
+        await simulator.start()
+        args.port = simulator.path
+
+    if os.path.splitext(args.inputfile)[1].lower() in (".dxf", ".drl"):
+        from gcode import GCodeSettings
+        from geometry import GeometrySettigs
+        from service import gcodeDefaults, geometryDefaults, parseSettings
+
+        names = list(geometryDefaults) + ["rotate", "scale", "join"] + list(gcodeDefaults)
+        settings = {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+        lines = convertLines(
+            args.inputfile,
+            parseSettings(GeometrySettigs, geometryDefaults, settings),
+            parseSettings(GCodeSettings, gcodeDefaults, settings),
+            args.tile_size
+        )
+    else:
+        lines = open(args.inputfile)
+
+    transport = await openTransport(args.port, args.baud)
+    try:
+        stats = await sendGCode(lines, transport, not args.keep_going)
+    finally:
+        transport.close()
+        if simulator:
+            await simulator.stop()
+            print(f"Simulated controller: {simulator.executed} blocks, planner ran dry {simulator.starved} time(s), {simulator.overflows} overflow(s)", file=sys.stderr)
+    return stats
+
+if __name__ == "__main__":
+    from service import gcodeDefaults, geometryDefaults
+
+    parser = argparse.ArgumentParser(
+        prog="PCB Engraving Tool Sender",
+        description="Streams G-code to a GRBL controller, DXF and DRL files are converted while they're sent"
+    )
+    parser.add_argument("inputfile", type=str, help="G-code, DXF or DRL file")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("-p", "--port", type=str, help="Serial port, or socket://host:port")
+    target.add_argument("--simulate", action="store_true", help="Streams to a simulated controller on a pseudo terminal")
+    parser.add_argument("-b", "--baud", type=int, default=115200)
+    parser.add_argument("--line-time", type=float, default=0.001, help="Seconds the simulated controller takes per line (default 0.001)")
+    parser.add_argument("--keep-going", action="store_true", help="Keeps streaming after an error")
+    parser.add_argument("--tile-size", type=float, help="Processes DXF files in tiles of this size, sending starts after the first tile")
+    for name in list(geometryDefaults) + ["rotate", "scale", "join"] + list(gcodeDefaults):
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=str)
+
+    args = parser.parse_args()
+    try:
+        stats = asyncio.run(main(args))
+    except (ConnectionError, OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        exit(1)
+
+    print(stats.summary(), file=sys.stderr)
+    for number, line, response in stats.errors:
+        print(f"Line {number}: {line} -> {response}", file=sys.stderr)
+    exit(1 if stats.errors else 0)
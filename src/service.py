@@ -0,0 +1,210 @@
+from __future__ import annotations
+import argparse, io, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, get_args
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from cache import InflateCache
+from gcode import GCodeSettings, generateGCode
+from geometry import GeometrySettigs, JoinStyle, transformGeometries
+from readers import extractors
+import progress
+
+# Same defaults as the command line tool
+geometryDefaults = {"inflate": None, "mirror_x": False, "mirror_y": False, "offset_x": None, "offset_y": None, "tolerance": 0.05}
+gcodeDefaults = {"depth": 0.15, "feed": 400, "plunge": 70, "rapid": 5, "safe": 1, "spindle": 5000}
+
+# Inflated polygons are kept by every worker between requests, up to a number of them
+workerCache: InflateCache | None = None
+cacheEntries = 100_000
+
+def warmWorker(maxEntries: int = cacheEntries):
+    global workerCache
+    import ezdxf.filemanagement
+    workerCache = InflateCache(maxEntries=maxEntries)
+
+def ping() -> int:
+    return os.getpid()
+
+def parseSettings(settingsClass, defaults: dict, query: dict[str, str]):
+    """Builds settingsClass out of query parameters named like its fields, converted according to their annotation"""
+    values = dict(defaults)
+    for f in fields(settingsClass):
+        if f.name not in query: continue
+        raw, annotation = query[f.name], str(f.type)
+        if "bool" in annotation: values[f.name] = raw.lower() in ("1", "true", "yes")
+        elif "float" in annotation: values[f.name] = float(raw)
+        elif "int" in annotation: values[f.name] = int(raw)
+        elif f.name == "heightmap": raise ValueError("Heightmaps aren't supported by the service")
+        elif f.name == "join":
+            if raw not in get_args(JoinStyle): raise ValueError(f"join must be one of {', '.join(get_args(JoinStyle))}, not {raw}")
+            values[f.name] = raw
+        else: values[f.name] = raw
+    return settingsClass(**values)
+
+def convert(content: str, extention: str, geometrySettings: GeometrySettigs, gcodeSettings: GCodeSettings, timeout: float | None = None) -> tuple[list[tuple[str, str]], list[progress.Progress]]:
+    """Runs in a worker, returns the name and G-code of every output file along with the finished tasks.
+    Raises progress.Cancelled once it ran for longer than timeout seconds"""
+    progress.reset()
+    summary = progress.Summary()
+    progress.listeners[:] = [summary] + ([progress.Deadline(timeout)] if timeout else [])
+
+    files = extractors[extention](io.StringIO(content), "output.gcode", geometrySettings.tolerance)
+    outputs: list[tuple[str, str]] = []
+
+    for file in files:
+        file.transformedGeometries = transformGeometries(file.originalGeometries, geometrySettings, workerCache)
+        outputs.append((file.outputPath, generateGCode(file.transformedGeometries, gcodeSettings)))
+
+    return outputs, summary.tasks
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """POST /convert?type=dxf&inflate=0.2... with the file as body, answers with the G-code in chunks,
+    every output file (one per tool for DRL files) starts with a "; File: name" comment"""
+    protocol_version = "HTTP/1.1"
+    executor: ProcessPoolExecutor
+    chunkSize = 1 << 16
+    # Seconds after which a conversion is cancelled, answering 503
+    timeout: float | None = None
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        if url.path != "/convert":
+            return self.fail(404, "Unknown endpoint, use /convert")
+
+        extention = query.pop("type", "dxf").lower()
+        if extention not in extractors:
+            return self.fail(400, "type must be dxf or drl")
+
+        try:
+            geometrySettings = parseSettings(GeometrySettigs, geometryDefaults, query)
+            gcodeSettings = parseSettings(GCodeSettings, gcodeDefaults, query)
+        except (ValueError, TypeError) as e:
+            return self.fail(400, f"Invalid settings: {e}")
+
+        content = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        start = time.perf_counter()
+        try:
+            outputs, tasks = self.executor.submit(convert, content, extention, geometrySettings, gcodeSettings, self.timeout).result()
+        except progress.Cancelled:
+            return self.fail(503, f"Conversion cancelled after {self.timeout}s")
+        except Exception as e:
+            return self.fail(422, f"Conversion failed: {e!r}")
+        if self.server.verbose:
+            for task in tasks: self.log_message("%s", progress.describe(task))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Conversion-Time", f"{time.perf_counter() - start:.4f}")
+        self.send_header("X-Work-Rates", ", ".join(f"{task.task}={task.rate:.0f}/s" for task in tasks))
+        self.end_headers()
+
+        for name, gcode in outputs:
+            self.writeChunk(f"; File: {os.path.basename(name)}\n")
+            for i in range(0, len(gcode), self.chunkSize):
+                self.writeChunk(gcode[i:i + self.chunkSize])
+            self.writeChunk("\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def writeChunk(self, text: str):
+        data = text.encode()
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+    def fail(self, status: int, message: str):
+        data = json.dumps({"error": message}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args):
+        if self.server.verbose: super().log_message(format, *args)
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: int = 1, verbose: bool = False, timeout: float | None = None, cacheSize: int = cacheEntries):
+    with ProcessPoolExecutor(workers, initializer=warmWorker, initargs=(cacheSize,)) as executor:
+        # Starting every worker (and importing ezdxf in it) before the first request comes in
+        for f in [executor.submit(ping) for _ in range(workers)]: f.result()
+
+        handler = type("Handler", (ConversionHandler,), {"executor": executor, "timeout": timeout})
+        with ThreadingHTTPServer((host, port), handler) as server:
+            server.verbose = verbose
+            print(f"Serving on http://{host}:{server.server_port} with {workers} worker(s)", file=sys.stderr)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+def requestGCode(content: str, extention: str, host: str = "127.0.0.1", port: int = 8765, **settings) -> Iterator[str]:
+    """Client side, yields the G-code lines as they arrive"""
+    connection = HTTPConnection(host, port)
+    query = urlencode({"type": extention} | {k: v for k, v in settings.items() if v is not None})
+    connection.request("POST", f"/convert?{query}", content.encode(), {"Content-Type": "text/plain"})
+    response = connection.getresponse()
+
+    if response.status != 200:
+        raise Exception(json.loads(response.read()).get("error", response.reason))
+
+    try:
+        while line := response.readline():
+            yield line.decode().rstrip("\n")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="PCB Engraving Tool Service",
+        description="Keeps the libraries and a pool of workers loaded, converting DXF and DRL files sent over HTTP"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_serve = subparsers.add_parser("serve", help="Runs the service")
+    parser_serve.add_argument("--host", type=str, default="127.0.0.1")
+    parser_serve.add_argument("--port", type=int, default=8765)
+    parser_serve.add_argument("-j", "--workers", type=int, default=1, help="Number of worker processes (default 1)")
+    parser_serve.add_argument("-v", "--verbose", action="store_true", help="Logs every request, with the rate of every stage")
+    parser_serve.add_argument("--timeout", type=float, help="Seconds after which a conversion is cancelled, freeing its worker")
+    parser_serve.add_argument("--cache-entries", type=int, default=cacheEntries,
+                              help=f"Inflated polygons kept by every worker, the least recently used are dropped beyond (default {cacheEntries})")
+
+    parser_convert = subparsers.add_parser("convert", help="Sends a file to a running service")
+    parser_convert.add_argument("inputfile", type=str)
+    parser_convert.add_argument("-o", "--output", type=str, help="Output file, defaults to stdout")
+    parser_convert.add_argument("--host", type=str, default="127.0.0.1")
+    parser_convert.add_argument("--port", type=int, default=8765)
+    parser_convert.add_argument("--repeat", type=int, default=1, help="Sends the file several times and prints the latencies")
+    for name in list(geometryDefaults) + ["rotate", "scale", "join"] + list(gcodeDefaults):
+        parser_convert.add_argument(f"--{name.replace('_', '-')}", dest=name, type=str)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.workers, args.verbose, args.timeout, args.cache_entries)
+        exit(0)
+
+    with open(args.inputfile) as f:
+        content = f.read()
+    extention = os.path.splitext(args.inputfile)[1][1:].lower()
+    settings = {
+        name: getattr(args, name)
+        for name in list(geometryDefaults) + ["rotate", "scale", "join"] + list(gcodeDefaults)
+    }
+
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        try:
+            lines = list(requestGCode(content, extention, args.host, args.port, **settings))
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+        if args.repeat > 1: print(f"{(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        print("\n".join(lines))
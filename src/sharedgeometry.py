@@ -0,0 +1,149 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Sequence
+import numpy as np
+from geometry import Arc, Circle, Geometry, GeometrySettigs, Line, Polygon, Polyline, Vector2D, packGeometries, transformGeometries, unpackGeometry
+import profiling
+
+# Kind codes, with the geometry unpackGeometry shapes the fixed size kinds like
+kinds: list[type] = [Vector2D, Line, Circle, Arc, Polygon, Polyline]
+prototypes: list[Geometry] = [Vector2D(0, 0), Line(Vector2D(0, 0), Vector2D(0, 0)), Circle(Vector2D(0, 0), 0), Arc(Vector2D(0, 0), 0, 0, 0)]
+polygonKind = kinds.index(Polygon)
+polylineKind = kinds.index(Polyline)
+
+def pointCount(g: Geometry) -> int:
+    """Number of points g takes once packed"""
+    return 1 if isinstance(g, Vector2D) else 2 if isinstance(g, (Line, Circle)) else 4 if isinstance(g, Arc) else len(g.points)
+
+@dataclass(frozen=True)
+class SharedGeometryHandle:
+    """What's pickled to hand a SharedGeometry to a worker"""
+    name: str
+    count: int
+    points: int
+
+class SharedGeometry:
+    """Geometries packed in a single shared memory block: a kind, a first point and a point count per geometry,
+    then the points laid out like packGeometries. Workers attach to it by name (read-only by default), so only the
+    handle goes through pickling. Allocated empty, it serves as an output segment that jobs fill in regions"""
+    memory: shared_memory.SharedMemory
+    count: int
+    points: int
+    kinds: np.ndarray
+    starts: np.ndarray
+    lengths: np.ndarray
+    coords: np.ndarray
+
+    def __init__(self, memory: shared_memory.SharedMemory, count: int, points: int, readonly: bool = False) -> None:
+        self.memory = memory
+        self.count = count
+        self.points = points
+
+        buffer = memory.buf
+        self.starts = np.ndarray((count,), dtype=np.int64, buffer=buffer, offset=0)
+        self.lengths = np.ndarray((count,), dtype=np.int64, buffer=buffer, offset=8 * count)
+        self.coords = np.ndarray((points, 2), dtype=np.float64, buffer=buffer, offset=16 * count)
+        self.kinds = np.ndarray((count,), dtype=np.int8, buffer=buffer, offset=16 * count + 16 * points)
+        if readonly:
+            for a in (self.starts, self.lengths, self.coords, self.kinds): a.flags.writeable = False
+
+    @staticmethod
+    def size(count: int, points: int) -> int:
+        return max(17 * count + 16 * points, 1)
+
+    @classmethod
+    def allocate(cls, count: int, points: int) -> SharedGeometry:
+        memory = shared_memory.SharedMemory(create=True, size=cls.size(count, points))
+        profiling.count("sharedBytes", memory.size)
+        return cls(memory, count, points)
+
+    @classmethod
+    def create(cls, geometries: Sequence[Geometry]) -> SharedGeometry:
+        """Packs geometries (as read from a file) in a new block"""
+        lengths = np.fromiter((pointCount(g) for g in geometries), dtype=np.int64, count=len(geometries))
+        shared = cls.allocate(len(geometries), int(lengths.sum()))
+        shared.lengths[:] = lengths
+        shared.starts[:] = np.cumsum(lengths) - lengths
+        shared.kinds[:] = [kinds.index(type(g)) for g in geometries]
+        if len(geometries): shared.coords[:] = packGeometries(geometries)
+        return shared
+
+    @classmethod
+    def attach(cls, handle: SharedGeometryHandle, readonly: bool = True) -> SharedGeometry:
+        try:
+            memory = shared_memory.SharedMemory(handle.name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the block again with the resource tracker, which workers share
+            # with the process that created the block, so it's only unlinked once
+            memory = shared_memory.SharedMemory(handle.name)
+        return cls(memory, handle.count, handle.points, readonly)
+
+    @property
+    def handle(self) -> SharedGeometryHandle:
+        return SharedGeometryHandle(self.memory.name, self.count, self.points)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> Geometry:
+        start, length = int(self.starts[i]), int(self.lengths[i])
+        coords = self.coords[start:start + length].tolist()
+        if self.kinds[i] == polygonKind: return Polygon([Vector2D(x, y) for x, y in coords])
+        if self.kinds[i] == polylineKind: return Polyline([Vector2D(x, y) for x, y in coords])
+        return unpackGeometry(prototypes[self.kinds[i]], iter(coords))
+
+    def geometries(self, indices: Sequence[int] | range | None = None) -> list[Geometry]:
+        return [self[i] for i in (range(self.count) if indices is None else indices)]
+
+    def write(self, region: SharedRegion, geometries: Sequence[Geometry]) -> bool:
+        """Packs geometries in region, returns False (writing nothing) if they don't fit"""
+        lengths = np.fromiter((pointCount(g) for g in geometries), dtype=np.int64, count=len(geometries))
+        if len(geometries) > region.count or lengths.sum() > region.points: return False
+
+        first, count = region.first, len(geometries)
+        self.lengths[first:first + count] = lengths
+        self.starts[first:first + count] = region.firstPoint + np.cumsum(lengths) - lengths
+        self.kinds[first:first + count] = [kinds.index(type(g)) for g in geometries]
+        if count: self.coords[region.firstPoint:region.firstPoint + int(lengths.sum())] = packGeometries(geometries)
+        return True
+
+    def close(self):
+        # Views must go before the buffer they're on can be released
+        del self.starts, self.lengths, self.coords, self.kinds
+        self.memory.close()
+
+    def unlink(self):
+        self.close()
+        self.memory.unlink()
+
+@dataclass(frozen=True)
+class SharedRegion:
+    """Slots of an output SharedGeometry given to one job: count geometries from first, and points from firstPoint"""
+    first: int
+    count: int
+    firstPoint: int
+    points: int
+
+# Blocks attached by a worker process, kept between jobs
+attached: dict[str, SharedGeometry] = {}
+
+def attachCached(handle: SharedGeometryHandle, readonly: bool = True) -> SharedGeometry:
+    if handle.name not in attached:
+        attached[handle.name] = SharedGeometry.attach(handle, readonly)
+    return attached[handle.name]
+
+def transformShared(
+    source: SharedGeometryHandle,
+    indices: Sequence[int],
+    settings: GeometrySettigs,
+    output: SharedGeometryHandle,
+    region: SharedRegion
+) -> int | list[Geometry]:
+    """Runs in a worker: transforms the source geometries at indices and writes them in region of the output block,
+    returns how many were written, or the geometries themselves in the rare case they don't fit"""
+    geometries = attachCached(source).geometries(indices)
+    transformed = transformGeometries(geometries, settings)
+
+    if attachCached(output, readonly=False).write(region, transformed): return len(transformed)
+    return list(transformed)
@@ -1,8 +1,7 @@
-from dataclasses import dataclass
 from typing import Sequence
-from geometry import  Geometry, Line, PixelMap,  Polygon, Vector2D, Vector2DWithIndex, getBounds, interpolateGeometry, nearZero_precise, sweepingLineIntersection
+from geometry import Geometry, Line, Polygon, Vector2D, getBounds, resampleGeometries, SparsePixelMap, voronoiCells, voronoiPixelMap
 from readers import extractGeometryDXF
-import graphics
+import graphics, progress
 
 polygons = [
     Polygon([
@@ -84,255 +83,23 @@ def noiseUp(points: list[Vector2D], amount: float) -> list[Vector2D]:
     ]
 
 def voronoi_insert(points: list[Vector2D], bounds: Polygon) -> list[Line]:
-    @dataclass
-    class VoronoiEdge:
-        line: Line
-        bisects: tuple[int, int]
-
-    bisectorLength = bounds.longestDiagonal() * 2
-
-    if len(points) < 2: return []
-    if len(points) == 2: return [createBisector(points[0], points[1], bisectorLength)] + bounds.breakAppart()
-
-    edges: list[VoronoiEdge] = [VoronoiEdge(
-        createBisector(points[0], points[1], bisectorLength),
-        (0, 1)
-    )]
-    sites: list[Vector2D] = points[:2]
-    iter_img = 0
-
-    def snip_1inter(intersection: Vector2DWithIndex):
-        newEdge.trim(
-            intersection.point,
-            [e.line for e in otherPointEdges],
-            points[otherPoint]
-        )
-        edges[intersection.index].line.trim(
-            intersection.point,
-            [newEdge],
-            points[otherPoint]
-        )
-
-    def snip_2inter(intersections: list[Vector2DWithIndex]):
-        newEdge.start = intersections[0].point
-        newEdge.end = intersections[1].point
-
-        if intersections[0].index >= 0:
-            edges[intersections[0].index].line.trim(
-                intersections[0].point,
-                [newEdge],
-                points[otherPoint]
-            )
-        if intersections[1].index >= 0:
-            edges[intersections[1].index].line.trim(
-                intersections[1].point,
-                [newEdge],
-                points[otherPoint]
-            )
-
-    for i, p in enumerate(points):
-        if i < 2: continue
-
-        otherPoint = min(range(len(sites)), key=lambda idx: sites[idx].distanceTo(p))
-        sites.append(p)
-
-        exploredSites: set[int] = {i}
-        intersectedSites: set[int] = set()
-        unexploredSites: set[int] = set()
-        print(i, len(points))
-
-        while True:
-            newEdge = createBisector(points[otherPoint], p, bisectorLength)
-            otherPointEdges = [e for e in edges if otherPoint in e.bisects]
-            # verticies = set([e.line.start for e in otherPointEdges] + [e.line.end for e in otherPointEdges])
-            
-            intersections = [
-                Vector2DWithIndex(inter, idx)
-                for idx, edge in enumerate(edges)
-                if (otherPoint in edge.bisects) and (inter := edge.line.intersects(newEdge))
-            ]
-            # print()
-            print(len(intersections))
-
-            graphics.clear()
-            graphics.plotGeometries(sites, color="white")
-            graphics.plotGeometries([e.line for e in edges], color="red")
-            graphics.plotGeometries([inter.point for inter in intersections], color="yellow")
-            graphics.plotGeometries([newEdge], color="orange")
-            graphics.plotGeometries([e.line for e in otherPointEdges], color="green")
-            graphics.plotGeometries([p], color="orange")
-            graphics.plotGeometries([points[otherPoint]], color="lime")
-            # graphics.plt.savefig(f"debug/{iter_img}_{i}_a_inter.svg")
-            graphics.pause()
-
-            if not intersections:
-                if not unexploredSites: break
-                otherPoint = unexploredSites.pop()
-                continue
-            if len(intersections) == 1:
-                snip_1inter(intersections[0])
-            else:
-                if nearZero_precise((intersections[0].point - intersections[1].point).modulus()):
-                    snip_1inter(intersections[0])
-                else:
-                    snip_2inter(intersections)
-
-            edges.append(VoronoiEdge(newEdge, (i, otherPoint)))
-            exploredSites.add(otherPoint)
-
-            for b in [ b for inter in intersections if inter.index >= 0 for b in edges[inter.index].bisects ]:
-                intersectedSites.add(b)
-
-            newEdgeMid = (newEdge.end + newEdge.start) / 2
-            projectionVector = newEdge.vector()
-            projectionVector /= projectionVector.modulus()
-            projectionVector = Vector2D(-projectionVector.y, projectionVector.x)
-            if projectionVector.dot(p - newEdgeMid) > 0:
-                projectionVector *= -1
-
-            graphics.clear()
-            graphics.plotGeometries(sites, color="white")
-            graphics.plotGeometries([e.line for e in edges], color="red")
-            graphics.plotGeometries([newEdge], color="orange")
-            graphics.plotGeometries([p], color="orange")
-            graphics.plotGeometries([points[otherPoint]], color="lime")
-            graphics.plotGeometries([e.line for e in otherPointEdges], color="green")
-            graphics.plotGeometries([Line(newEdgeMid, newEdgeMid+projectionVector*0.2)], color="cyan")
-
-            for e in otherPointEdges:
-                if  projectionVector.dot(e.line.start - newEdgeMid) < 0 and\
-                    projectionVector.dot(e.line.end - newEdgeMid) < 0:
-                    edges.remove(e)
-                    intersectedSites.add(e.bisects[0])
-                    intersectedSites.add(e.bisects[1])
-                    graphics.plotGeometries([e.line], color="pink")
-
-            # graphics.plt.savefig(f"debug/{iter_img}_{i}_b_cull.svg")
-            graphics.pause()
-            iter_img += 1
-
-            unexploredSites = intersectedSites - exploredSites
-            if not unexploredSites: break
-            otherPoint = unexploredSites.pop()
-
-        graphics.clear()
-        graphics.plotGeometries(sites, color="white")
-        graphics.plotGeometries([e.line for e in edges], color="red")
-        print("Site Done")
-        graphics.pause()
-
-
-    boundsCenter = sum(bounds.points) / len(bounds.points)
-    if not isinstance(boundsCenter, Vector2D):
-        boundsCenter = Vector2D(0,0)
-    boundEdges = bounds.breakAppart()
-
-    boundIntersections = sweepingLineIntersection([e.line for e in edges] + boundEdges)
-    for inter in boundIntersections:
-        edgeIndex = min(inter.between)
-        if edges[edgeIndex].line.start.distanceTo(boundsCenter) > edges[edgeIndex].line.end.distanceTo(boundsCenter):
-            edges[edgeIndex].line.start = inter.point
-        else:
-            edges[edgeIndex].line.end = inter.point
-
-    return [e.line for e in edges] + boundEdges
-    
-def voronoi_raster(geometries: Sequence[Geometry], precision: int = 200) -> PixelMap:
-    from random import random, shuffle
+    return [l for cell in voronoiCells(points, bounds) if cell.points for l in cell.breakAppart()]
 
+def voronoi_raster(geometries: Sequence[Geometry], precision: int = 200) -> SparsePixelMap:
     boundsBL, boundsTR = getBounds(geometries, 1)
-    pixmap = PixelMap(boundsBL, boundsTR, precision)
-
-    cornerPopulationChance = 0.3
-    edgePopulationChance = 0.8
-
-    pixelsToCalculate: set[int] = set()
-    points: list[Vector2DWithIndex] = [
-        Vector2DWithIndex(p, i)
-        for i, g in enumerate(geometries)
-        for p in interpolateGeometry(g, (boundsTR - boundsBL).modulus() / precision)
-    ]
-    print(len(points))
-
-    for pi in points:
-        pixmap[pi.point] = pi.index + 1
-        pixelsToCalculate.add(pixmap.vectorToIndex(pi.point))
-
-    while True:
-        operations: list[tuple[int, int]] = []
-
-        for i in pixelsToCalculate:
-
-            x, y = pixmap.indexToCoords(i)
-            pixelSurrounded = 0
-
-            if x > 0 and not pixmap[x-1, y]:
-                if random() < edgePopulationChance:
-                    operations.append((pixmap.coordsToIndex(x-1, y), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if x < pixmap.xlen-1 and not pixmap[x+1, y]:
-                if random() < edgePopulationChance:
-                    operations.append((pixmap.coordsToIndex(x+1, y), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if y > 0 and not pixmap[x, y-1]:
-                if random() < edgePopulationChance:
-                    operations.append((pixmap.coordsToIndex(x, y-1), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if y < pixmap.ylen-1 and not pixmap[x, y+1]:
-                if random() < edgePopulationChance:
-                    operations.append((pixmap.coordsToIndex(x, y+1), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if x > 0 and y > 0 and not pixmap[x-1, y-1]:
-                if random() < cornerPopulationChance:
-                    operations.append((pixmap.coordsToIndex(x-1, y-1), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if x > 0 and y < pixmap.ylen-1 and not pixmap[x-1, y+1]:
-                if random() < cornerPopulationChance:
-                    operations.append((pixmap.coordsToIndex(x-1, y+1), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if x < pixmap.xlen-1 and y > 0 and not pixmap[x+1, y-1]:
-                if random() < cornerPopulationChance:
-                    operations.append((pixmap.coordsToIndex(x+1, y-1), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if x < pixmap.xlen-1 and y < pixmap.ylen-1 and not pixmap[x+1, y+1]:
-                if random() < cornerPopulationChance:
-                    operations.append((pixmap.coordsToIndex(x+1, y+1), pixmap[i]))
-            else: pixelSurrounded += 1
-
-            if pixelSurrounded >= 8:
-                operations.append((i, 0))
-
-
-        shuffle(operations)
-        for i, v in operations:
-            if v:
-                pixmap[i] = v
-                pixelsToCalculate.add(i)
-            else:
-                pixelsToCalculate.remove(i)
-
-        print(len(pixelsToCalculate))
-
-        if not pixelsToCalculate: break
+    coords, sources = resampleGeometries(geometries, (boundsTR - boundsBL).modulus() / precision)
 
-    for i, _ in enumerate(pixmap):
-        pixmap[i] -= 1
+    pixmap = voronoiPixelMap(coords, sources, boundsBL, boundsTR, precision)
 
     # graphics.clear()
     # graphics.plotPixelmap(pixmap)
-    # graphics.plotGeometries([p.point for p in points], color="black")
+    # graphics.plotGeometries([Vector2D(x, y) for x, y in coords.tolist()], color="black")
     # graphics.pause()
 
     return pixmap
 
 
+progress.listeners.append(progress.ProgressBar())
 graphics.plt.ion()
 graphics.plt.show()
 graphics.xlim = (boundsBottomLeft.x, boundsTopRight.x)
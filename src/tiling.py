@@ -0,0 +1,107 @@
+from __future__ import annotations
+from collections import deque
+from dataclasses import dataclass, field
+from math import floor
+from typing import Iterator, Sequence
+from geometry import Geometry, GeometrySettigs, Vector2D, getBounds, transformGeometries
+from cache import InflateCache
+import profiling, progress
+
+@dataclass
+class Tile:
+    column: int
+    row: int
+    boundsMin: Vector2D
+    boundsMax: Vector2D
+    # Each geometry is owned by exactly one tile, and inflated on its own, so tiles don't need to overlap
+    geometries: list[Geometry] = field(default_factory=lambda: [])
+
+def geometryBounds(g: Geometry) -> tuple[Vector2D, Vector2D]:
+    if isinstance(g, Vector2D): return g, g
+    return getBounds([g])
+
+def tileGeometries(geometries: Sequence[Geometry], tileSize: float) -> list[Tile]:
+    """Partitions geometries in square tiles, a geometry is owned by the tile holding its bottom left corner.
+    Tiles are returned in a serpentine order, empty tiles are skipped"""
+    boardMin, _ = getBounds(geometries)
+    tiles: dict[tuple[int, int], Tile] = {}
+
+    def tile(column: int, row: int) -> Tile:
+        if (column, row) not in tiles:
+            tiles[column, row] = Tile(
+                column, row,
+                Vector2D(boardMin.x + column * tileSize, boardMin.y + row * tileSize),
+                Vector2D(boardMin.x + (column + 1) * tileSize, boardMin.y + (row + 1) * tileSize)
+            )
+        return tiles[column, row]
+
+    for g in geometries:
+        bl, _ = geometryBounds(g)
+        owner = (floor((bl.x - boardMin.x) / tileSize), floor((bl.y - boardMin.y) / tileSize))
+        tile(*owner).geometries.append(g)
+
+    return sorted(
+        (t for t in tiles.values() if t.geometries),
+        key=lambda t: (t.row, t.column if t.row % 2 == 0 else -t.column)
+    )
+
+def processTiled(
+    geometries: Sequence[Geometry],
+    settings: GeometrySettigs,
+    tileSize: float,
+    workers: int = 1,
+    cache: InflateCache | None = None
+) -> Iterator[Sequence[Geometry]]:
+    """Yields the transformed geometries tile by tile, so that only a few tiles worth of results are alive at once.
+    With more than one worker, tiles are processed in parallel processes (without the cache)"""
+    tiles = tileGeometries(geometries, tileSize)
+
+    if workers <= 1:
+        with progress.task("tiles", len(tiles)) as task:
+            for t in tiles:
+                yield transformGeometries(t.geometries, settings, cache)
+                task.advance()
+        return
+
+    if not tiles: return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from sharedgeometry import SharedGeometry, SharedRegion, pointCount, transformShared
+
+    # Workers read the board from shared memory and write their results in one of 2 * workers regions of the
+    # output block, so only indices go through pickling. Regions are sized for the largest tile, inflating a
+    # polygon can grow it, mostly by the joins of its corners
+    index = {id(g): i for i, g in enumerate(geometries)}
+    source = SharedGeometry.create(geometries)
+    estimates = [sum(2 * pointCount(g) + 64 for g in t.geometries) for t in tiles]
+    slots = 2 * workers
+    regionCount, regionPoints = max(len(t.geometries) for t in tiles), max(estimates)
+    output = SharedGeometry.allocate(slots * regionCount, slots * regionPoints)
+    regions = [SharedRegion(i * regionCount, regionCount, i * regionPoints, regionPoints) for i in range(slots)]
+
+    def collect(region: SharedRegion, written: int | list[Geometry]) -> Sequence[Geometry]:
+        if isinstance(written, list):
+            profiling.count("sharedOverflows")
+            return written
+        return output.geometries(range(region.first, region.first + written))
+
+    try:
+        with ProcessPoolExecutor(workers) as executor, progress.task("tiles", len(tiles)) as task:
+            pending = deque()
+            for i, t in enumerate(tiles):
+                # Bounding the number of tiles in flight keeps memory proportional to the tile size
+                if len(pending) >= slots:
+                    region, future = pending.popleft()
+                    yield collect(region, future.result())
+                    task.advance()
+                region = regions[i % slots]
+                indices = [index[id(g)] for g in t.geometries]
+                pending.append((region, executor.submit(transformShared, source.handle, indices, settings, output.handle, region)))
+
+            while pending:
+                region, future = pending.popleft()
+                yield collect(region, future.result())
+                task.advance()
+    finally:
+        source.unlink()
+        output.unlink()
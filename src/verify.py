@@ -0,0 +1,299 @@
+from __future__ import annotations
+import argparse, os, sys, time
+from dataclasses import dataclass, replace
+from math import ceil, floor, sqrt
+from typing import Iterable, Sequence
+import numpy as np
+from gcode import Move, PanelSettings, panelOrder, parseToolpath
+from geometry import (
+    Arc, Circle, Geometry, GeometrySettigs, Line, Polygon, Vector2D, closedPolyline, packGeometries, packPolylines, transformGeometries,
+    unpackGeometries
+)
+import profiling
+
+class Raster:
+    """Boolean pixel buffer over a rectangle, the numpy counterpart of PixelMap: pixel (x, y) is map[y, x]
+    and covers origin + (x, y) * quantum to origin + (x + 1, y + 1) * quantum"""
+    origin: Vector2D
+    quantum: float
+    xlen: int
+    ylen: int
+    map: np.ndarray
+
+    def __init__(self, boundBottomLeft: Vector2D, boundTopRight: Vector2D, quantum: float) -> None:
+        self.origin = boundBottomLeft
+        self.quantum = quantum
+        self.xlen = max(ceil((boundTopRight.x - boundBottomLeft.x) / quantum), 1)
+        self.ylen = max(ceil((boundTopRight.y - boundBottomLeft.y) / quantum), 1)
+        self.map = np.zeros((self.ylen, self.xlen), dtype=bool)
+
+    def toPixels(self, coords: np.ndarray) -> np.ndarray:
+        """Continuous pixel coordinates of (n, 2) coordinates, pixel centers are at half integers"""
+        return (coords - (self.origin.x, self.origin.y)) / self.quantum
+
+    def vectorToIndex(self, point: Vector2D) -> tuple[int, int]:
+        return floor((point.x - self.origin.x) / self.quantum), floor((point.y - self.origin.y) / self.quantum)
+
+    def indexToVector(self, x: float, y: float) -> Vector2D:
+        """Center of pixel (x, y)"""
+        return Vector2D(self.origin.x + (x + 0.5) * self.quantum, self.origin.y + (y + 0.5) * self.quantum)
+
+    def fillPolygons(self, coords: np.ndarray, offsets: np.ndarray):
+        """Sets the pixels whose center is inside the packed closed polylines (nonzero winding, like windingNumbers).
+        Every edge adds its direction to the first pixel right of where it crosses each row, a cumulative sum
+        along the rows then gives the winding number of every pixel"""
+        pixels = self.toPixels(coords)
+        last = np.zeros(len(coords), dtype=bool)
+        last[offsets[1:] - 1] = True
+        starts, ends = pixels[:-1][~last[:-1]], pixels[1:][~last[:-1]]
+
+        # Rows whose center (j + 0.5) lies in [min(y0, y1), max(y0, y1))
+        low, high = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+        first = np.clip(np.ceil(low - 0.5), 0, self.ylen).astype(np.int64)
+        stop = np.clip(np.ceil(high - 0.5), 0, self.ylen).astype(np.int64)
+        counts = stop - first
+        edges = np.repeat(np.arange(len(starts)), counts)
+        rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + first[edges]
+
+        (x0, y0), (x1, y1) = starts[edges].T, ends[edges].T
+        crossing = x0 + (rows + 0.5 - y0) / (y1 - y0) * (x1 - x0)
+        columns = np.clip(np.ceil(crossing - 0.5), 0, self.xlen).astype(np.int64)
+        direction = np.where(y1 > y0, 1, -1)
+
+        windings = np.zeros((self.ylen, self.xlen + 1), dtype=np.int32)
+        np.add.at(windings, (rows, columns), direction)
+        self.map |= np.cumsum(windings, axis=1)[:, :-1] != 0
+
+    def drawSegments(self, starts: np.ndarray, ends: np.ndarray):
+        """Sets the pixels along the (n, 2) segments, every segment being sampled at least twice per pixel"""
+        a, b = self.toPixels(starts), self.toPixels(ends)
+        samples = np.ceil(np.linalg.norm(b - a, axis=1) * 2).astype(np.int64) + 1
+        segments = np.repeat(np.arange(len(a)), samples)
+        t = (np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)) / np.repeat(np.maximum(samples - 1, 1), samples)
+        points = a[segments] + (b - a)[segments] * t[:, None]
+
+        xs, ys = np.floor(points[:, 0]).astype(np.int64), np.floor(points[:, 1]).astype(np.int64)
+        inside = (xs >= 0) & (xs < self.xlen) & (ys >= 0) & (ys < self.ylen)
+        self.map[ys[inside], xs[inside]] = True
+
+    def dilated(self, radius: float) -> np.ndarray:
+        """Pixels whose center is within radius (in pixels) of a set pixel center. The disk is split in rows, each a
+        horizontal run dilated with a cumulative sum, so the cost is a few passes per row of the disk"""
+        r = int(floor(radius))
+        result = np.zeros_like(self.map)
+        counts = np.zeros((self.ylen, self.xlen + 1), dtype=np.int32)
+        np.cumsum(self.map, axis=1, out=counts[:, 1:])
+        runs: dict[int, np.ndarray] = {}
+
+        for dy in range(-r, r + 1):
+            w = int(floor(sqrt(radius * radius - dy * dy)))
+            if w not in runs:
+                right = np.minimum(np.arange(self.xlen) + w + 1, self.xlen)
+                left = np.maximum(np.arange(self.xlen) - w, 0)
+                runs[w] = counts[:, right] > counts[:, left]
+            run = runs[w]
+            if dy >= 0: result[dy:] |= run[:self.ylen - dy]
+            else: result[:dy] |= run[-dy:]
+
+        return result
+
+@dataclass
+class Violation:
+    # Center of the gouged copper, and its area in square units
+    position: Vector2D
+    area: float
+
+@dataclass
+class VerificationResult:
+    violations: list[Violation]
+    gougedArea: float
+    # Windows of the board rasterized, out of all the windows of the path bounds
+    windows: int = 0
+    totalWindows: int = 0
+
+def packClosed(geometries: Sequence[Geometry]) -> tuple[np.ndarray, np.ndarray]:
+    closed = [closedPolyline(g) for g in geometries if isinstance(g, Circle) or isinstance(g, Polygon) and len(g.points) > 2]
+    return packPolylines(closed)
+
+def packSegments(geometries: Sequence[Geometry]) -> tuple[np.ndarray, np.ndarray]:
+    """Starts and ends of the segments of lines and arcs, which have no area and are drawn as thin traces"""
+    paths = [[g.start, g.end] if isinstance(g, Line) else g.flatten() for g in geometries if isinstance(g, (Line, Arc))]
+    coords, offsets = packPolylines(paths)
+    last = np.zeros(len(coords), dtype=bool)
+    last[offsets[1:] - 1] = True
+    return coords[:-1][~last[:-1]], coords[1:][~last[:-1]]
+
+def copperRaster(geometries: Sequence[Geometry], boundBottomLeft: Vector2D, boundTopRight: Vector2D, quantum: float) -> Raster:
+    raster = Raster(boundBottomLeft, boundTopRight, quantum)
+    coords, offsets = packClosed(geometries)
+    if len(offsets) > 1: raster.fillPolygons(coords, offsets)
+    starts, ends = packSegments(geometries)
+    if len(starts): raster.drawSegments(starts, ends)
+    return raster
+
+def cellSums(xs: np.ndarray, ys: np.ndarray, size: int) -> np.ndarray:
+    """Gouged pixels summed per square cell of size pixels, as (cell, pixels, sum of x, sum of y) rows"""
+    unique, inverse, counts = np.unique((ys // size) * (1 << 32) + xs // size, return_inverse=True, return_counts=True)
+    return np.column_stack((
+        unique, counts,
+        np.bincount(inverse, weights=xs, minlength=len(unique)),
+        np.bincount(inverse, weights=ys, minlength=len(unique))
+    ))
+
+def groupViolations(sums: np.ndarray, origin: Vector2D, quantum: float) -> list[Violation]:
+    """One violation per cell at the center of its gouged pixels, merging the sums of cells split between windows"""
+    if not len(sums): return []
+
+    unique, inverse = np.unique(sums[:, 0], return_inverse=True)
+    counts, sumX, sumY = (np.bincount(inverse, weights=sums[:, k], minlength=len(unique)) for k in (1, 2, 3))
+
+    order = np.argsort(-counts, kind="stable")
+    return [
+        Violation(
+            Vector2D(origin.x + (sumX[i] / counts[i] + 0.5) * quantum, origin.y + (sumY[i] / counts[i] + 0.5) * quantum),
+            float(counts[i]) * quantum ** 2
+        )
+        for i in order.tolist()
+    ]
+
+def overlapping(low: np.ndarray, high: np.ndarray, windowLow: np.ndarray, windowHigh: np.ndarray) -> np.ndarray:
+    """Mask of the (n, 2) boxes overlapping the window"""
+    return ((high >= windowLow) & (low <= windowHigh)).all(axis=1)
+
+def verifyToolpath(
+    moves: Iterable[Move],
+    copper: Sequence[Geometry],
+    toolRadius: float,
+    resolution: float | None = None,
+    tolerance: float | None = None,
+    windowSize: int = 1024
+) -> VerificationResult:
+    """Checks that the cutting moves keep the tool (of toolRadius) off the copper geometries, which must be in the
+    G-code coordinates. The swept area is the centerline dilated by toolRadius - tolerance, tolerance absorbing the
+    rasterization error (a pixel by default, pixels being an eighth of the radius unless resolution is given).
+    The path bounds are rasterized in windows of windowSize pixels, skipping those the path doesn't go through,
+    so memory stays proportional to a window and time to the area near the path"""
+    quantum = resolution or toolRadius / 8
+    tolerance = quantum if tolerance is None else tolerance
+    radius = max(toolRadius - tolerance, 0) / quantum
+
+    with profiling.stage("verify"):
+        cuts = [m for m in moves if not m.rapid]
+        starts = np.array([(m.start.x, m.start.y) for m in cuts]).reshape(-1, 2)
+        ends = np.array([(m.end.x, m.end.y) for m in cuts]).reshape(-1, 2)
+        profiling.count("verifiedMoves", len(cuts))
+        if not len(cuts): return VerificationResult([], 0)
+
+        low = np.minimum(starts.min(axis=0), ends.min(axis=0)) - toolRadius - quantum
+        high = np.maximum(starts.max(axis=0), ends.max(axis=0)) + toolRadius + quantum
+        origin = Vector2D(*low.tolist())
+        columns, rows = np.ceil((high - low) / quantum / windowSize).astype(int).tolist()
+
+        # Windows are grown by a margin for the dilation, only their inner part is checked
+        margin = ceil(radius) + 2
+        segmentLow, segmentHigh = np.minimum(starts, ends), np.maximum(starts, ends)
+        closedCoords, closedOffsets = packClosed(copper)
+        lengths = np.diff(closedOffsets)
+        closedLow = np.minimum.reduceat(closedCoords, closedOffsets[:-1], axis=0) if len(lengths) else np.zeros((0, 2))
+        closedHigh = np.maximum.reduceat(closedCoords, closedOffsets[:-1], axis=0) if len(lengths) else np.zeros((0, 2))
+        owners = np.repeat(np.arange(len(lengths)), lengths)
+        traceStarts, traceEnds = packSegments(copper)
+
+        # Gouged pixels are reported in cells about the tool diameter wide
+        cellSize = max(int(toolRadius * 2 / quantum), 1)
+        sums: list[np.ndarray] = []
+        gougedPixels = 0
+        windows = 0
+        for row in range(rows):
+            for column in range(columns):
+                x0, y0 = column * windowSize - margin, row * windowSize - margin
+                windowLow = low + np.array([x0, y0]) * quantum
+                windowHigh = windowLow + (windowSize + 2 * margin) * quantum
+
+                cutting = overlapping(segmentLow, segmentHigh, windowLow, windowHigh)
+                if not cutting.any(): continue
+                windows += 1
+
+                boundBottomLeft, boundTopRight = Vector2D(*windowLow.tolist()), Vector2D(*windowHigh.tolist())
+                copperMap = Raster(boundBottomLeft, boundTopRight, quantum)
+                polygons = overlapping(closedLow, closedHigh, windowLow, windowHigh)
+                if polygons.any():
+                    copperMap.fillPolygons(closedCoords[polygons[owners]], np.concatenate(([0], np.cumsum(lengths[polygons]))))
+                traces = overlapping(np.minimum(traceStarts, traceEnds), np.maximum(traceStarts, traceEnds), windowLow, windowHigh)
+                if traces.any(): copperMap.drawSegments(traceStarts[traces], traceEnds[traces])
+                if not copperMap.map.any(): continue
+
+                centerline = Raster(boundBottomLeft, boundTopRight, quantum)
+                centerline.drawSegments(starts[cutting], ends[cutting])
+                gouged = (centerline.dilated(radius) & copperMap.map)[margin:margin + windowSize, margin:margin + windowSize]
+
+                ys, xs = np.nonzero(gouged)
+                if len(xs): sums.append(cellSums(xs + x0 + margin, ys + y0 + margin, cellSize))
+                gougedPixels += len(xs)
+
+        profiling.count("verifiedWindows", windows)
+        profiling.count("gougedPixels", gougedPixels)
+
+        return VerificationResult(
+            groupViolations(np.concatenate(sums) if sums else np.zeros((0, 4)), origin, quantum),
+            gougedPixels * quantum ** 2,
+            windows,
+            rows * columns
+        )
+
+def verifyGCode(gcode: Iterable[str], originalGeometries: Sequence[Geometry], settings: GeometrySettigs, toolRadius: float, resolution: float | None = None, panel: PanelSettings | None = None) -> VerificationResult:
+    """verifyToolpath with the copper of a file, moved like the G-code was (without inflating it), and repeated
+    like every copy of the panel when the G-code is panelized"""
+    copper = transformGeometries(originalGeometries, replace(settings, inflate=None))
+    if panel:
+        coords = packGeometries(copper)
+        copper = [
+            g
+            for column, row, _ in panelOrder(panel)
+            for g in unpackGeometries(copper, coords + np.array([column * panel.pitch_x, row * panel.pitch_y]))
+        ]
+    return verifyToolpath(parseToolpath(gcode), copper, toolRadius, resolution)
+
+def reportViolations(path: str, result: VerificationResult, limit: int = 20):
+    if not result.violations:
+        print(f"{path}: no violations", file=sys.stderr)
+        return
+
+    print(f"{path}: {len(result.violations)} violation(s), {result.gougedArea:.4f} square units of gouged copper", file=sys.stderr)
+    for v in result.violations[:limit]:
+        print(f"  X{v.position.x:.3f} Y{v.position.y:.3f}: {v.area:.4f}", file=sys.stderr)
+    if len(result.violations) > limit:
+        print(f"  ... and {len(result.violations) - limit} more", file=sys.stderr)
+
+if __name__ == "__main__":
+    from readers import extractors
+
+    parser = argparse.ArgumentParser(
+        prog="PCB Engraving Tool Verifier",
+        description="Checks that a G-code file never brings the tool closer than its radius to the copper of the DXF file"
+    )
+    parser.add_argument("inputfile", type=str, help="DXF file the G-code was made from")
+    parser.add_argument("gcodefile", type=str)
+    parser.add_argument("-r", "--radius", type=float, required=True, help="Tool radius")
+    parser.add_argument("--resolution", type=float, help="Pixel size, defaults to an eighth of the radius")
+    parser.add_argument("--offset-x", type=float)
+    parser.add_argument("--offset-y", type=float)
+    parser.add_argument("--mirror-x", action="store_true")
+    parser.add_argument("--mirror-y", action="store_true")
+    parser.add_argument("--rotate", type=float)
+    parser.add_argument("--scale", type=float)
+    args = parser.parse_args()
+
+    settings = GeometrySettigs(
+        tolerance=0.05, inflate=None, mirror_x=args.mirror_x, mirror_y=args.mirror_y,
+        offset_x=args.offset_x, offset_y=args.offset_y, rotate=args.rotate, scale=args.scale
+    )
+    with open(args.inputfile) as f:
+        files = extractors[os.path.splitext(args.inputfile)[1][1:].lower()](f, args.gcodefile, settings.tolerance)
+
+    start = time.perf_counter()
+    with open(args.gcodefile) as f:
+        result = verifyGCode(f, [g for file in files for g in file.originalGeometries], settings, args.radius, args.resolution)
+    print(f"Verified in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    reportViolations(args.gcodefile, result)
+    exit(1 if result.violations else 0)
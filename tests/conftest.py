@@ -0,0 +1,4 @@
+import os, sys
+
+# The modules live flat in src/, like when running the tools from there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,18 @@
+from cache import InflateCache
+from geometry import Polygon, Vector2D
+
+square = Polygon([Vector2D(0, 0), Vector2D(1, 0), Vector2D(1, 1), Vector2D(0, 1)])
+
+def test_least_recently_used_entries_are_dropped():
+    cache = InflateCache(maxEntries=2)
+    cache.put("a", square)
+    cache.put("b", square)
+    assert cache.get("a") is not None
+    cache.put("c", square)
+    assert set(cache.entries) == {"a", "c"}
+    assert cache.get("b") is None
+
+def test_unbounded_by_default():
+    cache = InflateCache()
+    for i in range(100): cache.put(str(i), square)
+    assert len(cache.entries) == 100
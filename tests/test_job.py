@@ -0,0 +1,17 @@
+import pytest
+from job import pocketSettingsFrom
+
+def clearingOptions(**options) -> dict:
+    return {
+        "clear": True, "clear_tool_radius": 0.5, "tool_radius": None, "inflate": None,
+        "clear_stepover": None, "clear_strategy": "contour", "clear_margin": 1
+    } | options
+
+def test_stepover_defaults_to_the_tool_radius():
+    assert pocketSettingsFrom(clearingOptions()).stepover == 0.5
+
+def test_stepover_up_to_the_tool_diameter():
+    assert pocketSettingsFrom(clearingOptions(clear_stepover=1)).stepover == 1
+    for stepover in (1.01, -0.1):
+        with pytest.raises(ValueError, match="stepover"):
+            pocketSettingsFrom(clearingOptions(clear_stepover=stepover))
@@ -0,0 +1,40 @@
+import io, threading
+from http.server import ThreadingHTTPServer
+import ezdxf, pytest
+import service
+from gcode import GCodeSettings
+from geometry import GeometrySettigs
+
+def squaresDXF(count: int) -> str:
+    document = ezdxf.new()
+    for i in range(count):
+        document.modelspace().add_lwpolyline([(i * 10, 0), (i * 10 + 5, 0), (i * 10 + 5, 5), (i * 10, 5)], close=True)
+    stream = io.StringIO()
+    document.write(stream)
+    return stream.getvalue()
+
+def test_worker_cache_stays_under_its_cap():
+    service.warmWorker(maxEntries=8)
+    content = squaresDXF(3)
+    gcodeSettings = service.parseSettings(GCodeSettings, service.gcodeDefaults, {})
+    for i in range(20):
+        geometrySettings = service.parseSettings(GeometrySettigs, service.geometryDefaults, {"inflate": str(0.1 + i / 100)})
+        service.convert(content, "dxf", geometrySettings, gcodeSettings)
+        assert len(service.workerCache.entries) <= 8
+
+def test_unknown_join_styles_are_rejected():
+    for join in ("miter", "round", "square", "bevel"):
+        assert service.parseSettings(GeometrySettigs, service.geometryDefaults, {"join": join}).join == join
+    with pytest.raises(ValueError):
+        service.parseSettings(GeometrySettigs, service.geometryDefaults, {"join": "foo"})
+
+def test_unknown_join_style_answers_400():
+    handler = type("Handler", (service.ConversionHandler,), {"executor": None})
+    with ThreadingHTTPServer(("127.0.0.1", 0), handler) as server:
+        server.verbose = False
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with pytest.raises(Exception, match="join must be one of"):
+                list(service.requestGCode(squaresDXF(1), "dxf", port=server.server_port, join="foo"))
+        finally:
+            server.shutdown()
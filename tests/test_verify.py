@@ -0,0 +1,22 @@
+from gcode import GCodeSettings, PanelSettings, generatePanelGCode
+from geometry import GeometrySettigs, Polygon, Vector2D, transformGeometries
+from verify import verifyGCode
+
+square = Polygon([Vector2D(0, 0), Vector2D(1, 0), Vector2D(1, 1), Vector2D(0, 1)])
+settings = GeometrySettigs(inflate=0.2, mirror_x=False, mirror_y=False, offset_x=None, offset_y=None, tolerance=0.01)
+gcodeSettings = GCodeSettings(depth=0.1, feed=400, plunge=70, rapid=5, safe=1, spindle=5000)
+
+def panelGCode(pitch: float) -> tuple[list[str], PanelSettings]:
+    panel = PanelSettings(columns=2, rows=1, pitch_x=pitch, pitch_y=0)
+    return generatePanelGCode(transformGeometries([square], settings), gcodeSettings, panel).splitlines(), panel
+
+def test_copies_far_apart_are_clear():
+    gcode, panel = panelGCode(2)
+    assert not verifyGCode(gcode, [square], settings, 0.2, panel=panel).violations
+
+def test_every_copy_of_the_panel_is_checked():
+    # The first copy is isolated through the copper of the second one, which starts at x = 1.1
+    gcode, panel = panelGCode(1.1)
+    result = verifyGCode(gcode, [square], settings, 0.2, panel=panel)
+    assert any(v.position.x > 1.1 for v in result.violations)
+    assert not any(v.position.x > 1.1 for v in verifyGCode(gcode, [square], settings, 0.2).violations)